@@ -45,7 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    'timetable'
+    'timetable.apps.TimetablingAppConfig',  # its ready() connects the signals that keep statistics up to date
 ]
 
 MIDDLEWARE = [
@@ -90,6 +90,19 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/#database-caching
+# Stores the progress of scheduling jobs, so it must be shared by the web server and the Celery workers (see
+# timetable/jobs.py). Create its table with: python manage.py createcachetable
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'timetable_cache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -135,3 +148,7 @@ STATIC_URL = '/static/'
 
 LOGIN_URL = '/login'
 LOGIN_REDIRECT_URL = '/'
+
+# Where the scheduler saves the best timetables of each run, so the next run can start from them
+# (see timetable/checkpoints.py). This directory is not under version control
+TIMETABLE_CHECKPOINT_DIR = os.path.join(BASE_DIR, 'checkpoints')
@@ -2,4 +2,8 @@ from django.apps import AppConfig
 
 
 class TimetablingAppConfig(AppConfig):
+    default = True  # also used when INSTALLED_APPS only names 'timetable', so the signals are always connected
     name = 'timetable'
+
+    def ready(self):
+        from . import signals  # connects the signal receivers
@@ -0,0 +1,203 @@
+"""Evaluates the cost function for many timetables at once using NumPy, rather than one timetable at a time
+
+For each day, every (timetable, user, lesson) triple in a batch is put in one array, and the time each user is busy
+is found from the union of their lessons' intervals. This is the sparse equivalent of a (timetables x users x time
+units) occupancy array, which would mostly be empty, as each user only has a few lessons a day. Every part of the cost
+function that depends on users (clashes, workload, early finish and average lesson time) is then found with array
+operations over the whole batch. Batches are split into chunks so that the arrays never take up much more than
+max_bytes.
+
+The results are the same as Timetable.get_cost, apart from floating point rounding. NumPy is only needed if this is
+used (see Population's batch_evaluation argument)"""
+
+from typing import Dict, List, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for batch evaluation
+    np = None
+
+from .genome import UNSCHEDULED
+from .participants import STUDENT, TEACHER
+
+
+class BatchEvaluator:
+    """Evaluates timetables that share a catalogue and settings, e.g. every timetable in a population"""
+
+    def __init__(self, template, max_bytes: int = 64 * 1024 * 1024):
+        """
+        :param template: A Timetable with the same catalogue and settings as the timetables that will be evaluated.
+         Its genome is not used
+        :param max_bytes: Roughly the most memory the arrays for one chunk of timetables can take up
+        """
+        if np is None:
+            raise ImportError("Batch evaluation needs numpy, which can be installed with 'pip install numpy'")
+        from . import timetabling  # the cost function's constants
+
+        self.constants = timetabling
+        self.template = template
+        self.days = template.days
+        self.max_bytes = max_bytes
+        catalogue = template.catalogue
+        participants = catalogue.participants
+
+        # every user is given a column, and each (lesson, user) pair an entry, once per time they are in the lesson
+        user_ids = list(participants.user_types)
+        self.user_columns: Dict[int, int] = {user_id: i for i, user_id in enumerate(user_ids)}
+        self.user_count = len(user_ids)
+        self.is_teacher = np.array([participants.user_types[user_id] == TEACHER for user_id in user_ids], dtype=bool)
+        self.is_student = np.array([participants.user_types[user_id] == STUDENT for user_id in user_ids], dtype=bool)
+        entry_lessons, entry_users = [], []
+        for index in range(len(catalogue)):
+            for user_id in participants.get_users(index):
+                entry_lessons.append(index)
+                entry_users.append(self.user_columns[user_id])
+        self.entry_lessons = np.array(entry_lessons, dtype=np.intp)
+        self.entry_users = np.array(entry_users, dtype=np.intp)
+        self.durations = np.array([lesson.relative_duration for lesson in catalogue], dtype=np.int64)
+        # later than any lesson could end, used to keep each user's lessons apart when they are all in one array
+        self.slots = template.time_per_day + int(self.durations.max(initial=0)) + 1
+
+        # constraint 3a: the students the average lesson time is taken over (see Timetable.evaluate_day)
+        self.all_student_columns = None
+        self.all_student_count = 0
+        if template.all_students:
+            self.all_student_columns = np.array([self.user_columns[student.id] for student in template.all_students
+                                                 if student.id in self.user_columns], dtype=np.intp)
+            self.all_student_count = len(template.all_students)
+
+    def chunk_size(self) -> int:
+        """Returns the number of timetables whose arrays fit in max_bytes"""
+        # about a dozen 8 byte values for every (lesson, user) pair, and a few for every user
+        per_timetable = max((len(self.entry_lessons) * 12 + self.user_count * 4) * 8, 1)
+        return max(self.max_bytes // per_timetable, 1)
+
+    def evaluate(self, genomes: Sequence) -> Tuple[List[float], List[Dict[int, dict]]]:
+        """Returns the cost and the parts of the cost for each day of every genome, in the same form as
+        Timetable.cost and Timetable.day_costs"""
+        costs, day_costs = [], []
+        size = self.chunk_size()
+        for chunk_start in range(0, len(genomes), size):
+            chunk = genomes[chunk_start:chunk_start + size]
+            days = np.stack([np.frombuffer(genome.days, dtype=np.int16) for genome in chunk]).astype(np.intp)
+            starts = np.stack([np.frombuffer(genome.starts, dtype=np.int16) for genome in chunk]).astype(np.intp)
+            chunk_costs, chunk_day_costs = self.evaluate_chunk(days, starts)
+            costs += chunk_costs
+            day_costs += chunk_day_costs
+        return costs, day_costs
+
+    def evaluate_timetables(self, timetables: Sequence, fitness_cache=None):
+        """Evaluates the timetables, storing the results in each of them (see Timetable.set_cost)
+        Timetables with the same layout are only evaluated once. If a FitnessCache is given, layouts that are already
+        in it aren't evaluated at all, and the results of the rest are stored in it"""
+        to_evaluate = {}  # {genome key: [timetables]}
+        for timetable in timetables:
+            genome_key = timetable.get_genome_key()
+            if fitness_cache is not None:
+                cached = fitness_cache.get(genome_key)
+                if cached is not None:
+                    timetable.set_cost(*cached)
+                    continue
+            to_evaluate.setdefault(genome_key, []).append(timetable)
+
+        genome_keys = list(to_evaluate)
+        costs, day_costs = self.evaluate([to_evaluate[genome_key][0].genome for genome_key in genome_keys])
+        for genome_key, cost, parts in zip(genome_keys, costs, day_costs):
+            for timetable in to_evaluate[genome_key]:
+                timetable.set_cost(cost, parts)
+            if fitness_cache is not None:
+                fitness_cache.put(genome_key, cost, parts)
+
+    def evaluate_chunk(self, days, starts) -> Tuple[List[float], List[Dict[int, dict]]]:
+        """Evaluates a chunk of genomes, given as (timetables x lessons) arrays of days and start times"""
+        constants = self.constants
+        n = days.shape[0]
+        diffs, even_allocation_cost, variety_cost = self.template.get_static_costs()
+
+        # constraint 7: gaps
+        # NOTE: get_cost passes each (start, length) pair from get_gaps to get_gap_cost, which only recognises integer
+        # lengths, so the gaps cost is always 0. This is kept as it is, so that the results match
+        gap_cost_per_user = 0
+
+        totals = np.zeros(n)
+        day_costs = [{} for x in range(n)]
+        for day in range(self.days):
+            load, total, present, last = self.occupancy(days == day, starts)
+
+            # constraints 1 & 2: clashes. A user clashes for every time unit spent in more than one lesson at once
+            clashes = total - load
+            teacher_clashes = (clashes * self.is_teacher).sum(axis=1)
+            student_clashes = (clashes * ~self.is_teacher).sum(axis=1)
+            clashes_cost = constants.POINTS_PER_STUDENT_CLASH * student_clashes \
+                + constants.POINTS_PER_TEACHER_CLASH * teacher_clashes
+
+            # constraint 3a: how many lessons
+            if self.all_student_columns is not None:
+                average_lesson_time = load[:, self.all_student_columns].sum(axis=1) / self.all_student_count
+            else:
+                students = present & self.is_student
+                n_students = students.sum(axis=1)
+                average_lesson_time = np.divide((load * students).sum(axis=1), n_students,
+                                                out=np.zeros(n), where=n_students > 0)
+            lessons_scheduled_cost = constants.DESIRED_LESSONS_MULTIPLIER * constants.DESIRED_LESSONS_BASE ** (
+                self.template.desired_lesson_time - average_lesson_time)
+
+            # constraints 6 & 8: max daily workload and early finish time, for every user with a lesson
+            workload = np.maximum(np.exp(load / constants.MAX_LOAD_CONSTANT) - constants.MAX_LOAD_CONSTANT, 0)
+            daily_workload_cost = (workload * present).sum(axis=1)
+            finish_time = last - constants.EARLIEST_EARLY_FINISH
+            early_finish_cost = (np.where(finish_time > 0, finish_time / constants.EARLY_FINISH_CONSTANT, 0)
+                                 * present).sum(axis=1)
+
+            gaps_cost = gap_cost_per_user * present.sum(axis=1)
+            totals += clashes_cost + even_allocation_cost + lessons_scheduled_cost + variety_cost \
+                + daily_workload_cost + gaps_cost + early_finish_cost
+
+            for i in range(n):
+                day_costs[i][day] = {
+                    'teacher clashes': int(teacher_clashes[i]),
+                    'student clashes': int(student_clashes[i]),
+                    'clashes cost': int(clashes_cost[i]),
+                    'total diffs': diffs,
+                    'even allocation cost': even_allocation_cost,
+                    'average lesson time': float(average_lesson_time[i]),
+                    'lessons scheduled cost': float(lessons_scheduled_cost[i]),
+                    'variety cost': variety_cost,
+                    'daily workload cost': float(daily_workload_cost[i]),
+                    'gaps cost': int(gaps_cost[i]),
+                    'early finish cost': float(early_finish_cost[i]),
+                }
+
+        return [float(total) for total in totals], day_costs
+
+    def occupancy(self, scheduled, starts):
+        """Finds what each user is doing on one day, given a (timetables x lessons) array of whether each lesson is
+        scheduled on that day. Returns (timetables x users) arrays of:
+        (time units busy, total length of their lessons, whether they have any lessons, their last busy time unit)"""
+        n = scheduled.shape[0]
+        users = self.user_count
+        timetables, entries = np.nonzero(scheduled[:, self.entry_lessons])
+        lessons = self.entry_lessons[entries]
+        cells = timetables * users + self.entry_users[entries]  # (timetable, user) pairs, flattened
+        lesson_starts = starts[timetables, lessons]
+        durations = self.durations[lessons]
+        lesson_ends = lesson_starts + durations
+
+        # each user's lessons in order of start time. The time units they are busy for are those not already covered
+        # by an earlier lesson, which ends at the latest end so far (found with a running maximum, offset by the cell
+        # so that it never carries over from one user to the next)
+        order = np.lexsort((lesson_starts, cells))
+        cells, lesson_starts, lesson_ends = cells[order], lesson_starts[order], lesson_ends[order]
+        offset = cells * self.slots
+        latest_end = np.maximum.accumulate(offset + lesson_ends) - offset
+        previous_end = np.zeros_like(latest_end)
+        previous_end[1:] = np.where(cells[1:] == cells[:-1], latest_end[:-1], 0)  # 0 for each user's first lesson
+        covered = np.maximum(lesson_ends - np.maximum(lesson_starts, previous_end), 0)
+
+        load = np.bincount(cells, weights=covered, minlength=n * users).reshape(n, users)
+        total = np.bincount(cells, weights=lesson_ends - lesson_starts, minlength=n * users).reshape(n, users)
+        present = np.bincount(cells, minlength=n * users).reshape(n, users) > 0
+        last = np.full(n * users, UNSCHEDULED, dtype=np.intp)
+        has_length = lesson_ends > lesson_starts
+        np.maximum.at(last, cells[has_length], lesson_ends[has_length] - 1)
+        return load, total, present, last.reshape(n, users)
@@ -0,0 +1,164 @@
+"""Measures how well each engine (see engines.py) schedules made-up schools of different sizes (see synthetic.py)
+
+The results are plain dictionaries that can be saved as JSON, so runs on different commits can be compared:
+
+    python manage.py benchmark --sizes small medium --output before.json
+
+or to compare the engines on the lessons in the database that still need scheduling on a given day:
+
+    python manage.py benchmark --day 2030-01-07 --engine ga sa
+
+Each made-up school is created inside a transaction that is rolled back afterwards, so nothing is left in the
+database, and nothing the engines find is saved.
+Peak memory is measured with tracemalloc, which slows everything down, so speeds should only be compared between
+runs that both did or both didn't measure memory"""
+
+import datetime
+import platform
+import subprocess
+import time
+import tracemalloc
+from typing import Dict, Iterable, List, Optional
+
+from django.db import transaction
+
+from . import synthetic
+from .context import SchedulingContext
+from .engines import GeneticAlgorithm, get_engine
+from .stopping import MaxGenerations
+
+DATABASE = 'database'  # the size given to the dataset of lessons already in the database
+
+
+def run_engine(name: str, context: SchedulingContext, first_day: datetime.datetime, seed: int = 0,
+               generations: int = 100, evaluations: int = 20_000, trace_memory: bool = True, **kwargs) -> dict:
+    """Schedules one day of the context's lessons with the named engine, returning what happened
+    The genetic algorithm runs for the given number of generations, and local searches for the given number of
+    evaluations. Other keyword arguments are passed on to the engine"""
+    engine_class = get_engine(name)
+    kwargs = dict(kwargs, first_day=first_day, context=context, seed=seed)
+    if engine_class is GeneticAlgorithm:
+        kwargs.setdefault('stopping_condition', MaxGenerations(generations))
+    else:
+        kwargs.setdefault('max_evaluations', evaluations)
+    engine = engine_class(**kwargs)
+
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        best = engine.solve()
+        peak_memory = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+    generations_run = engine.population.generations if engine_class is GeneticAlgorithm else None
+    return {
+        'engine': engine_class.name,
+        'seed': seed,
+        'seconds': engine.elapsed,
+        'evaluations': engine.evaluations,
+        'evaluations_per_second': engine.evaluations / engine.elapsed if engine.elapsed else None,
+        'generations': generations_run,
+        'generations_per_second': generations_run / engine.elapsed if generations_run and engine.elapsed else None,
+        'peak_memory_bytes': peak_memory,
+        'best_cost': best.get_cost(),
+        'history': [{'evaluations': evaluations, 'best_cost': cost, 'seconds': seconds}
+                    for evaluations, cost, seconds in engine.history],
+    }
+
+
+def run_dataset(size: str, engines: Iterable[str], seed: int = 0, crossovers: Optional[Iterable[str]] = None,
+                **kwargs) -> dict:
+    """Creates the school with the given size (one of synthetic.SIZES), runs each engine on it and then removes it
+    again. If crossovers are given, the genetic algorithm is run once with each of them (see crossover.CROSSOVERS).
+    Other keyword arguments are passed on to run_engine"""
+    if size not in synthetic.SIZES:
+        raise ValueError(f"Unknown size '{size}'. Choose from {list(synthetic.SIZES)}")
+
+    first_day = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    with transaction.atomic():
+        started = time.monotonic()
+        counts = synthetic.generate_school(students=synthetic.SIZES[size], seed=seed, prefix=f"benchmark-{size}")
+        context = SchedulingContext.load(first_day=first_day)
+        setup_seconds = time.monotonic() - started
+        runs = run_engines(engines, context, first_day, seed=seed, crossovers=crossovers, **kwargs)
+        transaction.set_rollback(True)
+
+    return {'size': size, 'seed': seed, 'setup_seconds': setup_seconds, **counts,
+            'lessons_to_schedule': len(context.catalogue), 'runs': runs}
+
+
+def run_database(day: datetime.date, engines: Iterable[str], seed: int = 0, crossovers: Optional[Iterable[str]] = None,
+                 **kwargs) -> dict:
+    """Runs each engine on the lessons in the database that still need scheduling on the given day, without saving
+    anything. Takes the same arguments as run_dataset"""
+    first_day = datetime.datetime.combine(day, datetime.time(), tzinfo=datetime.timezone.utc)
+    started = time.monotonic()
+    context = SchedulingContext.load(first_day=first_day)
+    setup_seconds = time.monotonic() - started
+    if not context.catalogue:
+        raise ValueError(f"There are no unscheduled lessons to schedule on {day.isoformat()}")
+
+    return {'size': DATABASE, 'day': day.isoformat(), 'seed': seed, 'setup_seconds': setup_seconds,
+            'groups': len(context.group_data), 'students': len(context.all_students),
+            'lessons_to_schedule': len(context.catalogue),
+            'runs': run_engines(engines, context, first_day, seed=seed, crossovers=crossovers, **kwargs)}
+
+
+def run_engines(engines: Iterable[str], context: SchedulingContext, first_day: datetime.datetime, seed: int = 0,
+                crossovers: Optional[Iterable[str]] = None, **kwargs) -> List[dict]:
+    """Runs each engine on the context's lessons (see run_engine). If crossovers are given, the genetic algorithm is
+    run once with each of them"""
+    runs = []
+    for name in engines:
+        if get_engine(name) is GeneticAlgorithm and crossovers:
+            for crossover in crossovers:
+                run = run_engine(name, context, first_day, seed=seed, crossover_operator=crossover, **kwargs)
+                runs.append(dict(run, crossover=crossover))
+        else:
+            runs.append(run_engine(name, context, first_day, seed=seed, **kwargs))
+    return runs
+
+
+def run_suite(sizes: Iterable[str], engines: Iterable[str], seed: int = 0, day: Optional[datetime.date] = None,
+              **kwargs) -> dict:
+    """Runs every engine on every size of school, and on the database's own lessons for the given day if there is
+    one, returning the results along with where they were measured"""
+    engines = list(engines)
+    datasets = [run_dataset(size, engines, seed=seed, **kwargs) for size in sizes]
+    if day is not None:
+        datasets.append(run_database(day, engines, seed=seed, **kwargs))
+    return {
+        'commit': get_commit(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'datasets': datasets,
+    }
+
+
+def get_commit() -> Optional[str]:
+    """Returns the git commit being benchmarked, or None if it can't be found"""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def summarise(results: dict) -> List[Dict[str, object]]:
+    """Returns one row per run without the history, e.g. for printing as a table
+    Each row also has the number of evaluations the run took to do as well as the genetic algorithm did on the same
+    dataset (its first run, if there were several), which is None if it never did or the genetic algorithm wasn't run"""
+    rows = []
+    for dataset in results['datasets']:
+        target = next((run['best_cost'] for run in dataset['runs'] if run['engine'] == GeneticAlgorithm.name), None)
+        for run in dataset['runs']:
+            reached = None
+            if target is not None:
+                reached = next((point['evaluations'] for point in run['history'] if point['best_cost'] <= target),
+                               None)
+            rows.append({'size': dataset['size'], **{key: value for key, value in run.items() if key != 'history'},
+                         'evaluations_to_reach_ga': reached})
+    return rows
@@ -0,0 +1,65 @@
+"""The lessons that could be scheduled, shared by every timetable in a population
+
+A timetable's genome (see genome.py) refers to lessons by their position in the catalogue, so the catalogue itself is
+never modified once it has been created. Anything needed from the database is loaded when it is created, so that
+creating and evaluating timetables does not need to query the database at all"""
+
+import hashlib
+from typing import Dict, Iterable, Iterator
+
+from .participants import ParticipantIndex
+
+
+class LessonCatalogue:
+    """A read-only sequence of PotentiallyScheduledLessons"""
+
+    __slots__ = ('lessons', 'positions', 'participants')
+
+    def __init__(self, lessons: Iterable):
+        """
+        :param lessons: The PotentiallyScheduledLessons that could be scheduled. Their users and teachers are loaded
+         from the database if they have not been already
+        """
+        self.lessons = tuple(lessons)
+        self.positions: Dict[int, int] = {lesson.id: i for i, lesson in enumerate(self.lessons)}  # {lesson id: index}
+        group_users = {}  # lessons in the same group have the same users, so they only need loading once per group
+        for lesson in self.lessons:
+            if lesson.users is None and lesson.group_id in group_users:
+                lesson.users = group_users[lesson.group_id]
+            else:
+                lesson.users = list(lesson.get_users())
+                group_users.setdefault(lesson.group_id, lesson.users)
+            if lesson.teacher is None:
+                lesson.teacher = next((user for user in lesson.users if user.user_type == 'teacher'), None)
+        self.participants = ParticipantIndex(self.lessons)  # who is in each lesson, used by the cost function
+
+    def __len__(self):
+        return len(self.lessons)
+
+    def __getitem__(self, index: int):
+        return self.lessons[index]
+
+    def __iter__(self) -> Iterator:
+        return iter(self.lessons)
+
+    def __bool__(self):
+        return bool(self.lessons)
+
+    def __repr__(self):
+        return f"<LessonCatalogue lessons={len(self)}>"
+
+    def index(self, lesson_id: int) -> int:
+        """Returns the position of the lesson with the given id"""
+        return self.positions[lesson_id]
+
+    def digest(self) -> str:
+        """Returns a hash of the lessons in the catalogue, which is the same in every process and on every run"""
+        description = ';'.join(f"{lesson.id},{lesson.group_id},{lesson.relative_duration}" for lesson in self.lessons)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    @classmethod
+    def from_lessons(cls, lessons) -> 'LessonCatalogue':
+        """Returns lessons if it is already a catalogue, otherwise creates one from it"""
+        if isinstance(lessons, cls):
+            return lessons
+        return cls(lessons)
@@ -0,0 +1,144 @@
+"""Saves the best timetables of each night's run, so the next run can start from them instead of from random ones
+
+Each checkpoint is a gzipped JSON file holding the placements of a few timetables for one date, named after that date
+and a hash of the catalogue they were made from (see LessonCatalogue.digest). When the catalogue has changed, the
+placements are translated: lessons that no longer need scheduling are dropped, and new lessons take the place of a
+dropped lesson from the same group if there is one, or a random one otherwise"""
+
+import datetime
+import gzip
+import json
+import os
+import random
+import tempfile
+from typing import List, Optional, Sequence, Tuple
+
+Placements = Tuple[Tuple[int, int, int], ...]  # ((lesson id, day, relative start), ...)
+
+FORMAT_VERSION = 1
+
+
+def get_directory() -> str:
+    """Returns the directory checkpoints are stored in, which is settings.TIMETABLE_CHECKPOINT_DIR
+    Without that setting, they are stored in the temporary directory rather than anywhere in the source tree"""
+    from django.conf import settings
+    return getattr(settings, 'TIMETABLE_CHECKPOINT_DIR', os.path.join(tempfile.gettempdir(), 'timetable-checkpoints'))
+
+
+def get_path(date: datetime.date, catalogue_digest: str, directory: Optional[str] = None) -> str:
+    if directory is None:
+        directory = get_directory()
+    return os.path.join(directory, f"{date.isoformat()}_{catalogue_digest[:16]}.json.gz")
+
+
+def save(date: datetime.date, catalogue, timetables: Sequence, directory: Optional[str] = None) -> str:
+    """Saves the placements of the given timetables, which must all use the given catalogue
+    Returns the path of the checkpoint"""
+    path = get_path(date, catalogue.digest(), directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = {
+        'version': FORMAT_VERSION,
+        'date': date.isoformat(),
+        'catalogue': catalogue.digest(),
+        'lessons': [[lesson.id, lesson.group_id] for lesson in catalogue],  # every lesson that could be scheduled
+        'timetables': [{'cost': timetable.get_cost(), 'placements': timetable.get_placements()}
+                       for timetable in sorted(timetables, key=lambda t: t.get_cost())],
+    }
+    temporary_path = path + '.tmp'
+    with gzip.open(temporary_path, 'wt', encoding='utf-8') as file:
+        json.dump(data, file, separators=(',', ':'))
+    os.replace(temporary_path, path)  # so that a run that is interrupted never leaves half a checkpoint
+    return path
+
+
+def find(date: datetime.date, catalogue_digest: str, directory: Optional[str] = None) -> Optional[str]:
+    """Returns the path of the best checkpoint to start a run for the given date from, or None if there isn't one
+    A checkpoint for the same date and catalogue is best, followed by the most recent one before it"""
+    if directory is None:
+        directory = get_directory()
+    exact = get_path(date, catalogue_digest, directory)
+    if os.path.exists(exact):
+        return exact
+    if not os.path.isdir(directory):
+        return None
+
+    candidates = []
+    for name in os.listdir(directory):
+        if not name.endswith('.json.gz'):
+            continue
+        try:
+            checkpoint_date = datetime.date.fromisoformat(name.split('_')[0])
+        except ValueError:
+            continue
+        if checkpoint_date <= date:
+            candidates.append((checkpoint_date, os.path.getmtime(os.path.join(directory, name)), name))
+    if not candidates:
+        return None
+    return os.path.join(directory, max(candidates)[2])
+
+
+def load(date: datetime.date, catalogue, days: int = 1, time_per_day: int = 114,
+         directory: Optional[str] = None) -> List[Placements]:
+    """Returns the placements from the best checkpoint for the given date (see find), translated to the given
+    catalogue, best timetable first. Returns an empty list if there is no checkpoint, or it can't be read"""
+    path = find(date, catalogue.digest(), directory)
+    if path is None:
+        return []
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            data = json.load(file)
+        if data.get('version') != FORMAT_VERSION:
+            return []
+    except (OSError, ValueError) as error:
+        print(f"Warning: Unable to read checkpoint {path} ({error})")
+        return []
+
+    if data['catalogue'] == catalogue.digest():
+        return [tuple(tuple(placement) for placement in timetable['placements']) for timetable in data['timetables']]
+
+    groups = {lesson_id: group_id for lesson_id, group_id in data['lessons']}
+    return [translate(timetable['placements'], groups, catalogue, days, time_per_day)
+            for timetable in data['timetables']]
+
+
+def translate(placements, groups: dict, catalogue, days: int = 1, time_per_day: int = 114) -> Placements:
+    """Translates placements made with a different catalogue to the given one
+    groups holds the group of every lesson in the old catalogue: {lesson id: group id}"""
+    kept = []
+    freed = {}  # {group id: [(day, relative start)]} for lessons that are no longer in the catalogue
+    for lesson_id, day, relative_start in placements:
+        if day >= days:
+            continue
+        if lesson_id in catalogue.positions:
+            kept.append((lesson_id, day, relative_start))
+        else:
+            freed.setdefault(groups.get(lesson_id), []).append((day, relative_start))
+
+    for lesson in catalogue:
+        if lesson.id in groups:  # either kept, or deliberately left unscheduled
+            continue
+        latest_start = time_per_day - lesson.relative_duration
+        if freed.get(lesson.group_id):
+            day, relative_start = freed[lesson.group_id].pop(0)
+            kept.append((lesson.id, day, min(relative_start, latest_start)))
+        else:
+            kept.append((lesson.id, random.randint(0, days - 1), random.randint(0, latest_start)))
+
+    return tuple(kept)
+
+
+def prune(keep_days: int = 28, directory: Optional[str] = None, today: Optional[datetime.date] = None):
+    """Deletes checkpoints for dates more than keep_days before today"""
+    if directory is None:
+        directory = get_directory()
+    if today is None:
+        today = datetime.date.today()
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        try:
+            checkpoint_date = datetime.date.fromisoformat(name.split('_')[0])
+        except ValueError:
+            continue
+        if (today - checkpoint_date).days > keep_days:
+            os.remove(os.path.join(directory, name))
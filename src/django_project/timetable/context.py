@@ -0,0 +1,85 @@
+"""Everything the scheduler needs from the database, loaded in a fixed number of queries
+
+Loading this once and passing it to a Population (or an IslandModel) means that neither the population nor any of
+its timetables need to query the database themselves, however many groups, lessons and students there are"""
+
+import datetime
+from typing import Dict, List, Optional
+
+from . import statistics
+from .catalogue import LessonCatalogue
+from .models import Lesson, Link
+
+
+class SchedulingContext:
+    """The data used to create and evaluate timetables, loaded from the database by SchedulingContext.load"""
+
+    def __init__(self, catalogue: LessonCatalogue, group_data: Dict[int, list], all_students: list,
+                 year_start: datetime.datetime):
+        """
+        :param catalogue: The lessons that could be scheduled
+        :param group_data: {group id: [seconds of lessons so far, days since the group's last lesson]}
+        :param all_students: Every student in any group
+        :param year_start: The start of the academic year
+        """
+        self.catalogue = catalogue
+        self.group_data = group_data
+        self.all_students = all_students
+        self.year_start = year_start
+
+    def __repr__(self):
+        return f"<SchedulingContext lessons={len(self.catalogue)} groups={len(self.group_data)} " \
+               f"students={len(self.all_students)}>"
+
+    @classmethod
+    def load(cls, first_day: Optional[datetime.datetime] = None, days: int = 1, seconds_per_unit_time: float = 300,
+             year_start: Optional[datetime.datetime] = None) -> 'SchedulingContext':
+        """Loads everything from the database using a fixed number of queries
+        Takes the same arguments as get_unscheduled_lessons. If year_start is given, it is not loaded"""
+        from .timetabling import PotentiallyScheduledLesson, get_year_start
+
+        if not first_day:
+            first_day = datetime.datetime.now(datetime.timezone.utc)
+
+        # the users in each group, with each User shared between all of their groups
+        group_users: Dict[int, list] = {}
+        for link in Link.objects.select_related('user_id').order_by('group_id', 'id'):
+            group_users.setdefault(link.group_id_id, []).append(link.user_id)
+
+        # at most `days` unfixed lessons per group, as only one of each can be scheduled per day
+        unscheduled_lessons = []
+        per_class = {}
+        for lesson in Lesson.objects.filter(fixed=False).exclude(start__lte=first_day).only(
+                'id', 'duration', 'group_id', 'topic').order_by('id'):
+            per_class[lesson.group_id] = per_class.get(lesson.group_id, 0) + 1
+            if per_class[lesson.group_id] <= days:
+                unscheduled_lesson = PotentiallyScheduledLesson(lesson, seconds_per_time_unit=seconds_per_unit_time)
+                unscheduled_lesson.users = group_users.get(lesson.group_id, [])
+                unscheduled_lessons.append(unscheduled_lesson)
+
+        group_data = cls.load_group_data()
+
+        all_students = []
+        seen = set()
+        for group_id in group_data:
+            for user in group_users.get(group_id, []):
+                if user.user_type == 'student' and user.id not in seen:
+                    seen.add(user.id)
+                    all_students.append(user)
+
+        if not year_start:
+            year_start = get_year_start()
+
+        return cls(LessonCatalogue(unscheduled_lessons), group_data, all_students, year_start)
+
+    @staticmethod
+    def load_group_data() -> Dict[int, list]:
+        """Returns {group id: [seconds of lessons so far, days since the group's last lesson]} for every group, using
+        two queries on the stored statistics (see statistics.py). Groups that have not had any lessons yet have 0 for
+        both"""
+        return statistics.get_group_data()
+
+    def population_kwargs(self) -> dict:
+        """Returns the keyword arguments that pass this context's data on to a Population"""
+        return dict(unscheduled_lessons=self.catalogue, group_data=self.group_data, all_students=self.all_students,
+                    year_start=self.year_start)
@@ -0,0 +1,153 @@
+"""Crossover operators for the genetic algorithm
+
+Each operator creates a child genome from two parent genomes (see genome.py) in time proportional to the number of
+lessons, using the genomes' arrays directly. Apart from 'merge', they keep parts of each parent together, so that
+lessons that fit well around each other in a parent (e.g. a teacher's clash-free day) are passed on together"""
+
+import random
+from array import array
+from typing import Dict, List, Union
+
+from .genome import Genome, UNSCHEDULED
+
+
+class Crossover:
+    """Creates a child from two parents"""
+
+    name = ''
+
+    def cross(self, parent1: Genome, parent2: Genome, catalogue, days: int, time_per_day: int) -> Genome:
+        """Returns a new genome made from the parents, which are not changed"""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
+
+
+class MergeCrossover(Crossover):
+    """For each day, mixes both parents' lessons together and schedules a random half of them
+    This is the original crossover, so lessons are mixed regardless of which parent or group they came from"""
+
+    name = 'merge'
+
+    def cross(self, parent1, parent2, catalogue, days, time_per_day):
+        genome = Genome(len(catalogue))
+        for day in range(days):
+            potential_new_lessons = [(i, parent1.starts[i]) for i in parent1.scheduled(day)] \
+                + [(i, parent2.starts[i]) for i in parent2.scheduled(day)]
+            random.shuffle(potential_new_lessons)
+
+            for index, relative_start in potential_new_lessons[:len(potential_new_lessons) // 2]:
+                if genome.days[index] == UNSCHEDULED:  # a lesson can only be scheduled once
+                    genome.place(index, day, relative_start)
+
+        return genome
+
+
+class UniformCrossover(Crossover):
+    """Each lesson is scheduled as it is in a randomly chosen parent (including not being scheduled at all)"""
+
+    name = 'uniform'
+
+    def cross(self, parent1, parent2, catalogue, days, time_per_day):
+        child_days = array(Genome.TYPECODE, parent1.days)
+        child_starts = array(Genome.TYPECODE, parent1.starts)
+        for index in range(len(child_days)):
+            if random.random() < 0.5:
+                child_days[index] = parent2.days[index]
+                child_starts[index] = parent2.starts[index]
+        return Genome(days=child_days, starts=child_starts)
+
+
+class GroupCrossover(Crossover):
+    """All of a group's lessons are scheduled as they are in one parent, chosen at random for each group"""
+
+    name = 'group'
+
+    def __init__(self):
+        self.catalogue = None
+        self.blocks: List[List[int]] = []  # the catalogue indices of the lessons in each block
+
+    def get_block_key(self, catalogue, index: int) -> int:
+        return catalogue.participants.lesson_groups[index]
+
+    def get_blocks(self, catalogue) -> List[List[int]]:
+        """Returns the lessons that are inherited together, which are found once per catalogue"""
+        if catalogue is not self.catalogue:
+            blocks: Dict[int, List[int]] = {}
+            for index in range(len(catalogue)):
+                blocks.setdefault(self.get_block_key(catalogue, index), []).append(index)
+            self.blocks = list(blocks.values())
+            self.catalogue = catalogue
+        return self.blocks
+
+    def cross(self, parent1, parent2, catalogue, days, time_per_day):
+        child_days = array(Genome.TYPECODE, parent1.days)
+        child_starts = array(Genome.TYPECODE, parent1.starts)
+        for block in self.get_blocks(catalogue):
+            if random.random() < 0.5:
+                for index in block:
+                    child_days[index] = parent2.days[index]
+                    child_starts[index] = parent2.starts[index]
+        return Genome(days=child_days, starts=child_starts)
+
+    def __getstate__(self):
+        return {}  # the blocks are found again after unpickling, as the catalogue will be a different object
+
+    def __setstate__(self, state):
+        self.__init__()
+
+
+class TeacherCrossover(GroupCrossover):
+    """All the lessons of every group with the same teacher are scheduled as they are in one parent, so each
+    teacher's day is inherited whole. Groups without a teacher are inherited on their own"""
+
+    name = 'teacher'
+
+    def get_block_key(self, catalogue, index):
+        teacher_id = catalogue.participants.get_teacher(index)
+        if teacher_id == -1:
+            return -1 - catalogue.participants.lesson_groups[index]  # group ids are positive, so this can't clash
+        return teacher_id
+
+
+class TimeWindowCrossover(Crossover):
+    """For each day, a random window of the day is taken from the first parent and the rest of the day from the
+    second. Lessons the second parent schedules in the window are left out, unless the first parent schedules them
+    somewhere else"""
+
+    name = 'window'
+
+    def cross(self, parent1, parent2, catalogue, days, time_per_day):
+        windows = []
+        for day in range(days):
+            start, end = sorted((random.randint(0, time_per_day), random.randint(0, time_per_day)))
+            windows.append((start, end))
+
+        child = Genome(len(catalogue))
+        # lessons that start inside the window in the first parent
+        for index in range(len(child)):
+            day = parent1.days[index]
+            if day != UNSCHEDULED and windows[day][0] <= parent1.starts[index] < windows[day][1]:
+                child.place(index, day, parent1.starts[index])
+        # lessons that start outside the window in the second parent, if they haven't been scheduled already
+        for index in range(len(child)):
+            day = parent2.days[index]
+            if day != UNSCHEDULED and child.days[index] == UNSCHEDULED \
+                    and not windows[day][0] <= parent2.starts[index] < windows[day][1]:
+                child.place(index, day, parent2.starts[index])
+        return child
+
+
+CROSSOVERS = {crossover.name: crossover for crossover in
+              (MergeCrossover, UniformCrossover, GroupCrossover, TeacherCrossover, TimeWindowCrossover)}
+
+
+def get_crossover(crossover: Union[str, Crossover]) -> Crossover:
+    """Returns the crossover operator with the given name (see CROSSOVERS), or the operator itself if it is already
+    one"""
+    if isinstance(crossover, Crossover):
+        return crossover
+    if crossover not in CROSSOVERS:
+        raise ValueError(f"Unknown crossover operator '{crossover}'. Choose from {list(CROSSOVERS)}")
+    return CROSSOVERS[crossover]()
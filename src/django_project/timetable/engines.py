@@ -0,0 +1,307 @@
+"""Optimisers that can be used to create a timetable, chosen by name (see get_engine)
+
+Every engine takes the same keyword arguments as Population for describing the problem (first_day, days, context,
+desired_allocations, etc.), and has a solve() method returning the best Timetable it finds. engine.evaluations is
+the number of timetables whose cost was needed, so that engines can be compared fairly
+
+The local search engines improve a single timetable using the same moves as Timetable.mutate (moving, removing and
+adding one lesson at a time). Only the users in the changed lesson need re-evaluating after each move, so each step
+is much quicker than evaluating a whole timetable
+
+Every engine takes a stopping_condition, as for Population (see stopping.py). A local search counts every
+generation_size moves as a generation, and checks the condition each time it finishes one, passing itself as the
+population (its population is a list holding the best timetable found so far). The default generation_size is
+max_evaluations / 100, so should_stop stops a local search at the same point as max_evaluations"""
+
+import math
+import random
+import time
+from typing import Optional, Tuple, Type, Union
+
+
+class Engine:
+    """Creates a timetable"""
+
+    name = ''
+
+    def __init__(self, stopping_condition=None, **population_kwargs):
+        """
+        :param stopping_condition: Called with (engine or population, generations) as for Population, returning True
+         to stop. If not given, each engine stops in its own way
+        """
+        self.stopping_condition = stopping_condition
+        self.population_kwargs = population_kwargs
+        self.evaluations = 0
+        self.elapsed = 0.0
+        self.started = None  # time.monotonic() when solve was called
+        self.history = []  # [(evaluations, best cost, seconds since starting)] whenever a better timetable is found
+
+    def solve(self):
+        """Returns the best timetable found"""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
+
+    def evaluations_to_reach(self, cost: float) -> Optional[int]:
+        """Returns the number of evaluations it took to find a timetable costing no more than the given cost, or None
+        if none was found"""
+        return next((evaluations for evaluations, best_cost, seconds in self.history if best_cost <= cost), None)
+
+    def record(self, best_cost: float):
+        """Adds the best cost found so far to the history"""
+        self.history.append((self.evaluations, best_cost, time.monotonic() - self.started))
+
+
+class GeneticAlgorithm(Engine):
+    """The genetic algorithm in Population"""
+
+    name = 'ga'
+
+    def __init__(self, *args, **population_kwargs):
+        super().__init__(**population_kwargs)
+        self.args = args
+        self.population = None
+
+    def solve(self):
+        from .timetabling import Population, should_stop
+
+        stopping_condition = self.stopping_condition or should_stop
+
+        def record_history(population, generations):
+            best_cost = min(timetable.get_cost() for timetable in population.population)
+            self.evaluations = population.evaluations
+            if not self.history or best_cost < self.history[-1][1]:
+                self.record(best_cost)
+            return stopping_condition(population, generations)
+
+        self.started = time.monotonic()
+        self.population = Population(*self.args, **dict(self.population_kwargs, stopping_condition=record_history))
+        best = self.population.start()
+        self.evaluations = self.population.evaluations
+        self.elapsed = time.monotonic() - self.started
+        return best
+
+
+class LocalSearch(Engine):
+    """Improves a single timetable one move at a time
+    Stops after max_evaluations moves have been tried, after time_limit seconds if that is given, or when the
+    stopping condition returns True"""
+
+    def __init__(self, max_evaluations: int = 20_000, time_limit: Optional[float] = None, initial=None,
+                 generation_size: Optional[int] = None, **population_kwargs):
+        """
+        :param initial: The timetable to start from. If not given, a random one is used
+        :param generation_size: The number of moves counted as a generation by the stopping condition. Defaults to
+         max_evaluations / 100
+        :param population_kwargs: Describe the problem, as for Population
+        """
+        super().__init__(**population_kwargs)
+        if max_evaluations < 1:
+            raise ValueError("Number of evaluations must be positive")
+        if generation_size is not None and generation_size < 1:
+            raise ValueError("Generation size must be positive")
+        self.max_evaluations = max_evaluations
+        self.time_limit = time_limit
+        self.initial = initial
+        self.generation_size = generation_size or max(max_evaluations // 100, 1)
+        self.generations = -1  # the last generation the stopping condition was checked at
+        self.stopped = False
+        self.best = None
+
+    @property
+    def population(self) -> list:
+        """The best timetable found so far, in a list so that stopping conditions can treat the search as a
+        population"""
+        return [self.best]
+
+    def get_initial(self):
+        """Returns the timetable to start from, created with the same settings a Population would use"""
+        from .timetabling import Population
+
+        if self.initial is not None:
+            return self.initial.copy()
+        # a population of one does all the same setup, and its only member is a random timetable
+        kwargs = dict(self.population_kwargs, popsize=1, num_parents=1, num_offspring=0, guaranteed_parent_survival=1)
+        return Population(**kwargs).population[0]
+
+    def propose_move(self, timetable):
+        """Returns a random move for the timetable, in the form passed to move_lesson, or None if there is none"""
+        for attempt in range(10):
+            move = timetable.propose_move(random.randrange(timetable.days))
+            if move is not None:
+                return move
+        return None
+
+    def try_move(self, timetable, move) -> Tuple[float, Tuple[int, int, int]]:
+        """Makes the move and returns the new cost, along with the move that undoes it"""
+        index = move[0]
+        undo = (index, timetable.genome.days[index], timetable.genome.starts[index])
+        timetable.move_lesson(*move)
+        self.evaluations += 1
+        return timetable.get_cost(), undo
+
+    def out_of_time(self, started: float) -> bool:
+        return self.time_limit is not None and time.monotonic() - started >= self.time_limit
+
+    def get_progress(self, started: float) -> float:
+        """Returns how far through the search is, from 0 to 1, by evaluations or by time, whichever is further"""
+        progress = self.evaluations / self.max_evaluations
+        if self.time_limit is not None:
+            progress = max(progress, (time.monotonic() - started) / self.time_limit) if self.time_limit > 0 else 1
+        return progress
+
+    def should_stop(self) -> bool:
+        """Checks the stopping condition whenever a generation has finished, returning True once it says to stop"""
+        generations = self.evaluations // self.generation_size
+        if self.stopping_condition is not None and generations != self.generations and not self.stopped:
+            self.generations = generations
+            self.stopped = bool(self.stopping_condition(self, generations))
+        return self.stopped
+
+    def improved(self, timetable, cost: float):
+        """Keeps a copy of the best timetable found so far, returning it"""
+        self.best = timetable.copy()
+        self.record(cost)
+        return self.best
+
+    def solve(self):
+        self.started = started = time.monotonic()
+        current = self.get_initial()
+        current.fitness_cache = None  # nearly every timetable is new, so this would only take up memory
+        current.get_cost()
+        self.evaluations += 1
+        self.generations = -1
+        self.stopped = False
+        best = self.search(current, started)
+        self.elapsed = time.monotonic() - started
+        return best
+
+    def search(self, current, started: float):
+        raise NotImplementedError
+
+
+class SimulatedAnnealing(LocalSearch):
+    """Accepts every move that improves the timetable, and moves that make it worse with a probability that falls as
+    the search goes on (exp(-increase in cost / temperature), with the temperature falling geometrically)
+    The temperature reaches final_temperature at the end of max_evaluations moves, or of time_limit if that comes
+    first"""
+
+    name = 'sa'
+
+    def __init__(self, initial_temperature: Optional[float] = None, final_temperature: float = 0.01, **kwargs):
+        """
+        :param initial_temperature: If not given, it is chosen so that a typical move making the timetable worse is
+         accepted half the time at the start
+        :param final_temperature: The temperature at the end of the search
+        """
+        super().__init__(**kwargs)
+        self.initial_temperature = initial_temperature
+        self.final_temperature = final_temperature
+
+    def estimate_temperature(self, current, samples: int = 50) -> float:
+        """Returns a temperature at which an average move that makes the timetable worse is accepted half the time"""
+        cost = current.get_cost()
+        increases = []
+        for x in range(samples):
+            move = self.propose_move(current)
+            if move is None:
+                break
+            new_cost, undo = self.try_move(current, move)
+            if new_cost > cost:
+                increases.append(new_cost - cost)
+            current.move_lesson(*undo)
+            current.get_cost()
+        if not increases:
+            return 1.0
+        return (sum(increases) / len(increases)) / math.log(2)
+
+    def search(self, current, started):
+        cost = current.get_cost()
+        best, best_cost = self.improved(current, cost), cost
+
+        initial_temperature = self.initial_temperature or self.estimate_temperature(current)
+        cooling = min(self.final_temperature, initial_temperature) / initial_temperature  # over the whole search
+
+        while not self.should_stop():
+            progress = self.get_progress(started)
+            if progress >= 1:
+                break
+            temperature = initial_temperature * cooling ** progress
+            move = self.propose_move(current)
+            if move is None:
+                break
+            new_cost, undo = self.try_move(current, move)
+            if new_cost <= cost or random.random() < math.exp((cost - new_cost) / temperature):
+                cost = new_cost
+                if cost < best_cost:
+                    best, best_cost = self.improved(current, cost), cost
+            else:
+                current.move_lesson(*undo)
+                current.get_cost()
+
+        return best
+
+
+class TabuSearch(LocalSearch):
+    """Tries a sample of moves every step and makes the best one, even if it makes the timetable worse
+    A lesson that has just been moved can't be moved again for `tenure` steps, unless that would give the best
+    timetable found so far, which stops the search undoing its own moves"""
+
+    name = 'tabu'
+
+    def __init__(self, neighbourhood: int = 20, tenure: int = 10, **kwargs):
+        """
+        :param neighbourhood: The number of moves tried every step
+        :param tenure: The number of steps after moving a lesson before it can be moved again
+        """
+        super().__init__(**kwargs)
+        if neighbourhood < 1:
+            raise ValueError("Neighbourhood size must be positive")
+        self.neighbourhood = neighbourhood
+        self.tenure = tenure
+
+    def search(self, current, started):
+        best_cost = current.get_cost()
+        best = self.improved(current, best_cost)
+        tabu = {}  # {catalogue index: the step it can be moved again}
+
+        step = 0
+        while self.evaluations < self.max_evaluations and not self.out_of_time(started) and not self.should_stop():
+            chosen, chosen_cost = None, math.inf
+            for x in range(min(self.neighbourhood, self.max_evaluations - self.evaluations)):
+                move = self.propose_move(current)
+                if move is None:
+                    break
+                new_cost, undo = self.try_move(current, move)
+                current.move_lesson(*undo)
+                current.get_cost()
+                allowed = tabu.get(move[0], 0) <= step or new_cost < best_cost
+                if allowed and new_cost < chosen_cost:
+                    chosen, chosen_cost = move, new_cost
+            if chosen is None:
+                if move is None:
+                    break
+                step += 1
+                continue
+
+            current.move_lesson(*chosen)
+            current.get_cost()
+            tabu[chosen[0]] = step + self.tenure
+            if chosen_cost < best_cost:
+                best, best_cost = self.improved(current, chosen_cost), chosen_cost
+            step += 1
+
+        return best
+
+
+ENGINES = {engine.name: engine for engine in (GeneticAlgorithm, SimulatedAnnealing, TabuSearch)}
+
+
+def get_engine(engine: Union[str, Type[Engine]]) -> Type[Engine]:
+    """Returns the engine class with the given name (see ENGINES), or the class itself if it is already one"""
+    if isinstance(engine, type) and issubclass(engine, Engine):
+        return engine
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Choose from {list(ENGINES)}")
+    return ENGINES[engine]
@@ -0,0 +1,32 @@
+"""Evaluates timetables in separate processes, so that the cost function can make use of more than one core
+
+Only the genome of each timetable is sent to each worker. Everything else needed to evaluate the cost function
+(including the catalogue of lessons the genome refers to) is sent once, when the worker is started"""
+
+import pickle
+from typing import Dict, Tuple
+
+evaluator = None  # the Timetable used to evaluate genomes in this worker process
+
+
+def init_worker(payload: bytes):
+    """Sets up a worker process
+    The payload is pickled by the parent process, so that Django can be set up before it is unpickled (it contains
+    Django model instances)"""
+    global evaluator
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+    evaluator = pickle.loads(payload)
+
+
+def evaluate_genome(genome) -> Tuple[float, Dict[int, dict]]:
+    """Evaluates a timetable with the given genome (see genome.py)
+    Returns (cost, {day: {cost part: value}})"""
+    evaluator.genome = genome
+    evaluator.modified = True
+    evaluator.dirty_users = {}
+    evaluator.get_cost()
+
+    return evaluator.cost, evaluator.day_costs
@@ -0,0 +1,64 @@
+"""A table of previously evaluated timetables, so that duplicate individuals do not need evaluating again
+
+Timetables are looked up by their whole layout (see Timetable.get_genome_key) rather than a hash of it, so two
+different timetables can never be given each other's cost. This takes 4 bytes per lesson in the catalogue for each
+timetable stored"""
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class FitnessCache:
+    """A bounded least-recently-used table from a timetable's lesson layout to its cost
+    One of these is shared between every generation of a Population. Once full, the least recently used entry is
+    dropped whenever a new one is stored"""
+
+    def __init__(self, maxsize: int = 10_000):
+        self.maxsize = maxsize
+        self.table = OrderedDict()  # {genome key: (cost, {day: {cost part: value}})}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.table)
+
+    def __str__(self):
+        return describe(self.stats())
+
+    def get(self, genome_key: bytes) -> Optional[Tuple[float, Dict[int, dict]]]:
+        """Returns the stored (cost, day costs) for the given genome key, or None if it has not been evaluated"""
+        entry = self.table.get(genome_key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.table.move_to_end(genome_key)
+        self.hits += 1
+        return entry
+
+    def put(self, genome_key: bytes, cost: float, day_costs: Dict[int, dict]):
+        """Stores the cost of a timetable, along with a copy of the parts of the cost for each day"""
+        self.table[genome_key] = (cost, {day: dict(parts) for day, parts in day_costs.items()})
+        self.table.move_to_end(genome_key)
+        if len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        """The proportion of lookups that found a stored cost"""
+        lookups = self.hits + self.misses
+        if not lookups:
+            return 0
+        return self.hits / lookups
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit rate': self.hit_rate,
+            'size': len(self),
+        }
+
+
+def describe(stats: dict) -> str:
+    """Returns a one line summary of the statistics of a cache (see FitnessCache.stats)"""
+    return f"{stats['hits']} hits, {stats['misses']} misses ({stats['hit rate']:.1%} hit rate, {stats['size']} stored)"
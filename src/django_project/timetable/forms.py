@@ -3,6 +3,7 @@ from django.contrib.auth.forms import AuthenticationForm, UsernameField
 from django import forms
 from django.utils.safestring import mark_safe
 
+from .engines import ENGINES
 from .fields import CustomModelChoiceField
 from .models import Group, User
 
@@ -55,3 +56,29 @@ class ScheduleForm(forms.Form):
             'value': '60'
         }),
         label=mark_safe(f"Duration (minutes): {buttons_html}"))
+
+
+class ScheduleJobForm(forms.Form):
+    """The days to schedule, and how, for a scheduling job started through the API (see jobs.py)"""
+    MAX_DAYS = 31
+
+    start = forms.DateField()
+    end = forms.DateField()
+    engine = forms.ChoiceField(choices=[(name, name) for name in ENGINES], required=False)
+    iterations = forms.IntegerField(min_value=1, max_value=32, required=False)
+    time_budget = forms.FloatField(min_value=1, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end:
+            if end < start:
+                raise forms.ValidationError("The end date cannot be before the start date")
+            if (end - start).days >= self.MAX_DAYS:
+                raise forms.ValidationError(f"At most {self.MAX_DAYS} days can be scheduled at once")
+        return cleaned_data
+
+    def get_options(self) -> dict:
+        """Returns the options to pass on to jobs.start_job, leaving out the ones that weren't given"""
+        return {name: self.cleaned_data[name] for name in ('engine', 'iterations', 'time_budget')
+                if self.cleaned_data.get(name) not in (None, '')}
@@ -0,0 +1,74 @@
+"""A compact representation of when every lesson in a timetable is scheduled"""
+
+from array import array
+from typing import List, Optional
+
+UNSCHEDULED = -1
+
+
+class Genome:
+    """The placements of every lesson that could be scheduled in a timetable
+
+    This is stored as two parallel integer arrays, indexed by each lesson's position in the list of lessons that could
+    be scheduled: days[i] is the day lesson i is scheduled on and starts[i] is its start time (in time units relative
+    to the start of the day). Both are UNSCHEDULED if lesson i is not scheduled"""
+
+    __slots__ = ('days', 'starts')
+
+    TYPECODE = 'h'  # signed short, which is large enough for both the day and start time
+
+    def __init__(self, size: int = 0, days: Optional[array] = None, starts: Optional[array] = None):
+        if days is None:
+            days = array(self.TYPECODE, [UNSCHEDULED]) * size
+        if starts is None:
+            starts = array(self.TYPECODE, [UNSCHEDULED]) * len(days)
+        self.days = days
+        self.starts = starts
+
+    def __len__(self):
+        return len(self.days)
+
+    def __eq__(self, other):
+        if isinstance(other, Genome):
+            return self.days == other.days and self.starts == other.starts
+        return NotImplemented
+
+    def __repr__(self):
+        return f"<Genome scheduled={len(self) - self.days.count(UNSCHEDULED)}/{len(self)}>"
+
+    def __getstate__(self):
+        return self.days, self.starts
+
+    def __setstate__(self, state):
+        self.days, self.starts = state
+
+    def copy(self) -> 'Genome':
+        return Genome(days=array(self.TYPECODE, self.days), starts=array(self.TYPECODE, self.starts))
+
+    def place(self, index: int, day: int, start: int):
+        """Schedules lesson index on the given day and start time, or unschedules it if day is UNSCHEDULED"""
+        if day == UNSCHEDULED:
+            start = UNSCHEDULED
+        self.days[index] = day
+        self.starts[index] = start
+
+    def scheduled(self, day: Optional[int] = None) -> List[int]:
+        """Returns the index of every lesson scheduled on the given day (or on any day if day is None)"""
+        days = self.days
+        if day is None:
+            return [i for i in range(len(days)) if days[i] != UNSCHEDULED]
+        return [i for i in range(len(days)) if days[i] == day]
+
+    def unscheduled(self) -> List[int]:
+        """Returns the index of every lesson that is not scheduled"""
+        days = self.days
+        return [i for i in range(len(days)) if days[i] == UNSCHEDULED]
+
+    def tobytes(self) -> bytes:
+        """Returns the placements as bytes, which are equal for two genomes of the same length if and only if they
+        are equal, so they can be used as a key (e.g. by FitnessCache) without any chance of a collision"""
+        return self.days.tobytes() + self.starts.tobytes()
+
+    def nbytes(self) -> int:
+        """Returns the memory used by the placements themselves, in bytes"""
+        return self.days.itemsize * len(self.days) + self.starts.itemsize * len(self.starts)
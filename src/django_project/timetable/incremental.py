@@ -0,0 +1,278 @@
+"""Fits a single new or changed lesson into days that have already been scheduled, without re-solving them
+
+The nightly solve (timetabling.schedule_lessons) skips days that already have lessons, so a lesson submitted by a
+teacher would otherwise wait until the first day after the look ahead period. Instead, reschedule() tries each
+weekday in the look ahead period that has been scheduled (and doesn't already have a lesson of the same group), in
+order, and puts the lesson in the first one where it fits without adding any clashes.
+
+Each day is loaded with one query for its lessons and one for their users, and when everyone is busy is kept in a
+DayOccupancy. The lesson is put at the start time that adds the fewest clashes. If that still clashes, a short local
+search moves it and the lessons it clashes with, but only the future lessons of groups that share a user (teacher or
+student) with it that were saved by the scheduler (timetabled), so lessons entered by hand and the rest of the school's
+timetable are never disturbed. Moves are penalised by how far they move a lesson, so lessons are only moved when that
+removes clashes, and by as little as possible.
+
+The search is bounded by a number of evaluations and a time limit, so the result is saved within a few seconds"""
+
+import datetime
+import math
+import random
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.db import transaction
+
+from .models import Lesson, Link, User
+from .occupancy import DayOccupancy
+from .participants import get_type_code
+from .timetabling import POINTS_PER_STUDENT_CLASH, POINTS_PER_TEACHER_CLASH, app
+
+NEW_LESSON = -1  # the key of the lesson being scheduled, if it doesn't have a start time yet
+MOVE_COST = 1  # cost per time unit a lesson is moved from its current start time
+
+
+class DayPlan:
+    """The lessons of a single day, with the start times of some of them allowed to change"""
+
+    def __init__(self, day: datetime.datetime, time_per_day: int):
+        self.day = day
+        self.time_per_day = time_per_day
+        self.teacher_clash_cost = POINTS_PER_TEACHER_CLASH
+        self.student_clash_cost = POINTS_PER_STUDENT_CLASH
+        self.occupancy = DayOccupancy()
+        self.users: Dict[int, Tuple[Tuple[int, ...], Tuple[int, ...]]] = {}  # {key: (user ids, user type codes)}
+        self.durations: Dict[int, int] = {}  # {key: time units}
+        self.starts: Dict[int, int] = {}  # {key: relative start}, for every lesson placed
+        self.original: Dict[int, int] = {}  # {key: relative start when loaded}, for the lessons that can be moved
+        self.movable: Set[int] = set()
+        self.moved = 0  # time units moved in total, over every movable lesson
+
+    def add(self, key: int, user_ids, user_types, start: int, duration: int, movable: bool = False):
+        self.users[key] = (tuple(user_ids), tuple(user_types))
+        self.durations[key] = duration
+        self.place(key, start)
+        if movable:
+            self.movable.add(key)
+            self.original[key] = start
+
+    def place(self, key: int, start: int):
+        """Puts a lesson at a new start time, keeping track of how far the movable lessons are from where they were"""
+        user_ids, user_types = self.users[key]
+        if key in self.starts:
+            self.occupancy.remove_lesson(key, user_ids)
+            if key in self.original:
+                self.moved -= abs(self.starts[key] - self.original[key])
+        self.occupancy.add_lesson(key, user_ids, user_types, start, self.durations[key])
+        self.starts[key] = start
+        if key in self.original:
+            self.moved += abs(start - self.original[key])
+
+    def get_clash_cost(self) -> int:
+        return self.occupancy.teacher_clashes * self.teacher_clash_cost \
+            + self.occupancy.student_clashes * self.student_clash_cost
+
+    def get_cost(self) -> float:
+        return self.get_clash_cost() + MOVE_COST * self.moved
+
+    def latest_start(self, key: int) -> int:
+        return self.time_per_day - self.durations[key]
+
+    def best_start(self, key: int) -> Tuple[int, float]:
+        """Tries every start time for the lesson, leaving it at the cheapest (the earliest, if several are as cheap)
+        Returns (start, cost)"""
+        best = None
+        for start in range(self.latest_start(key) + 1):
+            self.place(key, start)
+            cost = self.get_cost()
+            if best is None or cost < best[1]:
+                best = (start, cost)
+        self.place(key, best[0])
+        return best
+
+    def clashing(self) -> List[int]:
+        """Returns the movable lessons with at least one user who is clashing"""
+        clashing = []
+        for key in self.movable:
+            if any(self.occupancy.clashes.get(user_id) for user_id in self.users[key][0]):
+                clashing.append(key)
+        return clashing
+
+    def search(self, max_evaluations: int, deadline: float, target: int) -> int:
+        """Moves clashing lessons to their best start times until the cost of clashes is no more than target, or the
+        evaluations or time run out. Moves that don't make things worse are kept, so that the search can get past
+        plateaus. Leaves the layout with the fewest clashes found in place (moving lessons as little as possible),
+        returning the number of evaluations used"""
+        best, best_starts = (self.get_clash_cost(), self.moved), dict(self.starts)
+        evaluations = 0
+        while self.get_clash_cost() > target and evaluations < max_evaluations and time.monotonic() < deadline:
+            clashing = self.clashing()
+            if not clashing:
+                break  # the remaining clashes are between lessons that can't be moved
+            key = random.choice(clashing)
+            current_start, current_cost = self.starts[key], self.get_cost()
+            start, cost = self.best_start(key)
+            evaluations += self.latest_start(key) + 1
+            if start == current_start:
+                # already at its best, so it is moved somewhere random to get out of the local minimum
+                self.place(key, random.randint(0, self.latest_start(key)))
+            elif cost > current_cost:
+                self.place(key, current_start)
+            if (self.get_clash_cost(), self.moved) < best:
+                best, best_starts = (self.get_clash_cost(), self.moved), dict(self.starts)
+
+        for key, start in best_starts.items():
+            if self.starts[key] != start:
+                self.place(key, start)
+        return evaluations
+
+
+class IncrementalScheduler:
+    """Schedules single lessons into days that have already been scheduled (see reschedule)"""
+
+    def __init__(self, look_ahead_period: int = 14, time_limit: float = 2, max_evaluations: int = 20_000,
+                 time_per_day: int = 114, seconds_per_unit_time: float = 300,
+                 day_start=datetime.timedelta(hours=8, minutes=30), now: Optional[datetime.datetime] = None):
+        """
+        :param look_ahead_period: The number of days after today that the lesson can be put on
+        :param time_limit: The most seconds spent searching, over every day tried
+        :param max_evaluations: The most start times tried on each day
+        """
+        self.look_ahead_period = look_ahead_period
+        self.time_limit = time_limit
+        self.max_evaluations = max_evaluations
+        self.time_per_day = time_per_day
+        self.seconds_per_unit_time = seconds_per_unit_time
+        self.day_start = day_start
+        self.now = now or datetime.datetime.now(datetime.timezone.utc)
+
+    def get_relative_start(self, day: datetime.datetime, start: datetime.datetime) -> int:
+        return math.floor((start - day - self.day_start).total_seconds() / self.seconds_per_unit_time)
+
+    def get_start(self, day: datetime.datetime, relative_start: int) -> datetime.datetime:
+        return day + self.day_start + datetime.timedelta(seconds=relative_start * self.seconds_per_unit_time)
+
+    def get_relative_duration(self, lesson) -> int:
+        return math.ceil(lesson.duration.total_seconds() / self.seconds_per_unit_time)
+
+    def candidate_days(self, lesson: Lesson) -> List[datetime.datetime]:
+        """Returns the days the lesson could be put on: its own day if it already has a start time, otherwise every
+        weekday after today in the look ahead period that has lessons, but none of the lesson's group"""
+        if lesson.start is not None:
+            start = lesson.start.astimezone(datetime.timezone.utc)
+            return [datetime.datetime.combine(start.date(), datetime.time(), tzinfo=datetime.timezone.utc)]
+
+        today = datetime.datetime.combine(self.now.date(), datetime.time(), tzinfo=datetime.timezone.utc)
+        first_day = today + datetime.timedelta(days=1)
+        last_day = first_day + datetime.timedelta(days=self.look_ahead_period)
+        scheduled_days, group_days = set(), set()
+        for group_id, start in Lesson.objects.filter(start__gte=first_day, start__lt=last_day).values_list(
+                'group_id', 'start'):
+            scheduled_days.add(start.astimezone(datetime.timezone.utc).date())
+            if group_id == lesson.group_id:
+                group_days.add(start.astimezone(datetime.timezone.utc).date())
+        return [datetime.datetime.combine(date, datetime.time(), tzinfo=datetime.timezone.utc)
+                for date in sorted(scheduled_days - group_days) if date.weekday() <= 4]
+
+    def load_day(self, day: datetime.datetime, lesson: Lesson) -> DayPlan:
+        """Loads the lessons on the given day. The lesson being scheduled and the future timetabled lessons of every
+        group that shares a user with it can be moved, but lessons entered by hand never are"""
+        lessons = list(Lesson.objects.filter(start__gte=day, start__lt=day + datetime.timedelta(days=1)).exclude(
+            id=lesson.id).only('id', 'group_id', 'start', 'duration', 'timetabled').order_by('start', 'id'))
+        group_ids = {other.group_id for other in lessons} | {lesson.group_id}
+        group_users: Dict[int, Dict[int, int]] = {}  # {group id: {user id: type code}}, each user counted once
+        for group_id, user_id, user_type in Link.objects.filter(group_id__in=group_ids).values_list(
+                'group_id', 'user_id', 'user_id__user_type'):
+            group_users.setdefault(group_id, {})[user_id] = get_type_code(user_type)
+
+        involved = set(group_users.get(lesson.group_id, {}))
+        plan = DayPlan(day, self.time_per_day)
+        for other in lessons:
+            users = group_users.get(other.group_id, {})
+            relative_start = self.get_relative_start(day, other.start)
+            duration = self.get_relative_duration(other)
+            movable = other.timetabled and other.start > self.now and bool(involved & set(users)) \
+                and 0 <= relative_start <= self.time_per_day - duration
+            if relative_start < 0:  # starts before the school day, so only the part during the day is kept
+                duration += relative_start
+                relative_start = 0
+                if duration <= 0:
+                    continue
+            plan.add(other.id, users.keys(), users.values(), relative_start, duration, movable=movable)
+        return plan
+
+    def reschedule(self, lesson: Lesson) -> Optional[dict]:
+        """Finds a time for the lesson on one of its candidate days without adding any clashes, and saves it (and any
+        lessons that had to be moved) in one transaction. If the lesson already has a start time, it stays on the same
+        day. Returns what was changed, or None if the lesson couldn't be fitted in, in which case nothing is changed
+        and the lesson is left for the nightly solve:
+        {'day', 'start', 'moved': [(lesson id, old start, new start)], 'evaluations', 'seconds'}"""
+        started = time.monotonic()
+        deadline = started + self.time_limit
+        duration = self.get_relative_duration(lesson)
+        if duration > self.time_per_day or (lesson.start is not None and lesson.start <= self.now):
+            return None
+
+        users = {user_id: get_type_code(user_type) for user_id, user_type in
+                 User.objects.filter(link__group_id=lesson.group_id).values_list('id', 'user_type')}
+        evaluations = 0
+        for day in self.candidate_days(lesson):
+            if time.monotonic() >= deadline:
+                break
+            plan = self.load_day(day, lesson)
+            target = plan.get_clash_cost()  # the clashes already on the day, which mustn't get any worse
+            key = lesson.id if lesson.start is not None else NEW_LESSON
+            start = 0
+            if lesson.start is not None:
+                start = min(max(self.get_relative_start(day, lesson.start), 0), self.time_per_day - duration)
+            plan.add(key, users.keys(), users.values(), start, duration, movable=True)
+            if lesson.start is None:
+                plan.original.pop(key)  # a new lesson can go anywhere without counting as a move
+            plan.best_start(key)
+            evaluations += plan.latest_start(key) + 1
+            evaluations += plan.search(self.max_evaluations, deadline, target)
+            if plan.get_clash_cost() <= target:
+                return self.save(plan, lesson, key, evaluations, started)
+
+        return None
+
+    def save(self, plan: DayPlan, lesson: Lesson, key: int, evaluations: int, started: float) -> dict:
+        moved = [(other_id, self.get_start(plan.day, original), self.get_start(plan.day, plan.starts[other_id]))
+                 for other_id, original in plan.original.items()
+                 if other_id != key and plan.starts[other_id] != original]
+        with transaction.atomic():
+            # saved one at a time, so that the signals keep the group statistics up to date (see signals.py)
+            for other in Lesson.objects.filter(id__in=[other_id for other_id, old, new in moved]):
+                other.start = next(new for other_id, old, new in moved if other_id == other.id)
+                other.save(update_fields=['start'])
+            lesson.start = self.get_start(plan.day, plan.starts[key])
+            lesson.fixed = True
+            lesson.save()
+
+        return {
+            'day': plan.day.date().isoformat(),
+            'start': lesson.start,
+            'moved': moved,
+            'evaluations': evaluations,
+            'seconds': time.monotonic() - started,
+        }
+
+
+def reschedule(lesson: Lesson, **kwargs) -> Optional[dict]:
+    """Fits the lesson into a day that has already been scheduled (see IncrementalScheduler.reschedule). The keyword
+    arguments are passed on to IncrementalScheduler"""
+    return IncrementalScheduler(**kwargs).reschedule(lesson)
+
+
+@app.task
+def reschedule_lesson(lesson_id: int):
+    """Fits a lesson that a teacher has just submitted into the days that have already been scheduled, if it can be
+    done without adding clashes. Otherwise it is left for the nightly solve"""
+    lesson = Lesson.objects.filter(id=lesson_id).first()
+    if lesson is None:
+        return
+    result = reschedule(lesson)
+    if result is None:
+        print(f"Lesson {lesson_id} left for the nightly solve")
+    else:
+        print(f"Lesson {lesson_id} scheduled for {result['start']}, moving {len(result['moved'])} other lessons "
+              f"({result['evaluations']} evaluations in {result['seconds']:.2f}s)")
@@ -0,0 +1,259 @@
+"""An island model for the genetic algorithm
+
+Several populations ('islands') evolve at the same time in separate processes. Every few generations, each island
+sends copies of its best timetables to its neighbours, which replace their worst ones. This lets good solutions
+spread between islands while keeping them diverse
+
+If the model is given a monitor (e.g. a jobs.JobMonitor), each island reports its best cost after every generation to
+the parent process, which alone tells the monitor about the best cost of any island. When the monitor says to stop,
+the parent tells every island to stop"""
+
+import datetime
+import pickle
+import queue
+import random
+import traceback
+from typing import List, Optional
+
+from . import processes
+
+TOPOLOGIES = ('ring', 'bidirectional ring', 'complete', 'random')
+PROGRESS = 'progress'  # the kinds of message islands put in the results queue
+RESULT = 'result'
+POLL_INTERVAL = 1  # the longest the parent waits for a message before checking whether to stop, in seconds
+
+
+def get_neighbours(index: int, islands: int, topology: str = 'ring') -> List[int]:
+    """Returns the islands that the given island sends its migrants to"""
+    others = [i for i in range(islands) if i != index]
+    if not others:
+        return []
+    if topology == 'ring':
+        return [(index + 1) % islands]
+    elif topology == 'bidirectional ring':
+        return sorted({(index - 1) % islands, (index + 1) % islands})
+    elif topology == 'complete':
+        return others
+    elif topology == 'random':
+        return [random.choice(others)]
+    else:
+        raise ValueError(f"Unknown migration topology '{topology}'. Choose from {TOPOLOGIES}")
+
+
+def make_population(payload: bytes, index: int):
+    """Creates the population for an island
+    The payload is pickled by the parent process, so that Django can be set up before it is unpickled (it contains
+    Django model instances)"""
+    from django.apps import apps
+    if not apps.ready:
+        import django
+        django.setup()
+    from .timetabling import Population
+
+    population_kwargs = pickle.loads(payload)
+    if population_kwargs.get('seed') is not None:
+        population_kwargs['seed'] += index  # otherwise every island would be the same
+    return Population(**population_kwargs)
+
+
+def evolve(population, index, islands, migration_interval, migration_size, topology, send, receive):
+    """Evolves an island's population, exchanging migrants with the other islands every migration_interval
+    generations. This is a generator, yielding after every generation, so several islands can share one process
+    send(island index, migrants) and receive() -> [migrants] are used to communicate with the other islands"""
+    for generation in population.evolve():
+        if migration_interval and migration_size and generation % migration_interval == 0:
+            migrants = population.get_emigrants(migration_size)
+            for neighbour in get_neighbours(index, islands, topology):
+                send(neighbour, migrants)
+            for migrants in receive():
+                population.immigrate(migrants)
+        yield generation
+
+
+def get_best_cost(population) -> float:
+    return min(timetable.get_cost() for timetable in population.population)
+
+
+def run_island(payload, index, islands, migration_interval, migration_size, topology, inboxes, results, stop):
+    """The entry point of each island's process
+    Puts (PROGRESS, index, generation, best cost) into the results queue after every generation, and (RESULT, index,
+    pickled best timetable, fitness cache statistics, error message) when finished. Stops early once stop (an Event)
+    is set"""
+    try:
+        population = make_population(payload, index)
+
+        def send(neighbour, migrants):
+            inboxes[neighbour].put(migrants)
+
+        def receive():
+            # migration is asynchronous, so that no island ever has to wait for another
+            received = []
+            while True:
+                try:
+                    received.append(inboxes[index].get_nowait())
+                except queue.Empty:
+                    return received
+
+        for generation in evolve(population, index, islands, migration_interval, migration_size, topology,
+                                 send, receive):
+            results.put((PROGRESS, index, generation, get_best_cost(population)))
+            if stop.is_set():
+                break
+
+        results.put((RESULT, index, pickle.dumps(get_result(population)), get_cache_stats(population), None))
+    except Exception:
+        results.put((RESULT, index, None, None, traceback.format_exc()))
+
+
+def get_result(population):
+    """Returns the best timetable of a population, without anything that is only needed while evolving"""
+    best = population.select_best_solution()
+    best.fitness_cache = None
+    best.set_cost(best.cost, best.day_costs)
+    return best
+
+
+def get_cache_stats(population) -> Optional[dict]:
+    """Returns the statistics of a population's fitness cache (see FitnessCache.stats), or None if it has none"""
+    if population.fitness_cache is None:
+        return None
+    return population.fitness_cache.stats()
+
+
+class IslandModel:
+    """Runs several populations at the same time in separate processes, with migration between them"""
+
+    def __init__(self, islands: int = 10, migration_interval: int = 10, migration_size: int = 2,
+                 topology: str = 'ring', monitor=None, **population_kwargs):
+        """
+        :param islands: The number of populations, each of which is evolved in its own process
+        :param migration_interval: The number of generations between migrations. Set to 0 to disable migration
+        :param migration_size: The number of timetables each island sends to each of its neighbours
+        :param topology: Which islands send migrants to each other. One of TOPOLOGIES
+        :param monitor: Called by this process only, as monitor.report(generation, best cost of any island) after
+         every island's generations, returning True to stop every island (see jobs.JobMonitor)
+        :param population_kwargs: Passed on to every Population. If no context is given, one is loaded from the
+         database once, and shared between all the islands
+        """
+        if islands < 1:
+            raise ValueError("There must be at least one island")
+        if topology not in TOPOLOGIES:
+            raise ValueError(f"Unknown migration topology '{topology}'. Choose from {TOPOLOGIES}")
+
+        self.islands = islands
+        self.migration_interval = migration_interval
+        self.migration_size = migration_size
+        self.topology = topology
+        self.monitor = monitor
+        self.population_kwargs = population_kwargs
+        self.results = []  # the best timetable from each island, once finished
+        self.cache_stats = []  # the statistics of each island's fitness cache (or None), once finished
+
+    def load_data(self):
+        """Loads everything the populations need from the database, so that the islands don't have to"""
+        from .catalogue import LessonCatalogue
+        from .context import SchedulingContext
+
+        kwargs = dict(self.population_kwargs)
+        if not kwargs.get('first_day'):
+            kwargs['first_day'] = datetime.datetime.now(datetime.timezone.utc)  # so every island uses the same day
+        needed = ('unscheduled_lessons', 'group_data', 'all_students', 'year_start')
+        if kwargs.get('context') is None and any(kwargs.get(key) is None for key in needed):
+            kwargs['context'] = SchedulingContext.load(kwargs['first_day'], kwargs.get('days', 1),
+                                                       kwargs.get('seconds_per_unit_time', 300),
+                                                       kwargs.get('year_start'))
+        if kwargs.get('unscheduled_lessons') is not None:
+            kwargs['unscheduled_lessons'] = LessonCatalogue.from_lessons(kwargs['unscheduled_lessons'])
+        return kwargs
+
+    def start(self):
+        """Evolves every island and returns the best timetable found on any of them"""
+        payload = pickle.dumps(self.load_data())
+        self.results = self.run_in_parallel(payload)
+
+        return min(self.results, key=lambda t: t.get_cost())
+
+    def run_in_parallel(self, payload):
+        """Runs every island in its own process, started with billiard inside a celery prefork worker (see
+        processes.py)"""
+        from django.db import connections
+        connections.close_all()  # database connections must not be shared with the new processes
+
+        context = processes.get_context()
+        inboxes = [context.Queue() for i in range(self.islands)]
+        results = context.Queue()
+        stop = context.Event()
+        workers = [context.Process(target=run_island,
+                                   args=(payload, i, self.islands, self.migration_interval, self.migration_size,
+                                         self.topology, inboxes, results, stop))
+                   for i in range(self.islands)]
+        for process in workers:
+            process.start()
+
+        best = [None] * self.islands
+        self.cache_stats = [None] * self.islands
+        errors = []
+        finished = 0
+        while finished < self.islands:
+            try:
+                message = results.get(timeout=POLL_INTERVAL)
+            except queue.Empty:  # no island has finished a generation lately, but the job may still be cancelled
+                if self.monitor is not None and self.monitor.cancelled():
+                    stop.set()
+                continue
+            if message[0] == PROGRESS:
+                kind, index, generation, cost = message
+                if self.monitor is not None and self.monitor.report(generation, cost):
+                    stop.set()
+                continue
+
+            kind, index, result, cache_stats, error = message
+            finished += 1
+            if error:
+                errors.append(f"Island {index}:\n{error}")
+            else:
+                best[index] = pickle.loads(result)
+                self.cache_stats[index] = cache_stats
+
+        for process in workers:
+            process.join()
+        for inbox in inboxes:
+            inbox.cancel_join_thread()  # any migrants left over are no longer needed
+
+        if errors:
+            raise RuntimeError("Island failed\n" + '\n'.join(errors))
+
+        return best
+
+    def run_in_turn(self, payload):
+        """Runs every island in this process, one generation at a time"""
+        populations = [make_population(payload, i) for i in range(self.islands)]
+        inboxes = [[] for i in range(self.islands)]
+
+        def send(neighbour, migrants):
+            inboxes[neighbour].append(migrants)
+
+        generators = []
+        for i, population in enumerate(populations):
+            def receive(i=i):
+                received = list(inboxes[i])
+                inboxes[i].clear()
+                return received
+
+            generators.append(evolve(population, i, self.islands, self.migration_interval, self.migration_size,
+                                     self.topology, send, receive))
+
+        while generators:
+            for generator in list(generators):
+                try:
+                    generation = next(generator)
+                except StopIteration:
+                    generators.remove(generator)
+                    continue
+                cost = min(get_best_cost(population) for population in populations)
+                if self.monitor is not None and self.monitor.report(generation, cost):
+                    generators.clear()
+                    break
+
+        self.cache_stats = [get_cache_stats(population) for population in populations]
+        return [get_result(population) for population in populations]
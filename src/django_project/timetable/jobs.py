@@ -0,0 +1,180 @@
+"""Runs the scheduler in the background on request, with its progress stored in the Django cache
+
+    job_id = start_job(datetime.date(2030, 1, 7), datetime.date(2030, 1, 11), time_budget=600)
+    get_job(job_id)  # {'status': 'running', 'day': '2030-01-08', 'generation': 40, 'best_cost': ..., ...}
+    cancel_job(job_id)
+
+start_job only queues the run_job Celery task, so it returns straight away and the solve happens in a worker. While
+it runs, JobMonitor (which is added to every day's stopping condition) stores the current day, generation, best cost
+and an estimate of the seconds left, and stops the search once the job has been cancelled. The days already scheduled
+are kept, but the day being scheduled when the job is cancelled is not saved.
+
+Progress is only stored every PROGRESS_INTERVAL seconds, so that checking it costs almost nothing. The local search
+engines count a fixed number of moves as a generation (see engines.py), so they report progress and are cancelled in
+the same way as the genetic algorithm.
+
+The cache must be shared between the web server and the workers, which is why settings.CACHES uses the database
+cache (its table is created by `python manage.py createcachetable`) rather than the default local memory cache, which
+is separate in every process"""
+
+import datetime
+import time
+import traceback
+import uuid
+from typing import List, Optional
+
+from django.core.cache import cache
+
+from .engines import get_engine
+from .stopping import StoppingCondition
+from .timetabling import app, schedule_lessons
+
+JOB_TIMEOUT = 7 * 24 * 60 * 60  # how long a job's progress is kept after it was last updated
+PROGRESS_INTERVAL = 1  # the most often progress is stored, in seconds
+EXPECTED_GENERATIONS = 100  # generations per day without a time budget, as in timetabling.should_stop
+
+QUEUED = 'queued'
+RUNNING = 'running'
+FINISHED = 'finished'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+
+def job_key(job_id: str) -> str:
+    return f"timetable-job:{job_id}"
+
+
+def cancel_key(job_id: str) -> str:
+    # kept apart from the progress, so that cancelling doesn't race with the worker updating it
+    return f"timetable-job:{job_id}:cancel"
+
+
+def start_job(start: datetime.date, end: datetime.date, **options) -> str:
+    """Queues a job to schedule the weekdays from start to end (inclusive) that don't have any lessons yet, returning
+    its id. The options are passed on to schedule_lessons, e.g. iterations, time_budget or engine"""
+    if end < start:
+        raise ValueError("The end of the date range cannot be before its start")
+    get_engine(options.get('engine', 'ga'))  # so that an unknown engine is reported now rather than by the worker
+
+    job_id = uuid.uuid4().hex
+    cache.set(job_key(job_id), {
+        'id': job_id,
+        'status': QUEUED,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'options': options,
+        'created': time.time(),
+        'updated': time.time(),
+    }, JOB_TIMEOUT)
+    try:
+        run_job.delay(job_id, start.isoformat(), end.isoformat(), **options)
+    except Exception as error:  # e.g. the broker is down
+        update_job(job_id, status=FAILED, error=f"Unable to queue the job ({error})")
+        raise
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Returns the job's progress, or None if there is no such job (or it finished more than JOB_TIMEOUT ago)"""
+    job = cache.get(job_key(job_id))
+    if job is not None and job['status'] in (QUEUED, RUNNING):
+        job['cancelling'] = bool(cache.get(cancel_key(job_id)))
+    return job
+
+
+def cancel_job(job_id: str) -> bool:
+    """Asks the job to stop, returning False if it has already stopped (or doesn't exist)"""
+    job = cache.get(job_key(job_id))
+    if job is None or job['status'] not in (QUEUED, RUNNING):
+        return False
+    cache.set(cancel_key(job_id), True, JOB_TIMEOUT)
+    return True
+
+
+def update_job(job_id: str, **changes) -> dict:
+    job = cache.get(job_key(job_id)) or {'id': job_id}
+    job.update(changes, updated=time.time())
+    cache.set(job_key(job_id), job, JOB_TIMEOUT)
+    return job
+
+
+@app.task
+def run_job(job_id: str, start: str, end: str, **options):
+    """Schedules the days of a job queued by start_job, storing its progress as it goes"""
+    monitor = JobMonitor(job_id, time_budget=options.get('time_budget'))
+    try:
+        schedule_lessons(start=datetime.date.fromisoformat(start), end=datetime.date.fromisoformat(end),
+                         monitor=monitor, **options)
+    except Exception:
+        update_job(job_id, status=FAILED, error=traceback.format_exc())
+        raise
+    update_job(job_id, status=CANCELLED if monitor.days_done < monitor.days else FINISHED, eta_seconds=0)
+
+
+class JobMonitor(StoppingCondition):
+    """Stores a job's progress and stops it once cancelled. schedule_lessons tells it about each day (start, start_day
+    and end_day). A local search engine has it in its stopping condition to hear about each generation, while an
+    IslandModel tells it (via report) about the best cost of any island from the parent process, so that only one
+    process ever writes the job's progress"""
+
+    def __init__(self, job_id: str, time_budget: Optional[float] = None):
+        self.job_id = job_id
+        self.time_budget = time_budget
+        self.days = 0
+        self.days_done = 0
+        self.started = time.monotonic()
+        self.last_update = 0
+        self.best_cost = None  # the best cost found so far on the current day
+        self.generation = 0
+        self.stop = False
+
+    def start(self, days: List[datetime.datetime]):
+        self.days = len(days)
+        self.started = time.monotonic()
+        update_job(self.job_id, status=RUNNING, days=[day.date().isoformat() for day in days], days_done=0,
+                   results=[])
+
+    def start_day(self, day: datetime.datetime):
+        self.best_cost = None
+        self.generation = 0
+        self.update(day=day.date().isoformat(), generation=0, best_cost=None)
+
+    def end_day(self, cost: float):
+        self.days_done += 1
+        self.generation = 0
+        job = cache.get(job_key(self.job_id)) or {}
+        results = job.get('results', []) + [{'day': job.get('day'), 'cost': cost}]
+        self.update(days_done=self.days_done, results=results, best_cost=cost)
+
+    def cancelled(self) -> bool:
+        if not self.stop:
+            self.stop = bool(cache.get(cancel_key(self.job_id)))
+        return self.stop
+
+    def get_eta(self) -> Optional[float]:
+        """Estimates the seconds left, from the time budget if there is one, or from the time taken so far"""
+        elapsed = time.monotonic() - self.started
+        if self.time_budget is not None:
+            return max(self.time_budget - elapsed, 0)
+        done = (self.days_done + min(self.generation / EXPECTED_GENERATIONS, 1)) / max(self.days, 1)
+        return elapsed * (1 - done) / done if done else None
+
+    def update(self, **changes):
+        self.last_update = time.monotonic()
+        update_job(self.job_id, eta_seconds=self.get_eta(), **changes)
+
+    def report(self, generations: int, cost: float) -> bool:
+        """Records the progress of the search, storing it every PROGRESS_INTERVAL seconds. Returns True to stop"""
+        if self.best_cost is None or cost < self.best_cost:
+            self.best_cost = cost
+        self.generation = max(self.generation, generations)
+        if time.monotonic() - self.last_update >= PROGRESS_INTERVAL:
+            self.update(generation=self.generation, best_cost=self.best_cost)
+            return self.cancelled()
+        return self.stop
+
+    def __call__(self, population, generations):
+        return self.report(generations, self.get_best_cost(population))
+
+    def __repr__(self):
+        return f"<JobMonitor {self.job_id}>"
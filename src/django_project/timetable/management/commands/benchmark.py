@@ -0,0 +1,58 @@
+import datetime
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from timetable import benchmark, synthetic
+from timetable.crossover import CROSSOVERS
+from timetable.engines import ENGINES
+
+
+class Command(BaseCommand):
+    help = "Runs each engine on made-up schools of each size, or on the lessons in the database for a day, and " \
+           "reports the results as JSON (see benchmark.py). Nothing is left in the database afterwards"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(synthetic.SIZES),
+                            help="The sizes of school to create (default: small, unless --day is given)")
+        parser.add_argument('--day', type=datetime.date.fromisoformat, default=None,
+                            help="Also runs the engines on the lessons in the database that need scheduling on this "
+                                 "day, as YYYY-MM-DD")
+        parser.add_argument('--engine', '--engines', dest='engines', nargs='+', default=list(ENGINES),
+                            choices=list(ENGINES), help="The engines to run (default: all of them)")
+        parser.add_argument('--seed', type=int, default=0,
+                            help="Seeds both the school generator and the engines")
+        parser.add_argument('--generations', type=int, default=100,
+                            help="The number of generations the genetic algorithm runs for")
+        parser.add_argument('--evaluations', type=int, default=20_000,
+                            help="The number of evaluations each local search runs for")
+        parser.add_argument('--crossovers', nargs='+', choices=list(CROSSOVERS),
+                            help="Runs the genetic algorithm once with each of these crossover operators")
+        parser.add_argument('--no-memory', action='store_true',
+                            help="Don't measure peak memory, which slows the engines down")
+        parser.add_argument('--output', help="Writes the results to this file instead of standard output")
+
+    def handle(self, *args, **options):
+        sizes = options['sizes'] or ([] if options['day'] else ['small'])
+        try:
+            results = benchmark.run_suite(sizes, options['engines'], seed=options['seed'], day=options['day'],
+                                          generations=options['generations'], evaluations=options['evaluations'],
+                                          trace_memory=not options['no_memory'], crossovers=options['crossovers'])
+        except ValueError as error:  # e.g. there is nothing to schedule on the day
+            raise CommandError(error)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        # a summary, including how many evaluations each engine took to do as well as the genetic algorithm
+        for row in benchmark.summarise(results):
+            engine = f"{row['engine']}:{row['crossover']}" if 'crossover' in row else row['engine']
+            reached = row['evaluations_to_reach_ga']
+            self.stderr.write(f"{row['size']:<10}{engine:<14}cost {row['best_cost']:.2f}, "
+                              f"{row['evaluations_per_second']:.0f} evaluations/s in {row['seconds']:.1f}s, "
+                              f"{'-' if reached is None else reached} evaluations to reach the genetic algorithm")
+        if options['output']:
+            self.stderr.write(f"Results written to {options['output']}")
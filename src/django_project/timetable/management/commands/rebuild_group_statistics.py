@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from timetable import statistics
+
+
+class Command(BaseCommand):
+    help = "Recalculates the stored lesson statistics of every group from scratch, then checks them against the " \
+           "statistics calculated directly from every lesson"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help="Only check the stored statistics, without rebuilding them first")
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            statistics.rebuild()
+            self.stdout.write("Rebuilt group statistics")
+
+        differences = statistics.verify()
+        for difference in differences:
+            self.stderr.write(difference)
+        if differences:
+            raise CommandError(f"{len(differences)} group(s) have incorrect statistics")
+        self.stdout.write(self.style.SUCCESS("Group statistics are correct"))
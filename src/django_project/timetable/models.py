@@ -1,3 +1,5 @@
+import datetime
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django_project import settings
@@ -44,3 +46,16 @@ class Lesson(models.Model):
     topic = models.CharField(max_length=128, default='', null=True)
     start = models.DateTimeField(null=True, blank=True, default=None)
     fixed = models.BooleanField(default=False)
+    timetabled = models.BooleanField(default=False)  # saved by the scheduler, which only ever replaces these
+
+
+class GroupStatistics(models.Model):
+    """Totals over every lesson of a group that has a start time, kept up to date as lessons are saved and deleted
+    (see statistics.py), so that they don't need to be recalculated from every lesson each time"""
+    group = models.OneToOneField(
+        'Group',
+        on_delete=models.CASCADE,
+        related_name='statistics'
+    )
+    lesson_time = models.DurationField(default=datetime.timedelta)
+    last_lesson_start = models.DateTimeField(null=True, blank=True, default=None)
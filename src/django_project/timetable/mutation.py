@@ -0,0 +1,138 @@
+"""Adapts how offspring are mutated to the moves that have been working
+
+Timetable.mutate makes a fixed number of moves per day, each chosen with equal probability from moving a lesson to a
+new start time, removing a lesson, or adding one (see Timetable.propose_move). AdaptiveMutation instead keeps track
+of how often the children each kind of move was used in turn out better than both their parents, and after every
+generation:
+ - shifts the probability of each kind of move towards the one that has been working best, using adaptive pursuit
+   (Thierens, 2005): every kind keeps at least min_probability, so none are ever ruled out completely
+ - changes the number of moves per day using the 1/5th success rule: if more than a fifth of children were better
+   than their parents, bigger changes are made, otherwise smaller ones"""
+
+import random
+from typing import Dict, List, Optional, Tuple
+
+MOVE = 1
+REMOVE = 2
+ADD = 3
+MOVE_NAMES = {MOVE: 'move', REMOVE: 'remove', ADD: 'add'}
+
+
+class AdaptiveMutation:
+    """Chooses how to mutate each child, learning from how well the children of previous generations did
+    Each population needs its own, as it keeps track of the children that have not been evaluated yet"""
+
+    def __init__(self, strength: float = 3, min_strength: float = 1, max_strength: float = 20,
+                 learning_rate: float = 0.3, adaptation_rate: float = 0.3, min_probability: float = 0.1,
+                 step_factor: float = 0.85, target_success_rate: float = 0.2):
+        """
+        :param strength: The number of moves per day to start with
+        :param learning_rate: How quickly the estimated quality of each kind of move follows its latest success rate
+        :param adaptation_rate: How quickly the probabilities move towards favouring the best kind of move
+        :param min_probability: The lowest probability any kind of move can have
+        :param step_factor: What the strength is multiplied by when too few children succeed (and divided by when
+         too many do)
+        :param target_success_rate: The proportion of successful children the strength is adjusted towards
+        """
+        if not 0 <= min_probability * len(MOVE_NAMES) <= 1:
+            raise ValueError(f"Minimum probability must be between 0 and {1 / len(MOVE_NAMES)}")
+        if not 0 < step_factor < 1:
+            raise ValueError("Step factor must be between 0 and 1")
+        self.strength = strength
+        self.min_strength = min_strength
+        self.max_strength = max_strength
+        self.learning_rate = learning_rate
+        self.adaptation_rate = adaptation_rate
+        self.min_probability = min_probability
+        self.max_probability = 1 - (len(MOVE_NAMES) - 1) * min_probability
+        self.step_factor = step_factor
+        self.target_success_rate = target_success_rate
+
+        self.probabilities: Dict[int, float] = {kind: 1 / len(MOVE_NAMES) for kind in MOVE_NAMES}
+        self.quality: Dict[int, float] = {kind: 0.0 for kind in MOVE_NAMES}  # the estimated success rate of each
+        self.applied: Dict[int, int] = {kind: 0 for kind in MOVE_NAMES}  # moves made in total
+        # children weighted by the share of their moves of each kind, in total and for just the successful ones
+        self.shares: Dict[int, float] = {kind: 0.0 for kind in MOVE_NAMES}
+        self.successes: Dict[int, float] = {kind: 0.0 for kind in MOVE_NAMES}
+        self.children = 0
+        self.successful_children = 0
+        self.pending: List[Tuple[object, Dict[int, int], float]] = []  # [(child, {kind: moves}, best parent's cost)]
+
+    def __repr__(self):
+        return f"<AdaptiveMutation strength={self.strength:.2f} " + ' '.join(
+            f"{MOVE_NAMES[kind]}={probability:.2f}" for kind, probability in self.probabilities.items()) + '>'
+
+    def choose_kind(self) -> int:
+        kinds = list(self.probabilities)
+        return random.choices(kinds, weights=[self.probabilities[kind] for kind in kinds])[0]
+
+    def mutate(self, child, parent1, parent2):
+        """Mutates the child, remembering which moves were made so that update can tell how well they did"""
+        moves_per_day = max(int(round(self.strength)), 1)
+        counts = {}
+        for day in range(child.days):
+            for x in range(moves_per_day):
+                kind = self.choose_kind()
+                move = child.propose_move(day, kind)
+                if move is not None:
+                    child.move_lesson(*move)
+                    counts[kind] = counts.get(kind, 0) + 1
+        self.pending.append((child, counts, min(parent1.get_cost(), parent2.get_cost())))
+        return child
+
+    def update(self):
+        """Learns from the children mutated since the last update, which must all have been evaluated"""
+        if not self.pending:
+            return
+
+        shares = {kind: 0.0 for kind in MOVE_NAMES}  # as self.shares and self.successes, for this generation only
+        successes = {kind: 0.0 for kind in MOVE_NAMES}
+        successful = 0
+        for child, counts, parent_cost in self.pending:
+            success = child.get_cost() < parent_cost
+            successful += success
+            total = sum(counts.values())
+            for kind, count in counts.items():
+                shares[kind] += count / total
+                successes[kind] += success * count / total
+                self.applied[kind] += count
+        for kind in MOVE_NAMES:
+            self.shares[kind] += shares[kind]
+            self.successes[kind] += successes[kind]
+        self.children += len(self.pending)
+        self.successful_children += successful
+
+        # adaptive pursuit
+        for kind in MOVE_NAMES:
+            if shares[kind]:
+                self.quality[kind] += self.learning_rate * (successes[kind] / shares[kind] - self.quality[kind])
+        best = max(MOVE_NAMES, key=lambda kind: self.quality[kind])
+        for kind in MOVE_NAMES:
+            target = self.max_probability if kind == best else self.min_probability
+            self.probabilities[kind] += self.adaptation_rate * (target - self.probabilities[kind])
+
+        # 1/5th success rule
+        if successful / len(self.pending) > self.target_success_rate:
+            self.strength = min(self.strength / self.step_factor, self.max_strength)
+        else:
+            self.strength = max(self.strength * self.step_factor, self.min_strength)
+
+        self.pending = []
+
+    def success_rate(self, kind: Optional[int] = None) -> float:
+        """Returns the proportion of children that were better than their parents. If a kind of move is given, each
+        child counts in proportion to the share of its moves that were of that kind"""
+        if kind is None:
+            return self.successful_children / self.children if self.children else 0
+        return self.successes[kind] / self.shares[kind] if self.shares[kind] else 0
+
+    def stats(self) -> dict:
+        """Returns the current probabilities and strength, and how successful each kind of move has been"""
+        return {
+            'strength': self.strength,
+            'children': self.children,
+            'success rate': self.success_rate(),
+            'moves': {MOVE_NAMES[kind]: {'probability': self.probabilities[kind], 'quality': self.quality[kind],
+                                         'applied': self.applied[kind], 'success rate': self.success_rate(kind)}
+                      for kind in MOVE_NAMES},
+        }
@@ -0,0 +1,124 @@
+"""Keeps track of when each user is busy, using bitmasks so the cost function can be evaluated quickly"""
+
+from typing import Dict, Sequence, Tuple
+
+from .participants import TEACHER
+
+try:
+    popcount = int.bit_count
+except AttributeError:  # int.bit_count was only added in python 3.10
+    def popcount(n: int) -> int:
+        return bin(n).count('1')
+
+
+def lesson_mask(start: int, duration: int) -> int:
+    """Returns a bitmask with a bit set for every time unit the lesson takes up"""
+    return ((1 << duration) - 1) << start
+
+
+class DayOccupancy:
+    """Represents when every user is busy on a single day
+
+    Each user's day is stored as an integer bitmask, where bit n is set if they are busy during time unit n.
+    This means clashes, total workload and finish times can all be found using bitwise operations, rather than
+    checking every time unit individually"""
+
+    __slots__ = ('masks', 'user_types', 'clashes', 'lessons', 'teacher_clashes', 'student_clashes')
+
+    def __init__(self):
+        self.masks: Dict[int, int] = {}  # {user_id: bitmask}
+        self.user_types: Dict[int, int] = {}  # {user_id: user type code (see participants.py)}
+        self.clashes: Dict[int, int] = {}  # {user_id: time units clashed}
+        self.lessons: Dict[int, Dict[int, Tuple[int, int]]] = {}  # {user_id: {key: (start, duration)}}, only for
+        # lessons added with add_lesson
+        self.teacher_clashes = 0
+        self.student_clashes = 0
+
+    def copy(self) -> 'DayOccupancy':
+        """Returns an independent copy, which can be changed without affecting this one"""
+        other = DayOccupancy()
+        other.masks = dict(self.masks)
+        other.user_types = dict(self.user_types)
+        other.clashes = dict(self.clashes)
+        other.lessons = {user_id: dict(lessons) for user_id, lessons in self.lessons.items()}
+        other.teacher_clashes = self.teacher_clashes
+        other.student_clashes = self.student_clashes
+        return other
+
+    def add(self, user_id: int, user_type: int, start: int, duration: int) -> int:
+        """Marks the user as busy for the given lesson
+        Returns the number of time units that clashed with something the user was already doing"""
+        new = lesson_mask(start, duration)
+        mask = self.masks.get(user_id, 0)
+        clashes = popcount(mask & new)
+        self.masks[user_id] = mask | new
+        self.user_types[user_id] = user_type
+        self.clashes[user_id] = self.clashes.get(user_id, 0) + clashes
+
+        if user_type == TEACHER:
+            self.teacher_clashes += clashes
+        else:
+            self.student_clashes += clashes
+
+        return clashes
+
+    def add_lesson(self, key: int, user_ids: Sequence[int], user_types: Sequence[int], start: int,
+                   duration: int) -> int:
+        """Marks every user in a lesson as busy, returning the total number of time units that clashed
+        The key identifies the lesson (e.g. its position in Timetable.catalogue), so that it can be removed later.
+        user_types holds the type code of each user (see participants.py)"""
+        clashes = 0
+        for user_id, user_type in zip(user_ids, user_types):
+            clashes += self.add(user_id, user_type, start, duration)
+            self.lessons.setdefault(user_id, {})[key] = (start, duration)
+        return clashes
+
+    def remove_lesson(self, key: int, user_ids: Sequence[int]):
+        """Marks every user in a lesson as no longer busy for it
+        The lesson must have been added with add_lesson, using the same key"""
+        for user_id in user_ids:
+            lessons = self.lessons[user_id]
+            start, duration = lessons.pop(key)
+            if self.clashes[user_id] or not lessons:
+                self.update_user(user_id)
+            else:  # none of the user's lessons overlap, so the lesson's time units are only used by it
+                self.masks[user_id] ^= lesson_mask(start, duration)
+
+    def update_user(self, user_id: int):
+        """Recalculates a user's day from their lessons, e.g. after one of them has been removed
+        Users who no longer have any lessons are removed entirely"""
+        if self.user_types.get(user_id) == TEACHER:
+            self.teacher_clashes -= self.clashes.pop(user_id, 0)
+        else:
+            self.student_clashes -= self.clashes.pop(user_id, 0)
+
+        lessons = self.lessons.get(user_id)
+        if not lessons:
+            self.masks.pop(user_id, None)
+            self.user_types.pop(user_id, None)
+            self.lessons.pop(user_id, None)
+            return
+
+        mask = 0
+        total = 0
+        for start, duration in lessons.values():
+            mask |= lesson_mask(start, duration)
+            total += duration
+        # every time unit spent in more than one lesson at once is a clash, regardless of the order they were added
+        clashes = total - popcount(mask)
+
+        self.masks[user_id] = mask
+        self.clashes[user_id] = clashes
+        if self.user_types[user_id] == TEACHER:
+            self.teacher_clashes += clashes
+        else:
+            self.student_clashes += clashes
+
+    def load(self, user_id: int) -> int:
+        """Returns the number of time units the user is busy for
+        Overlapping lessons only count once, as the user can only attend one of them"""
+        return popcount(self.masks.get(user_id, 0))
+
+    def last_slot(self, user_id: int) -> int:
+        """Returns the final time unit the user is busy for, or -1 if they are not busy at all"""
+        return self.masks.get(user_id, 0).bit_length() - 1
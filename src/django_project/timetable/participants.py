@@ -0,0 +1,81 @@
+"""An index of who takes part in each lesson, built once per solve so the cost function never needs to query the
+database
+
+Users are stored as integer ids and their types as small integer codes in arrays, rather than as User objects"""
+
+from array import array
+from typing import Dict, Iterable, Tuple
+
+STUDENT = 0
+TEACHER = 1
+OTHER = 2
+USER_TYPES = {'student': STUDENT, 'teacher': TEACHER}
+
+
+def get_type_code(user_type: str) -> int:
+    """Returns the code used to store the given user type"""
+    return USER_TYPES.get(user_type, OTHER)
+
+
+class ParticipantIndex:
+    """Maps each lesson in a catalogue to its group, and each group to the ids and types of its users
+
+    Every user linked to a group is in it once per link, just like the results of PotentiallyScheduledLesson.get_users,
+    so that clashes are counted exactly as before"""
+
+    __slots__ = ('lesson_groups', 'group_users', 'group_user_types', 'group_teachers', 'group_all_teachers',
+                 'user_types')
+
+    def __init__(self, lessons: Iterable):
+        """
+        :param lessons: The PotentiallyScheduledLessons in a catalogue, in order. The users of each are only read once
+         per group
+        """
+        self.lesson_groups = array('l')  # {catalogue index: group id}
+        self.group_users: Dict[int, array] = {}  # {group id: user ids}
+        self.group_user_types: Dict[int, array] = {}  # {group id: type code of each user in group_users}
+        self.group_teachers: Dict[int, int] = {}  # {group id: the id of a teacher of the group, or -1}
+        self.group_all_teachers: Dict[int, Tuple[int, ...]] = {}  # {group id: the ids of every teacher of the group}
+        self.user_types: Dict[int, int] = {}  # {user id: type code}
+
+        for lesson in lessons:
+            group_id = lesson.group_id
+            self.lesson_groups.append(group_id)
+            if group_id in self.group_users:
+                continue
+
+            user_ids = array('l')
+            user_types = array('b')
+            teacher_id = -1
+            for user in lesson.get_users():
+                code = get_type_code(user.user_type)
+                user_ids.append(user.id)
+                user_types.append(code)
+                self.user_types[user.id] = code
+                if code == TEACHER and teacher_id == -1:
+                    teacher_id = user.id
+            self.group_users[group_id] = user_ids
+            self.group_user_types[group_id] = user_types
+            self.group_teachers[group_id] = teacher_id
+            self.group_all_teachers[group_id] = tuple(dict.fromkeys(
+                user_id for user_id, code in zip(user_ids, user_types) if code == TEACHER))
+
+    def __repr__(self):
+        return f"<ParticipantIndex lessons={len(self.lesson_groups)} groups={len(self.group_users)} " \
+               f"users={len(self.user_types)}>"
+
+    def get_users(self, index: int) -> array:
+        """Returns the ids of the users in the lesson at the given position in the catalogue"""
+        return self.group_users[self.lesson_groups[index]]
+
+    def get_user_types(self, index: int) -> array:
+        """Returns the type codes of the users in the lesson at the given position, in the same order as get_users"""
+        return self.group_user_types[self.lesson_groups[index]]
+
+    def get_teacher(self, index: int) -> int:
+        """Returns the id of a teacher of the lesson at the given position, or -1 if it has no teacher"""
+        return self.group_teachers[self.lesson_groups[index]]
+
+    def get_teachers(self, index: int) -> Tuple[int, ...]:
+        """Returns the ids of every teacher of the lesson at the given position, without duplicates"""
+        return self.group_all_teachers[self.lesson_groups[index]]
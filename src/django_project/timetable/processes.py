@@ -0,0 +1,26 @@
+"""Chooses how to start the processes used to evaluate timetables and run islands in parallel
+
+The nightly solve runs as a Celery task. Celery's default (prefork) pool runs every task in a daemonic process, and
+multiprocessing refuses to start processes from one of those. billiard, the fork of multiprocessing that Celery's
+pool is built on (and which is installed along with Celery), doesn't have that restriction, so it is used instead
+whenever this process is a daemon. Otherwise the standard library is used"""
+
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+
+def in_daemon() -> bool:
+    """Returns True if this is a daemonic process, e.g. a child of a Celery prefork worker"""
+    return multiprocessing.current_process().daemon
+
+
+def get_context():
+    """Returns the context to create processes, queues and process pools with (a multiprocessing context, or a
+    billiard one with the same interface inside a daemonic process)"""
+    if in_daemon():
+        import billiard
+        logger.info("Starting processes with billiard, as this is a daemonic process")
+        return billiard.get_context()
+    return multiprocessing.get_context()
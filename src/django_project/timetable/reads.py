@@ -0,0 +1,78 @@
+"""Reads a user's timetable for display, in a fixed number of queries however many lessons there are
+
+Each lesson is shown with its group's name, subject and teacher. Rather than querying for them once per lesson, the
+group is joined in (select_related), the subject's name is added by a subquery (annotate), and the group's teachers
+are fetched for every lesson at once (prefetch_related), so reading any number of lessons takes 2 queries"""
+
+import datetime
+from typing import Dict, List, Optional
+
+from django.db.models import OuterRef, Prefetch, Subquery
+
+from .models import Lesson, Link, Subject
+
+TEACHER_LINKS = 'teacher_links'  # the attribute each lesson's group stores its teachers' links in
+
+
+class TimetableEntry:
+    """A lesson as it is shown in a timetable"""
+
+    __slots__ = ('lesson', 'subject_name', 'group_name', 'teacher')
+
+    def __init__(self, lesson: Lesson):
+        self.lesson = lesson
+        self.subject_name: Optional[str] = lesson.subject_name
+        self.group_name = lesson.group.name
+        teacher_links = getattr(lesson.group, TEACHER_LINKS)
+        self.teacher = teacher_links[0].user_id if teacher_links else None  # the first teacher linked to the group
+
+    @property
+    def start(self) -> datetime.datetime:
+        return self.lesson.start
+
+    @property
+    def end(self) -> datetime.datetime:
+        return self.lesson.start + self.lesson.duration
+
+    @property
+    def topic(self) -> str:
+        return self.lesson.topic
+
+    @property
+    def teacher_name(self) -> str:
+        """The teacher's title and last name, or first and last name if they have no title"""
+        if self.teacher is None:
+            return ''
+        if self.teacher.title:
+            return self.teacher.title.title() + ' ' + self.teacher.last_name.title()
+        return self.teacher.first_name.title() + ' ' + self.teacher.last_name.title()
+
+    def __repr__(self):
+        return f"<TimetableEntry {self.group_name} {self.start}>"
+
+
+def get_lessons(user, after: datetime.datetime, before: datetime.datetime) -> List[TimetableEntry]:
+    """Returns every lesson of the user's groups starting between after and before (inclusive), earliest first"""
+    subject_name = Subject.objects.filter(link__group_id=OuterRef('group_id')).order_by('link__id').values('name')[:1]
+    teacher_links = Link.objects.filter(user_id__user_type='teacher').select_related('user_id').order_by('id')
+    lessons = Lesson.objects.filter(group_id__link__user_id__username__exact=user.username, start__gte=after,
+                                    start__lte=before).order_by('start') \
+        .select_related('group') \
+        .annotate(subject_name=Subquery(subject_name)) \
+        .prefetch_related(Prefetch('group__link_set', queryset=teacher_links, to_attr=TEACHER_LINKS))
+    return [TimetableEntry(lesson) for lesson in lessons]
+
+
+def get_day(user, day: datetime.datetime) -> List[TimetableEntry]:
+    """Returns the user's lessons on the given day"""
+    return get_lessons(user, day.replace(hour=0, minute=0, second=0), day.replace(hour=23, minute=59, second=59))
+
+
+def get_week(user, day: datetime.datetime) -> Dict[datetime.date, List[TimetableEntry]]:
+    """Returns the user's lessons on each day of the week (Monday to Friday) containing the given day, using the
+    same queries as a single day: {date: [entries]}"""
+    monday = (day - datetime.timedelta(days=day.weekday())).replace(hour=0, minute=0, second=0)
+    week = {(monday + datetime.timedelta(days=i)).date(): [] for i in range(5)}
+    for entry in get_lessons(user, monday, monday + datetime.timedelta(days=4, hours=23, minutes=59, seconds=59)):
+        week.setdefault(entry.start.date(), []).append(entry)
+    return week
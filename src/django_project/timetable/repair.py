@@ -0,0 +1,93 @@
+"""Repairs timetables so that no teacher is double-booked
+
+The cost function only penalises teacher clashes, and crossover and mutation place lessons at random times, so most
+new timetables have some. Repairing them straight away means the search doesn't spend generations removing clashes
+one at a time. Each day is rebuilt lesson by lesson, keeping track of when each teacher is free: a lesson that would
+clash is moved to the nearest time its teachers are all free instead, or removed if there is no such time"""
+
+from typing import Dict, Iterable, Tuple
+
+from .genome import UNSCHEDULED
+from .occupancy import lesson_mask
+
+
+class TeacherSlots:
+    """When each teacher is busy on a single day, stored as bitmasks in the same way as DayOccupancy"""
+
+    __slots__ = ('time_per_day', 'masks')
+
+    def __init__(self, time_per_day: int):
+        self.time_per_day = time_per_day
+        self.masks: Dict[int, int] = {}  # {teacher id: bitmask of the time units they are busy}
+
+    def busy(self, teacher_ids: Iterable[int]) -> int:
+        """Returns a bitmask of the time units when any of the teachers is busy"""
+        mask = 0
+        for teacher_id in teacher_ids:
+            mask |= self.masks.get(teacher_id, 0)
+        return mask
+
+    def is_free(self, teacher_ids: Iterable[int], start: int, duration: int) -> bool:
+        """Returns True if none of the teachers are busy at any point during the lesson"""
+        return not self.busy(teacher_ids) & lesson_mask(start, duration)
+
+    def book(self, teacher_ids: Iterable[int], start: int, duration: int):
+        """Marks the teachers as busy for the lesson"""
+        new = lesson_mask(start, duration)
+        for teacher_id in teacher_ids:
+            self.masks[teacher_id] = self.masks.get(teacher_id, 0) | new
+
+    def free_starts(self, teacher_ids: Iterable[int], duration: int) -> int:
+        """Returns a bitmask with bit n set if a lesson of the given duration could start at time unit n without any
+        of the teachers being busy, and without finishing after the end of the day"""
+        latest_start = self.time_per_day - duration
+        if latest_start < 0:
+            return 0
+        free = ~self.busy(teacher_ids) & ((1 << self.time_per_day) - 1)
+        starts = free
+        for offset in range(1, duration):
+            starts &= free >> offset
+        return starts & ((1 << (latest_start + 1)) - 1)
+
+    def nearest_free_start(self, teacher_ids: Iterable[int], start: int, duration: int) -> int:
+        """Returns the start time closest to the given one at which none of the teachers are busy for the whole
+        lesson, or UNSCHEDULED if there isn't one. Earlier times are preferred if two are equally close"""
+        starts = self.free_starts(teacher_ids, duration)
+        if not starts:
+            return UNSCHEDULED
+        earlier = starts & ((1 << (start + 1)) - 1)  # start times up to and including the given one
+        later = starts >> (start + 1)
+        before = start - (earlier.bit_length() - 1) if earlier else None
+        after = (later & -later).bit_length() if later else None
+        if after is None or (before is not None and before <= after):
+            return start - before
+        return start + after
+
+
+def repair(timetable) -> Tuple[int, int]:
+    """Moves or removes lessons until none of the timetable's teachers are teaching two lessons at once
+    On each day, lessons keep their times in order of start time, so earlier lessons are kept where they are and later
+    ones are moved. Returns (lessons moved, lessons removed)"""
+    participants = timetable.catalogue.participants
+    moved = removed = 0
+    for day in range(timetable.days):
+        slots = TeacherSlots(timetable.time_per_day)
+        starts = timetable.genome.starts
+        for index in sorted(timetable.genome.scheduled(day), key=lambda i: (starts[i], i)):
+            relative_start = timetable.genome.starts[index]
+            teacher_ids = participants.get_teachers(index)
+            duration = timetable.catalogue[index].relative_duration
+            if not teacher_ids or slots.is_free(teacher_ids, relative_start, duration):
+                slots.book(teacher_ids, relative_start, duration)
+                continue
+
+            new_start = slots.nearest_free_start(teacher_ids, relative_start, duration)
+            if new_start == UNSCHEDULED:
+                timetable.move_lesson(index, UNSCHEDULED)
+                removed += 1
+            else:
+                timetable.move_lesson(index, day, new_start)
+                slots.book(teacher_ids, new_start, duration)
+                moved += 1
+
+    return moved, removed
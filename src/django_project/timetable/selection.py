@@ -0,0 +1,153 @@
+"""Selection schemes for the genetic algorithm
+
+Every selector chooses from a list of timetables that has already been sorted from best to worst (lowest cost first),
+so the population only needs sorting once per selection. Each one makes a fixed number of random draws, so the time
+taken is predictable however close together the costs are"""
+
+import heapq
+import random
+from typing import List, Union
+
+
+class Selector:
+    """Chooses timetables from a list sorted from best to worst"""
+
+    name = ''
+
+    def select(self, ranked: list, n: int, unique: bool = False) -> list:
+        """Chooses n timetables from ranked, which must be sorted from best to worst
+        If unique is True, no timetable is chosen more than once"""
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
+
+    @staticmethod
+    def top_up(chosen: list, ranked: list, n: int) -> list:
+        """Removes any repeats from chosen, then adds the best timetables that were not chosen until there are n"""
+        seen = set()
+        unique = []
+        for timetable in chosen:
+            if id(timetable) not in seen:
+                seen.add(id(timetable))
+                unique.append(timetable)
+        for timetable in ranked:
+            if len(unique) >= n:
+                break
+            if id(timetable) not in seen:
+                seen.add(id(timetable))
+                unique.append(timetable)
+        return unique
+
+
+class TruncationSelector(Selector):
+    """Chooses the n best timetables"""
+
+    name = 'truncation'
+
+    def select(self, ranked, n, unique=False):
+        return ranked[:n]
+
+
+class TournamentSelector(Selector):
+    """Each draw picks `size` timetables at random and chooses the best of them"""
+
+    name = 'tournament'
+
+    def __init__(self, size: int = 3):
+        if size < 1:
+            raise ValueError("Tournament size must be positive")
+        self.size = size
+
+    def select(self, ranked, n, unique=False):
+        pool = list(range(len(ranked)))  # indices into ranked, so a lower index is a better timetable
+        chosen = []
+        for x in range(n):
+            if not pool:
+                break
+            positions = [random.randrange(len(pool)) for y in range(self.size)]
+            winner = min(positions, key=lambda position: pool[position])
+            chosen.append(ranked[pool[winner]])
+            if unique:  # remove the winner from the pool in O(1) by replacing it with the last one
+                pool[winner] = pool[-1]
+                pool.pop()
+        return chosen
+
+
+class RankSelector(Selector):
+    """Chooses timetables with a probability that decreases linearly with their rank
+    The best timetable is `pressure` times as likely to be chosen as the average one (1 <= pressure <= 2)"""
+
+    name = 'rank'
+
+    def __init__(self, pressure: float = 1.5):
+        if not 1 <= pressure <= 2:
+            raise ValueError("Selection pressure must be between 1 and 2")
+        self.pressure = pressure
+
+    def get_weights(self, n: int) -> List[float]:
+        if n == 1:
+            return [1]
+        return [self.pressure - (2 * self.pressure - 2) * i / (n - 1) for i in range(n)]
+
+    def select(self, ranked, n, unique=False):
+        if not ranked:
+            return []
+        weights = self.get_weights(len(ranked))
+        if not unique:
+            return random.choices(ranked, weights=weights, k=n)
+
+        # weighted sampling without replacement: each timetable gets a random key weighted by its probability,
+        # and the ones with the highest keys are chosen
+        keys = [random.random() ** (1 / weight) if weight > 0 else 0 for weight in weights]
+        best = heapq.nlargest(n, range(len(ranked)), key=lambda i: keys[i])
+        return [ranked[i] for i in best]
+
+
+class StochasticUniversalSampling(Selector):
+    """Chooses timetables with a probability proportional to how much better they are than the worst one, using n
+    equally spaced pointers on a single spin of a roulette wheel
+    This can choose the same timetable more than once. If unique is True, repeats are replaced by the best
+    timetables that were not chosen"""
+
+    name = 'sus'
+
+    def select(self, ranked, n, unique=False):
+        if not ranked or n <= 0:
+            return []
+        costs = [timetable.get_cost() for timetable in ranked]
+        worst = costs[-1]
+        weights = [worst - cost for cost in costs]
+        total = sum(weights)
+        if total <= 0:  # every timetable is as good as each other
+            weights = [1] * len(ranked)
+            total = len(ranked)
+
+        spacing = total / n
+        pointer = random.uniform(0, spacing)
+        chosen = []
+        cumulative = 0
+        i = 0
+        for x in range(n):
+            while cumulative + weights[i] < pointer and i < len(ranked) - 1:
+                cumulative += weights[i]
+                i += 1
+            chosen.append(ranked[i])
+            pointer += spacing
+
+        if unique:
+            return self.top_up(chosen, ranked, n)
+        return chosen
+
+
+SELECTORS = {selector.name: selector for selector in
+             (TruncationSelector, TournamentSelector, RankSelector, StochasticUniversalSampling)}
+
+
+def get_selector(selector: Union[str, Selector]) -> Selector:
+    """Returns the selector with the given name (see SELECTORS), or the selector itself if it is already one"""
+    if isinstance(selector, Selector):
+        return selector
+    if selector not in SELECTORS:
+        raise ValueError(f"Unknown selection scheme '{selector}'. Choose from {list(SELECTORS)}")
+    return SELECTORS[selector]()
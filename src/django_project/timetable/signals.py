@@ -0,0 +1,40 @@
+"""Keeps GroupStatistics up to date whenever a lesson or group is saved or deleted (see statistics.py)"""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import statistics
+from .models import Group, GroupStatistics, Lesson
+
+
+@receiver(pre_save, sender=Lesson)
+def remember_lesson(sender, instance: Lesson, raw=False, **kwargs):
+    """Stores what the lesson was before it is changed, so that it can be taken out of the statistics"""
+    instance._previous_statistics = None
+    if instance.pk is not None and not raw:
+        instance._previous_statistics = Lesson.objects.filter(pk=instance.pk).values_list(
+            'group_id', 'start', 'duration').first()
+
+
+@receiver(post_save, sender=Lesson)
+def update_lesson_statistics(sender, instance: Lesson, raw=False, **kwargs):
+    if raw:  # e.g. loading a fixture, which may not have loaded the lesson's group yet
+        return
+    current = (instance.group_id, instance.start, instance.duration)
+    previous = getattr(instance, '_previous_statistics', None)
+    if previous == current:
+        return
+    if previous is not None:
+        statistics.record_lesson(*previous, added=False)
+    statistics.record_lesson(*current)
+
+
+@receiver(post_delete, sender=Lesson)
+def remove_lesson_statistics(sender, instance: Lesson, **kwargs):
+    statistics.record_lesson(instance.group_id, instance.start, instance.duration, added=False)
+
+
+@receiver(post_save, sender=Group)
+def create_group_statistics(sender, instance: Group, created=False, raw=False, **kwargs):
+    if created and not raw:
+        GroupStatistics.objects.get_or_create(group=instance)
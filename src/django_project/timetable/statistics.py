@@ -0,0 +1,131 @@
+"""Per-group lesson statistics, kept up to date as lessons are saved and deleted
+
+The scheduler needs to know how much lesson time each group has had so far and how long ago its last lesson was.
+Rather than adding up every lesson each time, GroupStatistics stores the totals over every lesson with a start time,
+which are updated whenever a lesson changes (see signals.py). Lessons that haven't happened yet are then subtracted
+when the statistics are read, which only needs to look at lessons in the future.
+
+Anything that changes lessons without calling save() or delete() on each one (e.g. QuerySet.update or bulk_create)
+must call record_lesson itself, or rebuild the statistics afterwards (manage.py rebuild_group_statistics)"""
+
+import datetime
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import F, Max, OuterRef, Q, Subquery, Sum
+
+from .models import Group, GroupStatistics, Lesson
+
+
+def record_lesson(group_id: int, start: Optional[datetime.datetime], duration: datetime.timedelta,
+                  added: bool = True):
+    """Adds a lesson to its group's statistics, or removes it if added is False
+    Lessons without a start time are not included, so they are ignored"""
+    if start is None:
+        return
+
+    statistics = GroupStatistics.objects.filter(group_id=group_id)
+    if added:
+        if not statistics.update(lesson_time=F('lesson_time') + duration):
+            rebuild([group_id])  # there are no statistics for this group yet, so they are calculated from scratch
+            return
+        statistics.filter(Q(last_lesson_start__isnull=True) | Q(last_lesson_start__lt=start)).update(
+            last_lesson_start=start)
+    else:
+        statistics.update(lesson_time=F('lesson_time') - duration)
+        # if this was the last lesson, the one before it is now the last
+        latest = Lesson.objects.filter(group_id=group_id, start__isnull=False).order_by('-start').values('start')[:1]
+        statistics.filter(last_lesson_start__lte=start).update(last_lesson_start=Subquery(latest))
+
+
+def rebuild(group_ids: Optional[Iterable[int]] = None):
+    """Recalculates the statistics from every lesson, for the given groups (or every group if group_ids is None)"""
+    groups = Group.objects.order_by('id')
+    lessons = Lesson.objects.filter(start__isnull=False)
+    if group_ids is not None:
+        group_ids = list(group_ids)
+        groups = groups.filter(id__in=group_ids)
+        lessons = lessons.filter(group_id__in=group_ids)
+
+    totals = {row['group_id']: row for row in
+              lessons.order_by().values('group_id').annotate(lesson_time=Sum('duration'), last=Max('start'))}
+    existing = {row.group_id: row for row in GroupStatistics.objects.filter(group__in=groups)}
+    changed, new = [], []
+    for group_id in groups.values_list('id', flat=True):
+        row = totals.get(group_id, {})
+        statistics = existing.get(group_id) or GroupStatistics(group_id=group_id)
+        statistics.lesson_time = row.get('lesson_time') or datetime.timedelta()
+        statistics.last_lesson_start = row.get('last')
+        (changed if statistics.pk else new).append(statistics)
+    # a few statements in total rather than a few per group, as many groups can be rebuilt at once (see writeback.py)
+    GroupStatistics.objects.bulk_update(changed, ['lesson_time', 'last_lesson_start'])
+    GroupStatistics.objects.bulk_create(new)
+
+
+def get_group_data(now: Optional[datetime.datetime] = None) -> Dict[int, list]:
+    """Returns {group id: [seconds of lessons so far, days since the group's last lesson]} for every group, using
+    the stored statistics. Groups that have not had any lessons yet have 0 for both"""
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    rows = list(Group.objects.order_by('id').values_list('id', 'statistics__lesson_time',
+                                                          'statistics__last_lesson_start'))
+    missing = [group_id for group_id, lesson_time, last_lesson_start in rows if lesson_time is None]
+    if missing:
+        rebuild(missing)
+        rows = list(Group.objects.order_by('id').values_list('id', 'statistics__lesson_time',
+                                                              'statistics__last_lesson_start'))
+
+    # lessons that haven't happened yet are included in the statistics, so they are taken away again
+    latest_past = Lesson.objects.filter(group_id=OuterRef('group_id'), start__lte=now).order_by('-start')
+    future = {row['group_id']: row for row in
+              Lesson.objects.filter(start__gt=now).order_by().values('group_id').annotate(
+                  lesson_time=Sum('duration'), last=Subquery(latest_past.values('start')[:1]))}
+
+    group_data = {}
+    for group_id, lesson_time, last_lesson_start in rows:
+        if group_id in future:
+            lesson_time -= future[group_id]['lesson_time']
+            last_lesson_start = future[group_id]['last']
+        group_data[group_id] = days_since(lesson_time, last_lesson_start, now)
+
+    return group_data
+
+
+def scan_group_data(now: Optional[datetime.datetime] = None) -> Dict[int, list]:
+    """Calculates the same as get_group_data directly from every lesson, without using the stored statistics"""
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    totals = {row['group_id']: row for row in
+              Lesson.objects.filter(start__lte=now).order_by().values('group_id').annotate(
+                  lesson_time=Sum('duration'), last=Max('start'))}
+    group_data = {}
+    for group_id in Group.objects.order_by('id').values_list('id', flat=True):
+        row = totals.get(group_id, {})
+        group_data[group_id] = days_since(row.get('lesson_time'), row.get('last'), now)
+
+    return group_data
+
+
+def days_since(lesson_time: Optional[datetime.timedelta], last_lesson_start: Optional[datetime.datetime],
+               now: datetime.datetime) -> list:
+    """Returns [seconds of lessons so far, days since the last lesson] in the format used by group_data"""
+    if last_lesson_start is None:
+        return [0, 0]
+    today = now.replace(hour=0, minute=0, second=0)
+    last_day = last_lesson_start.replace(tzinfo=datetime.timezone.utc, hour=0, minute=0, second=0)
+    return [lesson_time.total_seconds(), (today - last_day).days]
+
+
+def verify(now: Optional[datetime.datetime] = None) -> List[str]:
+    """Compares the stored statistics with scan_group_data, returning a description of every difference"""
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc)
+
+    stored = get_group_data(now)
+    scanned = scan_group_data(now)
+    differences = []
+    for group_id in sorted(set(stored) | set(scanned)):
+        if stored.get(group_id) != scanned.get(group_id):
+            differences.append(f"Group {group_id}: stored {stored.get(group_id)}, calculated {scanned.get(group_id)}")
+    return differences
@@ -0,0 +1,150 @@
+"""Stopping conditions for Population.start
+
+Each condition is called with (population, generations) after every generation, like should_stop, and returns True
+to stop. Conditions can be combined with | (stop when any of them would) and & (stop only when all of them would):
+
+    Population(stopping_condition=(Stagnation(20) & MaxGenerations(50)) | TimeBudget(60) | MaxGenerations(500))
+
+Conditions that keep track of the search store their state for each population separately, so one condition can be
+shared between the islands of an IslandModel. The state is reset whenever a population starts evolving"""
+
+import math
+import time
+from collections import deque
+from typing import Dict
+
+
+class StoppingCondition:
+    """A stopping condition that can be combined with others using | and &"""
+
+    def __call__(self, population, generations: int) -> bool:
+        raise NotImplementedError
+
+    def __or__(self, other):
+        return AnyOf(self, other)
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+    def __ror__(self, other):  # so that plain functions such as should_stop can be combined with conditions
+        return AnyOf(other, self)
+
+    def __rand__(self, other):
+        return AllOf(other, self)
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__}>"
+
+    @staticmethod
+    def get_best_cost(population) -> float:
+        return min(timetable.get_cost() for timetable in population.population)
+
+
+class MaxGenerations(StoppingCondition):
+    """Stops after a fixed number of generations (should_stop is the same as MaxGenerations(100))"""
+
+    def __init__(self, generations: int = 100):
+        self.generations = generations
+
+    def __call__(self, population, generations):
+        return generations >= self.generations
+
+
+class TargetCost(StoppingCondition):
+    """Stops as soon as the best timetable costs no more than the target"""
+
+    def __init__(self, cost: float):
+        self.cost = cost
+
+    def __call__(self, population, generations):
+        return self.get_best_cost(population) <= self.cost
+
+
+class TimeBudget(StoppingCondition):
+    """Stops once the given number of seconds have passed since the population started evolving"""
+
+    def __init__(self, seconds: float):
+        if seconds < 0:
+            raise ValueError("Time budget cannot be negative")
+        self.seconds = seconds
+        self.started: Dict[int, float] = {}  # {id(population): time.monotonic() when it started}
+
+    def __call__(self, population, generations):
+        now = time.monotonic()
+        if generations == 0 or id(population) not in self.started:
+            self.started[id(population)] = now
+        return now - self.started[id(population)] >= self.seconds
+
+
+class Stagnation(StoppingCondition):
+    """Stops when the best cost has not improved by more than tolerance in the last `generations` generations"""
+
+    def __init__(self, generations: int = 20, tolerance: float = 0):
+        if generations < 1:
+            raise ValueError("Number of generations must be positive")
+        self.generations = generations
+        self.tolerance = tolerance
+        self.best: Dict[int, list] = {}  # {id(population): [best cost so far, generation it was found]}
+
+    def __call__(self, population, generations):
+        cost = self.get_best_cost(population)
+        best = self.best.get(id(population))
+        if generations == 0 or best is None or cost < best[0] - self.tolerance:
+            self.best[id(population)] = [cost, generations]
+            return False
+        return generations - best[1] >= self.generations
+
+
+class RelativeImprovement(StoppingCondition):
+    """Stops when the best cost has improved by less than the given fraction over the last `window` generations
+    e.g. RelativeImprovement(0.01, 10) stops once 10 generations make less than a 1% improvement"""
+
+    def __init__(self, threshold: float = 0.001, window: int = 10):
+        if window < 1:
+            raise ValueError("Window must be positive")
+        self.threshold = threshold
+        self.window = window
+        self.history: Dict[int, deque] = {}  # {id(population): best costs of the last window + 1 generations}
+
+    def __call__(self, population, generations):
+        if generations == 0 or id(population) not in self.history:
+            self.history[id(population)] = deque(maxlen=self.window + 1)
+        history = self.history[id(population)]
+        history.append(self.get_best_cost(population))
+        if len(history) <= self.window:
+            return False
+        previous, current = history[0], history[-1]
+        if math.isinf(previous):
+            return False
+        if previous == 0:
+            return current >= previous
+        return (previous - current) / abs(previous) < self.threshold
+
+
+class AnyOf(StoppingCondition):
+    """Stops when any of the conditions would stop
+    Every condition is checked every generation, so that each of them keeps track of the search"""
+
+    def __init__(self, *conditions):
+        self.conditions = conditions
+
+    def __call__(self, population, generations):
+        results = [condition(population, generations) for condition in self.conditions]
+        return any(results)
+
+    def __repr__(self):
+        return '(' + ' | '.join(repr(condition) for condition in self.conditions) + ')'
+
+
+class AllOf(StoppingCondition):
+    """Stops only when every one of the conditions would stop"""
+
+    def __init__(self, *conditions):
+        self.conditions = conditions
+
+    def __call__(self, population, generations):
+        results = [condition(population, generations) for condition in self.conditions]
+        return all(results)
+
+    def __repr__(self):
+        return '(' + ' & '.join(repr(condition) for condition in self.conditions) + ')'
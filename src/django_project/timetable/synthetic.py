@@ -0,0 +1,107 @@
+"""Creates made-up schools of a given size, so that solvers can be compared on the same data (see benchmark.py)
+
+Everything is chosen by a random number generator seeded with the given seed, so the same arguments always create
+the same school. Each teacher teaches one subject, each group is one subject taught by one teacher, and each student
+takes a few subjects in one group each. Every group has some lessons in the past and some that are yet to be
+scheduled"""
+
+import datetime
+import random
+from typing import Dict, Optional
+
+from . import statistics
+from .models import Group, Lesson, Link, Subject, User
+
+SIZES = {'small': 300, 'medium': 1500, 'large': 5000}  # number of students
+
+SUBJECTS = [
+    ('Mathematics', 'Ma'), ('Further Maths', 'FM'), ('Physics', 'Ph'), ('Chemistry', 'Ch'), ('Biology', 'Bi'),
+    ('Computing', 'Co'), ('English', 'En'), ('History', 'Hi'), ('Geography', 'Gg'), ('Economics', 'Ec'),
+    ('French', 'Fr'), ('Spanish', 'Sp'), ('Art', 'Ar'), ('Music', 'Mu'), ('Psychology', 'Ps'), ('Politics', 'Po'),
+]
+YEAR_GROUPS = ['L6', 'U6']
+LESSON_MINUTES = [40, 60, 80, 100]
+CLASS_SIZE = 15
+GROUPS_PER_TEACHER = 5
+
+
+def generate_school(students: int = 300, teachers: Optional[int] = None, groups: Optional[int] = None,
+                    subjects_per_student: int = 4, past_days: int = 28, past_lessons: int = 4,
+                    unscheduled_lessons: int = 5, seed: int = 0, prefix: str = 'synthetic',
+                    now: Optional[datetime.datetime] = None) -> Dict[str, int]:
+    """Adds a made-up school to the database, returning the number of each kind of row created
+    Rows are created in bulk, so the group statistics are rebuilt for the new groups afterwards
+
+    :param students: The number of students (see SIZES for typical values)
+    :param teachers: The number of teachers. By default, enough for each to teach about GROUPS_PER_TEACHER groups
+    :param groups: The number of groups. By default, enough for about CLASS_SIZE students per group
+    :param subjects_per_student: The number of subjects (and so groups) each student takes
+    :param past_days: Lessons in the past are spread over the weekdays of this many days before now
+    :param past_lessons: The number of lessons each group has already had
+    :param unscheduled_lessons: The number of lessons each group has that are yet to be scheduled
+    :param prefix: The start of every username, which must not already be in use
+    :param now: The time lessons in the past are before. Defaults to the start of today
+    """
+    if groups is None:
+        groups = max(students * subjects_per_student // CLASS_SIZE, 1)
+    if teachers is None:
+        teachers = max(groups // GROUPS_PER_TEACHER, 1)
+    if students < 1 or teachers < 1 or groups < 1:
+        raise ValueError("A school needs at least one student, teacher and group")
+    if not 1 <= subjects_per_student <= min(len(SUBJECTS), groups):
+        raise ValueError(f"Students can take between 1 and {min(len(SUBJECTS), groups)} subjects")
+    if User.objects.filter(username__startswith=prefix).exists():
+        raise ValueError(f"There are already users starting with '{prefix}'. Use a different prefix")
+    if now is None:
+        now = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    rng = random.Random(seed)
+    subject_count = min(len(SUBJECTS), groups)
+    subjects = Subject.objects.bulk_create(
+        [Subject(name=name, abbreviation=abbreviation) for name, abbreviation in SUBJECTS[:subject_count]])
+
+    teacher_users = [User(username=f"{prefix}-t{i}", user_type='teacher', title=rng.choice(['Mr', 'Ms', 'Dr']),
+                          first_name=f"Teacher{i}"[:16], last_name=f"T{i}") for i in range(teachers)]
+    student_users = [User(username=f"{prefix}-s{i}", user_type='student', year_group=rng.choice(YEAR_GROUPS),
+                          first_name=f"Student{i}"[:16], last_name=f"S{i}") for i in range(students)]
+    for user in teacher_users + student_users:
+        user.set_unusable_password()
+    teacher_users = User.objects.bulk_create(teacher_users)
+    student_users = User.objects.bulk_create(student_users)
+
+    # each teacher teaches one subject, and each group is taught by one of that subject's teachers
+    group_objects = Group.objects.bulk_create([Group(name=f"G{i}") for i in range(groups)])
+    group_subjects = [i % subject_count for i in range(groups)]
+    subject_teachers = {}
+    for i, teacher in enumerate(teacher_users):
+        subject_teachers.setdefault(i % subject_count, []).append(teacher)
+    links = []
+    for group, subject in zip(group_objects, group_subjects):
+        teacher = rng.choice(subject_teachers.get(subject) or teacher_users)
+        links.append(Link(user_id=teacher, subject_id=subjects[subject], group_id=group))
+
+    subject_groups = {}
+    for group, subject in zip(group_objects, group_subjects):
+        subject_groups.setdefault(subject, []).append(group)
+    for student in student_users:
+        for subject in rng.sample(range(subject_count), subjects_per_student):
+            links.append(Link(user_id=student, subject_id=subjects[subject],
+                              group_id=rng.choice(subject_groups[subject])))
+    Link.objects.bulk_create(links)
+
+    past_weekdays = [now - datetime.timedelta(days=x) for x in range(1, past_days + 1)]
+    past_weekdays = [day for day in past_weekdays if day.weekday() <= 4] or [now - datetime.timedelta(days=1)]
+    lessons = []
+    for group in group_objects:
+        for x in range(past_lessons):
+            start = rng.choice(past_weekdays) + datetime.timedelta(hours=8, minutes=30 + 20 * rng.randint(0, 21))
+            lessons.append(Lesson(group=group, duration=datetime.timedelta(minutes=rng.choice(LESSON_MINUTES)),
+                                  start=start, fixed=True, topic="Synthetic lesson"))
+        for x in range(unscheduled_lessons):
+            lessons.append(Lesson(group=group, duration=datetime.timedelta(minutes=rng.choice(LESSON_MINUTES)),
+                                  topic="Synthetic lesson"))
+    Lesson.objects.bulk_create(lessons)
+    statistics.rebuild([group.id for group in group_objects])  # bulk_create doesn't send the signals that do this
+
+    return {'students': students, 'teachers': teachers, 'groups': groups, 'subjects': subject_count,
+            'links': len(links), 'lessons': len(lessons)}
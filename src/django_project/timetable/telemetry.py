@@ -0,0 +1,192 @@
+"""Measures what a Population does in each generation, and passes the measurements on to hooks
+
+    telemetry = Telemetry(JsonLinesWriter('run.jsonl'), PrometheusWriter('timetable.prom'))
+    Population(telemetry=telemetry).start()
+
+After every generation, each hook is called with a record (a dictionary) holding:
+ - the generation number, the time, and the label given to Telemetry (e.g. the island)
+ - the seconds spent on each phase of the generation: selection, crossover, mutation, repair, evaluation and
+   duplicates (replacing duplicate timetables)
+ - the number of evaluations in the generation and in total, and the fitness cache's hits and misses
+ - the best, mean and worst cost, and the parts of the best timetable's cost (as in get_cost(debug=True)),
+   added up over every day
+ - if the population uses adaptive mutation, its current strength and probabilities (see AdaptiveMutation.stats)
+
+Without telemetry, the population uses NULL_STOPWATCH, whose methods do nothing, so there is almost no overhead"""
+
+import json
+import os
+import time
+from typing import Callable, Dict, Optional
+
+
+class Stopwatch:
+    """Adds up the time spent on each phase of a generation
+    start() is called at the start of the generation, then lap(phase) at the end of each phase"""
+
+    __slots__ = ('totals', 'last')
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}  # {phase: seconds}
+        self.last = time.perf_counter()
+
+    def start(self):
+        self.totals = {}
+        self.last = time.perf_counter()
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        self.totals[phase] = self.totals.get(phase, 0) + now - self.last
+        self.last = now
+
+
+class NullStopwatch:
+    """A stopwatch that doesn't measure anything, used when there is no telemetry"""
+
+    __slots__ = ()
+
+    def start(self):
+        pass
+
+    def lap(self, phase: str):
+        pass
+
+
+NULL_STOPWATCH = NullStopwatch()
+
+
+class Telemetry:
+    """Creates a record of every generation of a population and passes it to each hook"""
+
+    def __init__(self, *hooks: Callable[[dict], None], label: Optional[str] = None):
+        """
+        :param hooks: Called with the record of every generation, e.g. JsonLinesWriter, PrometheusWriter or print
+        :param label: Included in every record, to tell apart populations sharing the same hooks (e.g. islands)
+        """
+        self.hooks = list(hooks)
+        self.label = label
+        self.previous_evaluations: Dict[int, int] = {}  # {id(population): evaluations at the last record}
+
+    def add_hook(self, hook: Callable[[dict], None]):
+        self.hooks.append(hook)
+
+    def record(self, population) -> dict:
+        """Measures the generation the population has just finished, and passes the record to every hook
+        The time spent on each phase is read from population.stopwatch"""
+        costs = [timetable.get_cost() for timetable in population.population]
+        best = min(population.population, key=lambda timetable: timetable.get_cost())
+        components = {}
+        for day_cost in best.day_costs.values():
+            for part, value in day_cost.items():
+                components[part] = components.get(part, 0) + value
+
+        record = {
+            'label': self.label,
+            'generation': population.generations,
+            'time': time.time(),
+            'phase_seconds': dict(population.stopwatch.totals),
+            'evaluations': population.evaluations - self.previous_evaluations.get(id(population), 0),
+            'total_evaluations': population.evaluations,
+            'cache_hits': population.fitness_cache.hits if population.fitness_cache is not None else None,
+            'cache_misses': population.fitness_cache.misses if population.fitness_cache is not None else None,
+            'best_cost': min(costs),
+            'mean_cost': sum(costs) / len(costs),
+            'worst_cost': max(costs),
+            'best_components': components,
+        }
+        if population.adaptive_mutation is not None:
+            record['mutation'] = population.adaptive_mutation.stats()
+        self.previous_evaluations[id(population)] = population.evaluations
+
+        for hook in self.hooks:
+            hook(record)
+        return record
+
+
+class JsonLinesWriter:
+    """A hook that appends every record to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def __call__(self, record: dict):
+        # opened every time, so this can be pickled and sent to other processes (e.g. islands)
+        with open(self.path, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+
+
+class PrometheusWriter:
+    """A hook that writes the latest record of each population to a file in the Prometheus text format, e.g. for the
+    node exporter's textfile collector. Records with different labels are kept side by side, so the file should only
+    be shared by populations in the same process"""
+
+    PREFIX = 'timetable'
+
+    def __init__(self, path: str):
+        self.path = path
+        self.latest: Dict[Optional[str], dict] = {}  # {label: record}
+
+    def __call__(self, record: dict):
+        self.latest[record['label']] = record
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            file.write(self.format())
+        os.replace(temporary_path, self.path)  # so that the file is never read half-written
+
+    def format(self) -> str:
+        """Returns every population's latest record in the Prometheus text format"""
+        metrics = {}  # {name: (type, help, [(labels, value)])}
+
+        def add(name, metric_type, description, labels, value):
+            if value is not None:
+                metrics.setdefault(name, (metric_type, description, []))[2].append((labels, value))
+
+        for label, record in self.latest.items():
+            labels = {} if label is None else {'population': label}
+            add('generation', 'gauge', "The number of generations so far", labels, record['generation'])
+            add('evaluations_total', 'counter', "Timetables evaluated", labels, record['total_evaluations'])
+            add('fitness_cache_hits_total', 'counter', "Evaluations found in the fitness cache", labels,
+                record['cache_hits'])
+            add('fitness_cache_misses_total', 'counter', "Evaluations not found in the fitness cache", labels,
+                record['cache_misses'])
+            for statistic in ('best', 'mean', 'worst'):
+                add('cost', 'gauge', "The cost of the timetables in the latest generation",
+                    dict(labels, statistic=statistic), record[f'{statistic}_cost'])
+            for phase, seconds in record['phase_seconds'].items():
+                add('phase_seconds', 'gauge', "Seconds spent on each phase of the latest generation",
+                    dict(labels, phase=phase), seconds)
+            for component, value in record['best_components'].items():
+                add('best_cost_component', 'gauge', "Each part of the cost of the best timetable",
+                    dict(labels, component=component), value)
+            if 'mutation' in record:
+                add('mutation_strength', 'gauge', "Mutations per day given to each offspring", labels,
+                    record['mutation']['strength'])
+                for kind, move in record['mutation']['moves'].items():
+                    add('mutation_probability', 'gauge', "The probability of each kind of mutation",
+                        dict(labels, kind=kind), move['probability'])
+
+        lines = []
+        for name, (metric_type, description, samples) in metrics.items():
+            name = f"{self.PREFIX}_{name}"
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{escape(text)}"' for key, text in labels.items())
+                lines.append(f"{name}{{{label_text}}} {format_value(value)}" if label_text
+                             else f"{name} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+def format_value(value: float) -> str:
+    """Formats a sample value for the Prometheus text format, which spells infinity and NaN differently"""
+    value = float(value)
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def escape(value) -> str:
+    """Escapes a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
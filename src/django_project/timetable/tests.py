@@ -1,3 +1,1754 @@
+import datetime
+import io
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import random
+import shutil
+import tempfile
+from unittest import mock, skipIf
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.test import TestCase
 
-# Create your tests here.
+from . import (batch_evaluation, benchmark, checkpoints, engines, evaluation, incremental, islands, jobs, processes,
+               reads, selection, statistics, stopping, synthetic, timetabling, writeback)
+from .apps import TimetablingAppConfig
+from .catalogue import LessonCatalogue
+from .context import SchedulingContext
+from .crossover import CROSSOVERS, get_crossover
+from .fitness_cache import FitnessCache
+from .genome import Genome, UNSCHEDULED
+from .models import User, Subject, Group, Link, Lesson
+from .mutation import ADD, MOVE, REMOVE, AdaptiveMutation
+from .occupancy import DayOccupancy
+from .participants import OTHER, STUDENT, TEACHER, USER_TYPES
+from .repair import TeacherSlots, repair
+from .telemetry import NULL_STOPWATCH, JsonLinesWriter, PrometheusWriter, Telemetry
+from .timetabling import Population, PotentiallyScheduledLesson
+
+
+def create_school(groups, students_per_group=3):
+    """Creates a teacher and some students for each group, with one past lesson and two unscheduled lessons each"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for i in range(groups):
+        subject = Subject.objects.create(name=f"Subject {i}", abbreviation=f"S{i}")
+        group = Group.objects.create(name=f"G{i}")
+        teacher = User.objects.create(username=f"teacher{i}", user_type='teacher')
+        Link.objects.create(user_id=teacher, subject_id=subject, group_id=group)
+        for j in range(students_per_group):
+            student = User.objects.create(username=f"student{i}-{j}", user_type='student')
+            Link.objects.create(user_id=student, subject_id=subject, group_id=group)
+        Lesson.objects.create(group=group, duration=datetime.timedelta(hours=1), fixed=True,
+                              start=(now - datetime.timedelta(days=i + 1)).replace(hour=0, minute=0, second=0,
+                                                                                   microsecond=0))
+        for j in range(2):
+            Lesson.objects.create(group=group, duration=datetime.timedelta(minutes=40 * (j + 1)))
+
+
+def list_based_cost(timetable):
+    """The cost function as it was before DayOccupancy, keeping a list of busy time slots for every user
+    Returns (cost, [{cost part: value} for each day])"""
+    total_cost = 0
+    day_costs = []
+    even_allocation_cost, variety_cost = timetable.get_static_costs()[1:]  # these don't depend on the layout
+    for day in range(timetable.days):
+        teacher_clashes = 0
+        student_clashes = 0
+        schedules = {}  # {user_id: [time_slot]}
+        for relative_start, lesson in timetable.get_scheduled_lessons(day):
+            for user in lesson.users:
+                clashes = 0
+                schedule = schedules.setdefault(user.id, [])
+                for x in range(lesson.relative_duration):
+                    if relative_start + x in schedule:
+                        clashes += 1
+                    else:
+                        schedule.append(relative_start + x)
+                if user.user_type == 'teacher':
+                    teacher_clashes += clashes
+                else:
+                    student_clashes += clashes
+        clashes_cost = timetabling.POINTS_PER_STUDENT_CLASH * student_clashes \
+            + timetabling.POINTS_PER_TEACHER_CLASH * teacher_clashes
+
+        total_lesson_time = 0
+        for student in timetable.all_students:
+            total_lesson_time += len(schedules.get(student.id, []))
+        average_lesson_time = total_lesson_time / len(timetable.all_students)
+        lessons_scheduled_cost = timetabling.DESIRED_LESSONS_MULTIPLIER * timetabling.DESIRED_LESSONS_BASE ** (
+            timetable.desired_lesson_time - average_lesson_time)
+
+        daily_workload_cost = 0
+        gaps_cost = 0
+        early_finish_cost = 0
+        for user_id in schedules:
+            daily_workload_cost += max(math.exp(len(schedules[user_id]) / timetabling.MAX_LOAD_CONSTANT)
+                                       - timetabling.MAX_LOAD_CONSTANT, 0)
+            for gap in timetable.get_gaps(user_id):
+                gaps_cost += timetable.get_gap_cost(gap)
+            finish_time = max(schedules[user_id]) - timetabling.EARLIEST_EARLY_FINISH
+            if finish_time > 0:
+                early_finish_cost += finish_time / timetabling.EARLY_FINISH_CONSTANT
+
+        total_cost += clashes_cost + even_allocation_cost + lessons_scheduled_cost + variety_cost \
+            + daily_workload_cost + gaps_cost + early_finish_cost
+        day_costs.append({
+            'teacher clashes': teacher_clashes,
+            'student clashes': student_clashes,
+            'clashes cost': clashes_cost,
+            'average lesson time': average_lesson_time,
+            'lessons scheduled cost': lessons_scheduled_cost,
+            'daily workload cost': daily_workload_cost,
+            'gaps cost': gaps_cost,
+            'early finish cost': early_finish_cost,
+        })
+    return max(total_cost, 0), day_costs
+
+
+def random_genome(population, rng, scheduled=0.7):
+    """Returns a genome with each lesson scheduled on a random day and start time with the given probability"""
+    genome = Genome(len(population.catalogue))
+    for index, lesson in enumerate(population.catalogue):
+        if rng.random() < scheduled:
+            genome.place(index, rng.randrange(population.days),
+                         rng.randint(0, population.time_per_day - lesson.relative_duration))
+    return genome
+
+
+class SchedulingContextTests(TestCase):
+    def assertLoadQueries(self, groups):
+        create_school(groups)
+        with self.assertNumQueries(5):
+            context = SchedulingContext.load(days=2)
+        self.assertEqual(len(context.catalogue), groups * 2)
+        self.assertEqual(len(context.group_data), groups)
+        self.assertEqual(len(context.all_students), groups * 3)
+        return context
+
+    def test_query_count_with_few_groups(self):
+        self.assertLoadQueries(2)
+
+    def test_query_count_with_many_groups(self):
+        self.assertLoadQueries(20)
+
+    def test_lesson_users_and_teachers(self):
+        context = self.assertLoadQueries(3)
+        for lesson in context.catalogue:
+            self.assertEqual(len(lesson.users), 4)
+            self.assertEqual(lesson.teacher.user_type, 'teacher')
+
+    def test_group_data(self):
+        context = self.assertLoadQueries(3)
+        for i, group_id in enumerate(sorted(context.group_data)):
+            self.assertEqual(context.group_data[group_id], [3600, i + 1])
+
+    def test_population_does_not_query(self):
+        context = self.assertLoadQueries(4)
+        with self.assertNumQueries(0):
+            population = Population(popsize=10, num_parents=4, num_offspring=4, guaranteed_parent_survival=2,
+                                    stopping_condition=lambda p, g: g >= 2, days=2, context=context)
+            population.start()
+
+
+class OccupancyTests(TestCase):
+    def test_matches_lists_of_time_slots(self):
+        rng = random.Random(1)
+        for x in range(50):
+            occupancy = DayOccupancy()
+            schedules = {}  # {user_id: [time_slot]}
+            clashes = {TEACHER: 0, STUDENT: 0}
+            for key in range(rng.randint(1, 30)):
+                user_ids = rng.sample(range(12), rng.randint(1, 4))
+                user_types = [TEACHER if user_id < 3 else STUDENT for user_id in user_ids]
+                start, duration = rng.randint(0, 100), rng.randint(1, 14)
+                added = occupancy.add_lesson(key, user_ids, user_types, start, duration)
+                expected = 0
+                for user_id, user_type in zip(user_ids, user_types):
+                    schedule = schedules.setdefault(user_id, [])
+                    for time_slot in range(start, start + duration):
+                        if time_slot in schedule:
+                            expected += 1
+                            clashes[user_type] += 1
+                        else:
+                            schedule.append(time_slot)
+                self.assertEqual(added, expected)
+
+            self.assertEqual(occupancy.teacher_clashes, clashes[TEACHER])
+            self.assertEqual(occupancy.student_clashes, clashes[STUDENT])
+            self.assertEqual(set(occupancy.masks), set(schedules))
+            for user_id, schedule in schedules.items():
+                self.assertEqual(occupancy.load(user_id), len(schedule))
+                self.assertEqual(occupancy.last_slot(user_id), max(schedule))
+
+    def test_removing_lessons(self):
+        rng = random.Random(2)
+        lessons = {}
+        occupancy = DayOccupancy()
+        for key in range(40):
+            lessons[key] = (rng.sample(range(8), 3), rng.randint(0, 100), rng.randint(1, 14))
+            user_ids, start, duration = lessons[key]
+            occupancy.add_lesson(key, user_ids, [TEACHER if user_id < 2 else STUDENT for user_id in user_ids], start,
+                                 duration)
+        for key in rng.sample(sorted(lessons), 25):
+            occupancy.remove_lesson(key, lessons.pop(key)[0])
+
+        rebuilt = DayOccupancy()
+        for key, (user_ids, start, duration) in lessons.items():
+            rebuilt.add_lesson(key, user_ids, [TEACHER if user_id < 2 else STUDENT for user_id in user_ids], start,
+                               duration)
+        self.assertEqual(occupancy.masks, rebuilt.masks)
+        self.assertEqual({user_id: n for user_id, n in occupancy.clashes.items() if n},
+                         {user_id: n for user_id, n in rebuilt.clashes.items() if n})
+        self.assertEqual((occupancy.teacher_clashes, occupancy.student_clashes),
+                         (rebuilt.teacher_clashes, rebuilt.student_clashes))
+
+    def test_cost_matches_list_based_cost(self):
+        synthetic.generate_school(students=40, subjects_per_student=3, seed=5)
+        population = Population(popsize=2, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, days=2,
+                                seed=1, context=SchedulingContext.load(days=2), fitness_cache_size=0)
+        rng = random.Random(3)
+        timetables = population.population + [population.new_timetable(genome=random_genome(population, rng))
+                                               for x in range(20)]
+        clashes = 0
+        for timetable in timetables:
+            cost, day_costs = list_based_cost(timetable)
+            clashes += sum(parts['teacher clashes'] + parts['student clashes'] for parts in day_costs)
+            self.assertAlmostEqual(timetable.get_cost(force=True), cost, places=9)
+            for day, parts in enumerate(day_costs):
+                for part, value in parts.items():
+                    self.assertAlmostEqual(timetable.day_costs[day][part], value, places=9, msg=part)
+        self.assertGreater(clashes, 0)
+
+
+class DeltaEvaluationTests(TestCase):
+    def setUp(self):
+        synthetic.generate_school(students=40, subjects_per_student=3, seed=6)
+        self.population = Population(popsize=6, num_parents=4, num_offspring=4, guaranteed_parent_survival=2, days=2,
+                                     seed=2, context=SchedulingContext.load(days=2), verify_delta=True,
+                                     fitness_cache_size=0)
+        self.population.evaluate_all_costs(self.population.population)
+
+    def test_random_moves(self):
+        timetable = self.population.population[0]
+        for x in range(200):
+            move = timetable.propose_move(random.randrange(2))
+            if move is not None:
+                timetable.move_lesson(*move)
+            self.assertTrue(timetable.dirty_users or not timetable.modified)
+            timetable.get_cost()  # raises an AssertionError if it differs from a full evaluation
+
+    def test_crossover_offspring_inherit_evaluation(self):
+        timetables = list(self.population.population)
+        for name in CROSSOVERS:
+            self.population.crossover_operator = get_crossover(name)
+            inherited = 0
+            for x in range(10):
+                # a parent and a copy of it with one lesson changed on the first day, so the second day is the same
+                parent1 = random.choice(self.population.population)
+                parent2 = self.population.new_timetable(genome=parent1.genome.copy())
+                parent2.move_lesson(*parent2.propose_move(0, kind=MOVE))
+                parent2.get_cost()
+                child = self.population.crossover(parent1, parent2)
+                inherited += bool(child.occupancies)
+                child.mutate(mutate_lessons_per_day=2)
+                self.assertTrue(child.dirty_users or not child.modified, name)  # so only the changes are evaluated
+                self.assertAlmostEqual(child.get_cost(), child.get_cost(force=True), places=6, msg=name)
+                timetables.append(child)
+
+                # unrelated parents, where days with too many changes are evaluated in full
+                child = self.population.crossover(*random.sample(timetables, 2)).mutate(mutate_lessons_per_day=2)
+                self.assertAlmostEqual(child.get_cost(), child.get_cost(force=True), places=6, msg=name)
+            self.assertGreater(inherited, 5, name)
+
+    def test_evolving(self):
+        self.population.stopping_condition = lambda population, generations: generations >= 5
+        self.population.repair_clashes = True
+        best = self.population.start()
+        self.assertAlmostEqual(best.get_cost(), best.get_cost(force=True), places=6)
+
+    def test_mismatch_is_reported(self):
+        parent = self.population.population[0]
+        child = self.population.new_timetable(genome=parent.genome.copy())
+        self.assertTrue(child.inherit_evaluation(parent))
+        self.assertFalse(child.modified)
+        self.assertEqual(child.get_cost(), parent.get_cost())
+
+        move = child.propose_move(0, kind=REMOVE)
+        moved_users = set(child.catalogue.participants.get_users(move[0]))
+        user_id = next(user_id for user_id in child.user_costs[0] if user_id not in moved_users)
+        load, workload_cost, early_finish_cost = child.user_costs[0][user_id]
+        child.user_costs[0][user_id] = (load, workload_cost + 1, early_finish_cost)  # as if it had been miscounted
+        child.move_lesson(*move)
+        with self.assertRaises(AssertionError):
+            child.get_cost()
+
+
+def start_child(results):
+    """Starts a process from inside a daemonic process, and reports whether it ran"""
+    context = processes.get_context()
+    child_results = context.Queue()
+    child = context.Process(target=child_results.put, args=('started',))
+    child.start()
+    results.put(child_results.get(timeout=30))
+    child.join()
+
+
+class ProcessTests(TestCase):
+    def test_context(self):
+        self.assertIs(processes.get_context(), multiprocessing.get_context())
+        with mock.patch.object(processes, 'in_daemon', return_value=True):
+            self.assertEqual(type(processes.get_context()).__module__, 'billiard.context')
+
+    def test_start_from_daemon_process(self):
+        results = multiprocessing.Queue()
+        daemon = multiprocessing.Process(target=start_child, args=(results,), daemon=True)
+        daemon.start()
+        self.assertEqual(results.get(timeout=30), 'started')
+        daemon.join()
+
+
+class FitnessCacheTests(TestCase):
+    def test_put_and_get(self):
+        cache = FitnessCache(maxsize=10)
+        self.assertIsNone(cache.get(b'a'))
+        day_costs = {0: {'clashes cost': 10}}
+        cache.put(b'a', 1.5, day_costs)
+        day_costs[0]['clashes cost'] = 20  # the cache keeps its own copy
+        self.assertEqual(cache.get(b'a'), (1.5, {0: {'clashes cost': 10}}))
+        self.assertIsNone(cache.get(b'b'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2, 'hit rate': 1 / 3, 'size': 1})
+        self.assertEqual(str(cache), "1 hits, 2 misses (33.3% hit rate, 1 stored)")
+
+    def test_least_recently_used_is_dropped(self):
+        cache = FitnessCache(maxsize=2)
+        cache.put(b'a', 1, {})
+        cache.put(b'b', 2, {})
+        cache.get(b'a')  # so b is now the least recently used
+        cache.put(b'c', 3, {})
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(b'b'))
+        self.assertEqual(cache.get(b'a')[0], 1)
+        self.assertEqual(cache.get(b'c')[0], 3)
+
+    def test_keys_are_whole_layouts(self):
+        create_school(4)
+        population = Population(popsize=4, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                context=SchedulingContext.load())
+        timetable = population.population[0]
+        timetable.get_cost()
+        copy = population.new_timetable(genome=timetable.genome.copy())
+        self.assertEqual(copy.get_genome_key(), timetable.get_genome_key())
+        index = timetable.genome.scheduled(0)[0]
+        copy.move_lesson(index, 0, (timetable.genome.starts[index] + 1) % 10)
+        self.assertNotEqual(copy.get_genome_key(), timetable.get_genome_key())
+
+        # an identical timetable is given the stored cost without being evaluated
+        population.fitness_cache.put(timetable.get_genome_key(), 123.0, timetable.day_costs)
+        duplicate = population.new_timetable(genome=timetable.genome.copy())
+        self.assertEqual(duplicate.get_cost(), 123.0)
+        self.assertEqual(duplicate.get_cost(force=True), timetable.get_cost())
+
+    def test_islands_report_cache_statistics(self):
+        create_school(4)
+        model = islands.IslandModel(islands=2, migration_interval=1, popsize=4, num_parents=2, num_offspring=4,
+                                    guaranteed_parent_survival=1, seed=1, context=SchedulingContext.load(),
+                                    stopping_condition=stopping.MaxGenerations(3))
+        model.results = model.run_in_turn(pickle.dumps(model.load_data()))
+        self.assertEqual(len(model.cache_stats), 2)
+        for stats in model.cache_stats:
+            self.assertGreater(stats['hits'] + stats['misses'], 0)
+            self.assertGreater(stats['size'], 0)
+
+
+class EvaluationTests(TestCase):
+    def setUp(self):
+        synthetic.generate_school(students=40, subjects_per_student=3, seed=7)
+        self.context = SchedulingContext.load(days=2)
+
+    def new_population(self, workers, **kwargs):
+        return Population(popsize=10, num_parents=4, num_offspring=6, guaranteed_parent_survival=2, days=2, seed=3,
+                          context=self.context, workers=workers, stopping_condition=stopping.MaxGenerations(5),
+                          **kwargs)
+
+    def test_worker_matches_get_cost(self):
+        population = self.new_population(1, fitness_cache_size=0)
+        evaluation.init_worker(population.get_evaluator_payload())
+        rng = random.Random(4)
+        for timetable in population.population + [population.new_timetable(genome=random_genome(population, rng))
+                                                  for x in range(10)]:
+            cost, day_costs = evaluation.evaluate_genome(timetable.genome)
+            self.assertEqual(cost, timetable.get_cost(force=True))
+            self.assertEqual(day_costs, timetable.day_costs)
+
+    def test_pool_matches_serial(self):
+        serial, pooled = self.new_population(1), self.new_population(2)
+        self.assertEqual([t.genome for t in serial.population], [t.genome for t in pooled.population])
+        pooled.start_workers()
+        try:
+            self.assertIsNotNone(pooled.executor)
+            serial.evaluate_all_costs(serial.population)
+            pooled.evaluate_all_costs(pooled.population)
+        finally:
+            pooled.stop_workers()
+        self.assertEqual([t.cost for t in serial.population], [t.cost for t in pooled.population])
+        self.assertEqual([t.day_costs for t in serial.population], [t.day_costs for t in pooled.population])
+
+    def test_pool_in_daemon_process(self):
+        # as in a celery prefork worker, where the workers are started with billiard
+        serial, pooled = self.new_population(1), self.new_population(2)
+        with mock.patch.object(processes, 'in_daemon', return_value=True):
+            pooled.start_workers()
+        try:
+            self.assertEqual(type(pooled.executor._mp_context).__module__, 'billiard.context')
+            serial.evaluate_all_costs(serial.population)
+            pooled.evaluate_all_costs(pooled.population)
+        finally:
+            pooled.stop_workers()
+        self.assertEqual([t.cost for t in serial.population], [t.cost for t in pooled.population])
+
+    def test_seeded_run_does_not_depend_on_workers(self):
+        results = []
+        for workers in (1, 3):
+            population = self.new_population(workers)
+            best = population.start()
+            results.append((best.get_placements(), best.get_cost(), population.evaluations))
+        self.assertEqual(results[0], results[1])
+
+
+class RecordingMonitor:
+    """Stands in for a jobs.JobMonitor, recording what the island model reports"""
+
+    def __init__(self, stop_after=None):
+        self.stop_after = stop_after
+        self.reports = []
+
+    def report(self, generations, cost):
+        self.reports.append((generations, cost))
+        return self.stop_after is not None and len(self.reports) >= self.stop_after
+
+    def cancelled(self):
+        return False
+
+
+class IslandModelTests(TestCase):
+    def test_neighbours(self):
+        self.assertEqual([islands.get_neighbours(i, 4, 'ring') for i in range(4)], [[1], [2], [3], [0]])
+        self.assertEqual([islands.get_neighbours(i, 4, 'bidirectional ring') for i in range(4)],
+                         [[1, 3], [0, 2], [1, 3], [0, 2]])
+        self.assertEqual(islands.get_neighbours(1, 2, 'bidirectional ring'), [0])
+        self.assertEqual(islands.get_neighbours(2, 4, 'complete'), [0, 1, 3])
+        for x in range(20):
+            neighbours = islands.get_neighbours(1, 4, 'random')
+            self.assertEqual(len(neighbours), 1)
+            self.assertIn(neighbours[0], [0, 2, 3])
+        for topology in islands.TOPOLOGIES:
+            self.assertEqual(islands.get_neighbours(0, 1, topology), [])
+        with self.assertRaises(ValueError):
+            islands.get_neighbours(0, 4, 'star')
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            islands.IslandModel(islands=0)
+        with self.assertRaises(ValueError):
+            islands.IslandModel(topology='star')
+
+    def test_migration(self):
+        create_school(6)
+        context = SchedulingContext.load()
+        source, destination = (Population(popsize=6, num_parents=2, num_offspring=2, guaranteed_parent_survival=1,
+                                          seed=seed, context=context) for seed in (1, 2))
+        source.evaluate_all_costs(source.population)
+        destination.evaluate_all_costs(destination.population)
+        best = sorted(source.population, key=lambda t: t.get_cost())[:2]
+        worst = sorted(destination.population, key=lambda t: t.get_cost())[-2:]
+
+        migrants = source.get_emigrants(2)
+        self.assertEqual([genome for genome, cost, day_costs in migrants], [t.genome for t in best])
+        destination.immigrate(migrants)
+        self.assertEqual(len(destination.population), 6)
+        for timetable in worst:
+            self.assertFalse(any(t is timetable for t in destination.population))
+        received = destination.population[-2:]
+        self.assertEqual(sorted(t.get_cost() for t in received), sorted(t.get_cost() for t in best))
+        self.assertFalse(any(t.modified for t in received))  # the migrants' costs are sent with them
+
+        # a received genome is copied before it is changed, so the sender's timetable is not affected
+        before = best[0].genome.copy()
+        for timetable in received:
+            timetable.mutate(mutate_lessons_per_day=3)
+        self.assertEqual(best[0].genome, before)
+
+    def test_run_in_parallel_in_daemon_process(self):
+        # as in a celery prefork worker, where the islands are started with billiard
+        create_school(4)
+        monitor = RecordingMonitor()
+        model = islands.IslandModel(islands=2, migration_interval=2, popsize=4, num_parents=2, num_offspring=4,
+                                    guaranteed_parent_survival=1, seed=1, context=SchedulingContext.load(),
+                                    stopping_condition=stopping.MaxGenerations(4), monitor=monitor)
+        with mock.patch.object(processes, 'in_daemon', return_value=True), \
+                mock.patch.object(connections, 'close_all'):  # which would drop the in-memory test database
+            best = model.start()
+        self.assertEqual(len(model.results), 2)
+        self.assertEqual(best.get_cost(), min(timetable.get_cost() for timetable in model.results))
+        self.assertEqual(len(model.cache_stats), 2)
+        # every island's generations are reported to the monitor in this process, which is never sent to the islands
+        self.assertEqual(sorted(generations for generations, cost in monitor.reports), [1, 1, 2, 2, 3, 3, 4, 4])
+        self.assertLessEqual(min(cost for generations, cost in monitor.reports), best.get_cost())
+        self.assertNotIn('monitor', model.load_data())
+
+    def test_monitor_stops_islands(self):
+        create_school(4)
+        monitor = RecordingMonitor(stop_after=1)
+        model = islands.IslandModel(islands=2, migration_interval=2, popsize=4, num_parents=2, num_offspring=4,
+                                    guaranteed_parent_survival=1, seed=1, context=SchedulingContext.load(),
+                                    stopping_condition=stopping.MaxGenerations(10_000), monitor=monitor)
+        with mock.patch.object(connections, 'close_all'):
+            model.start()
+        self.assertEqual(len(model.results), 2)
+        self.assertLess(len(monitor.reports), 100)
+
+        monitor = RecordingMonitor(stop_after=3)
+        model.monitor = monitor
+        model.run_in_turn(pickle.dumps(model.load_data()))
+        self.assertEqual(len(monitor.reports), 3)
+
+    def test_run_in_turn(self):
+        create_school(4)
+        monitor = RecordingMonitor()
+        model = islands.IslandModel(islands=3, migration_interval=2, topology='complete', popsize=4, num_parents=2,
+                                    num_offspring=4, guaranteed_parent_survival=1, seed=1,
+                                    context=SchedulingContext.load(), stopping_condition=stopping.MaxGenerations(4),
+                                    monitor=monitor)
+        model.results = model.run_in_turn(pickle.dumps(model.load_data()))
+        self.assertEqual(len(model.results), 3)
+        self.assertEqual(len(monitor.reports), 12)
+        self.assertEqual(monitor.reports[-1][1], min(timetable.get_cost() for timetable in model.results))
+        for timetable in model.results:
+            self.assertIsNone(timetable.fitness_cache)
+            self.assertFalse(timetable.modified)
+            self.assertAlmostEqual(timetable.get_cost(), timetable.get_cost(force=True), places=6)
+
+
+class Ranked:
+    """Stands in for a timetable with a fixed cost when testing the selectors"""
+
+    def __init__(self, cost):
+        self.cost = cost
+
+    def get_cost(self):
+        return self.cost
+
+
+class SelectionTests(TestCase):
+    def setUp(self):
+        random.seed(1)
+        self.ranked = [Ranked(cost) for cost in range(20)]
+
+    def mean_rank(self, selector, draws=2000):
+        chosen = selector.select(self.ranked, draws)
+        return sum(timetable.cost for timetable in chosen) / draws
+
+    def test_sizes(self):
+        for name in selection.SELECTORS:
+            selector = selection.get_selector(name)
+            self.assertEqual(len(selector.select(self.ranked, 8)), 8, name)
+            unique = selector.select(self.ranked, 8, unique=True)
+            self.assertEqual(len(unique), 8, name)
+            self.assertEqual(len(set(map(id, unique))), 8, name)
+            self.assertEqual(selector.select([], 5), [], name)
+            self.assertEqual(len(selector.select(self.ranked, 20, unique=True)), 20, name)
+
+    def test_truncation(self):
+        self.assertEqual(selection.TruncationSelector().select(self.ranked, 5), self.ranked[:5])
+
+    def test_pressure(self):
+        # the average rank chosen is in the middle (9.5) without pressure, and falls as the pressure rises
+        self.assertAlmostEqual(self.mean_rank(selection.RankSelector(pressure=1)), 9.5, delta=0.5)
+        self.assertLess(self.mean_rank(selection.RankSelector(pressure=2)),
+                        self.mean_rank(selection.RankSelector(pressure=1.5)) - 0.5)
+        self.assertAlmostEqual(self.mean_rank(selection.TournamentSelector(size=1)), 9.5, delta=0.5)
+        self.assertLess(self.mean_rank(selection.TournamentSelector(size=5)),
+                        self.mean_rank(selection.TournamentSelector(size=2)) - 1)
+        self.assertLess(self.mean_rank(selection.StochasticUniversalSampling()), 9.5 - 1)
+
+        with self.assertRaises(ValueError):
+            selection.RankSelector(pressure=2.5)
+        with self.assertRaises(ValueError):
+            selection.TournamentSelector(size=0)
+        with self.assertRaises(ValueError):
+            selection.get_selector('roulette')
+
+    def test_sus_spacing(self):
+        # each timetable is chosen either the whole or the next whole number of times it is expected to be
+        costs = [timetable.cost for timetable in self.ranked]
+        weights = [costs[-1] - cost for cost in costs]
+        selector = selection.StochasticUniversalSampling()
+        for n in (1, 7, 20, 50):
+            expected = [n * weight / sum(weights) for weight in weights]
+            for seed in range(20):
+                random.seed(seed)
+                chosen = selector.select(self.ranked, n)
+                self.assertEqual(len(chosen), n)
+                for timetable, share in zip(self.ranked, expected):
+                    count = sum(other is timetable for other in chosen)
+                    self.assertGreaterEqual(count, math.floor(share - 1e-9))
+                    self.assertLessEqual(count, math.ceil(share + 1e-9))
+
+        # equal costs give every timetable the same share, so choosing all of them chooses each once
+        equal = [Ranked(1) for x in range(10)]
+        self.assertEqual(list(map(id, selector.select(equal, 10))), list(map(id, equal)))
+
+    def test_seeded(self):
+        for name in selection.SELECTORS:
+            selector = selection.get_selector(name)
+            random.seed(5)
+            first = selector.select(self.ranked, 10)
+            random.seed(5)
+            self.assertEqual(selector.select(self.ranked, 10), first, name)
+
+
+class GenomeTests(TestCase):
+    def test_placements(self):
+        genome = Genome(5)
+        self.assertEqual(len(genome), 5)
+        self.assertEqual(genome.unscheduled(), [0, 1, 2, 3, 4])
+        self.assertEqual(genome.scheduled(), [])
+
+        genome.place(1, 0, 12)
+        genome.place(3, 2, 0)
+        genome.place(4, 0, 30)
+        self.assertEqual(genome.scheduled(), [1, 3, 4])
+        self.assertEqual(genome.scheduled(0), [1, 4])
+        self.assertEqual(genome.scheduled(1), [])
+        self.assertEqual(genome.unscheduled(), [0, 2])
+        self.assertEqual((genome.days[4], genome.starts[4]), (0, 30))
+
+        genome.place(4, UNSCHEDULED, 30)  # the start is cleared along with the day
+        self.assertEqual((genome.days[4], genome.starts[4]), (UNSCHEDULED, UNSCHEDULED))
+        self.assertEqual(genome.nbytes(), 2 * 5 * genome.days.itemsize)
+
+    def test_copy_and_equality(self):
+        genome = Genome(4)
+        genome.place(0, 1, 5)
+        copy = genome.copy()
+        self.assertEqual(copy, genome)
+        self.assertEqual(copy.tobytes(), genome.tobytes())
+
+        copy.place(0, 1, 6)
+        self.assertNotEqual(copy, genome)
+        self.assertNotEqual(copy.tobytes(), genome.tobytes())
+        self.assertEqual((genome.days[0], genome.starts[0]), (1, 5))  # the copy doesn't share arrays
+
+        # swapping a day with a start time gives different bytes
+        swapped = Genome(4)
+        swapped.place(0, 5, 1)
+        self.assertNotEqual(swapped.tobytes(), genome.tobytes())
+        self.assertNotEqual(genome, (genome.days, genome.starts))
+
+    def test_pickle(self):
+        genome = Genome(3)
+        genome.place(2, 1, 40)
+        self.assertEqual(pickle.loads(pickle.dumps(genome)), genome)
+
+
+class CatalogueTests(TestCase):
+    def setUp(self):
+        create_school(3)
+        self.lessons = [PotentiallyScheduledLesson(lesson) for lesson in Lesson.objects.filter(fixed=False)]
+
+    def test_sequence(self):
+        catalogue = LessonCatalogue(self.lessons)
+        self.assertEqual(len(catalogue), 6)
+        self.assertTrue(catalogue)
+        self.assertFalse(LessonCatalogue([]))
+        self.assertEqual(list(catalogue), self.lessons)
+        for i, lesson in enumerate(self.lessons):
+            self.assertIs(catalogue[i], lesson)
+            self.assertEqual(catalogue.index(lesson.id), i)
+        self.assertIs(LessonCatalogue.from_lessons(catalogue), catalogue)
+        self.assertEqual(list(LessonCatalogue.from_lessons(self.lessons)), self.lessons)
+
+    def test_users_loaded_once_per_group(self):
+        catalogue = LessonCatalogue(self.lessons)
+        for lesson in catalogue:
+            self.assertEqual(len(lesson.users), 4)
+            self.assertEqual(lesson.teacher.user_type, 'teacher')
+            self.assertEqual(lesson.teacher, next(user for user in lesson.users if user.user_type == 'teacher'))
+        for first, second in zip(self.lessons[::2], self.lessons[1::2]):  # both of a group's lessons are together
+            self.assertEqual(first.group_id, second.group_id)
+            self.assertIs(first.users, second.users)
+
+    def test_digest(self):
+        digest = LessonCatalogue(self.lessons).digest()
+        self.assertEqual(LessonCatalogue(self.lessons).digest(), digest)
+        self.assertNotEqual(LessonCatalogue(self.lessons[1:]).digest(), digest)
+        self.lessons[0].relative_duration += 1
+        self.assertNotEqual(LessonCatalogue(self.lessons).digest(), digest)
+
+    def test_shared_by_population(self):
+        context = SchedulingContext.load()
+        population = Population(popsize=4, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                context=context)
+        self.assertIs(population.catalogue, context.catalogue)
+        for timetable in population.population:
+            self.assertIs(timetable.catalogue, context.catalogue)
+            self.assertEqual(len(timetable.genome), len(context.catalogue))
+
+
+class ParticipantIndexTests(TestCase):
+    def test_matches_lesson_users(self):
+        create_school(3)
+        group = Group.objects.get(name="G0")
+        second_teacher = User.objects.create(username="teacher-extra", user_type='teacher')
+        subject = Subject.objects.get(name="Subject 0")
+        Link.objects.create(user_id=second_teacher, subject_id=subject, group_id=group)
+        Link.objects.create(user_id=second_teacher, subject_id=subject, group_id=group)  # linked twice
+        other = User.objects.create(username="visitor", user_type='parent')
+        Link.objects.create(user_id=other, subject_id=subject, group_id=group)
+
+        context = SchedulingContext.load()
+        index = context.catalogue.participants
+        self.assertEqual(len(index.lesson_groups), len(context.catalogue))
+        for i, lesson in enumerate(context.catalogue):
+            users = list(lesson.get_users())
+            self.assertEqual(list(index.get_users(i)), [user.id for user in users])  # including repeated links
+            self.assertEqual(list(index.get_user_types(i)), [USER_TYPES.get(user.user_type, OTHER) for user in users])
+            teachers = [user.id for user in users if user.user_type == 'teacher']
+            self.assertEqual(index.get_teacher(i), teachers[0])
+            self.assertEqual(index.get_teachers(i), tuple(dict.fromkeys(teachers)))
+            self.assertIs(index.get_users(i), index.group_users[lesson.group_id])  # stored once per group
+
+        g0 = next(i for i, lesson in enumerate(context.catalogue) if lesson.group_id == group.id)
+        self.assertEqual(len(index.get_teachers(g0)), 2)
+        self.assertEqual(index.user_types[other.id], OTHER)
+        self.assertEqual(index.user_types[second_teacher.id], TEACHER)
+
+    def test_no_teacher(self):
+        create_school(1)
+        Link.objects.filter(user_id__user_type='teacher').delete()
+        index = SchedulingContext.load().catalogue.participants
+        self.assertEqual(index.get_teacher(0), -1)
+        self.assertEqual(index.get_teachers(0), ())
+        self.assertEqual(set(index.get_user_types(0)), {STUDENT})
+
+
+class Costs:
+    """Stands in for a population whose best cost can be set when testing the stopping conditions"""
+
+    def __init__(self, cost=10.0):
+        self.population = [Ranked(cost)]
+
+    def set(self, cost):
+        self.population[0].cost = cost
+
+
+class StoppingTests(TestCase):
+    def test_time_budget(self):
+        population = Costs()
+        condition = stopping.TimeBudget(10)
+        with mock.patch.object(stopping.time, 'monotonic', return_value=100):
+            self.assertFalse(condition(population, 0))
+        with mock.patch.object(stopping.time, 'monotonic', return_value=109.9):
+            self.assertFalse(condition(population, 5))
+        with mock.patch.object(stopping.time, 'monotonic', return_value=110):
+            self.assertTrue(condition(population, 6))
+            self.assertFalse(condition(population, 0))  # starting again resets the clock
+        self.assertTrue(stopping.TimeBudget(0)(population, 0))
+        with self.assertRaises(ValueError):
+            stopping.TimeBudget(-1)
+
+    def test_stagnation(self):
+        population = Costs(10)
+        condition = stopping.Stagnation(3, tolerance=0.5)
+        self.assertFalse(condition(population, 0))
+        population.set(9.6)  # not more than the tolerance, so not an improvement
+        self.assertFalse(condition(population, 1))
+        self.assertFalse(condition(population, 2))
+        self.assertTrue(condition(population, 3))
+
+        condition = stopping.Stagnation(3, tolerance=0.5)
+        population.set(10)
+        self.assertFalse(condition(population, 0))
+        population.set(9)
+        self.assertFalse(condition(population, 2))
+        self.assertFalse(condition(population, 4))
+        self.assertTrue(condition(population, 5))  # 3 generations since the improvement at generation 2
+        with self.assertRaises(ValueError):
+            stopping.Stagnation(0)
+
+    def test_relative_improvement(self):
+        condition = stopping.RelativeImprovement(threshold=0.1, window=2)
+        population = Costs(100)
+        self.assertFalse(condition(population, 0))
+        population.set(95)
+        self.assertFalse(condition(population, 1))
+        self.assertTrue(condition(population, 2))  # 5% over 2 generations
+        population.set(50)
+        self.assertFalse(condition(population, 3))
+
+        population = Costs(0)
+        self.assertFalse(condition(population, 0))
+        self.assertFalse(condition(population, 1))
+        self.assertTrue(condition(population, 2))  # can't improve on 0
+        population.set(-1)
+        self.assertFalse(condition(population, 3))  # a negative cost is still an improvement
+        self.assertFalse(condition(population, 4))
+
+        population = Costs(math.inf)
+        self.assertFalse(condition(population, 0))
+        self.assertFalse(condition(population, 1))
+        self.assertFalse(condition(population, 2))  # any finite cost is an improvement on infinity
+        population.set(5)
+        self.assertFalse(condition(population, 3))
+        with self.assertRaises(ValueError):
+            stopping.RelativeImprovement(window=0)
+
+    def test_combinators(self):
+        population = Costs(5)
+        seen = []
+
+        def plain(current_population, generations):
+            seen.append(generations)
+            return generations >= 3
+
+        either = plain | stopping.TargetCost(1)
+        self.assertIsInstance(either, stopping.AnyOf)
+        self.assertIs(either.conditions[0], plain)
+        self.assertFalse(either(population, 0))
+        self.assertTrue(either(population, 3))
+        population.set(1)
+        self.assertTrue(either(population, 1))
+
+        both = stopping.TargetCost(1) & stopping.MaxGenerations(2)
+        self.assertFalse(both(population, 1))
+        self.assertTrue(both(population, 2))
+        population.set(5)
+        self.assertFalse(both(population, 2))
+        self.assertIsInstance(plain & stopping.MaxGenerations(2), stopping.AllOf)
+
+        # every condition hears about every generation, even when an earlier one already stops
+        seen.clear()
+        (stopping.MaxGenerations(0) | plain)(population, 7)
+        self.assertEqual(seen, [7])
+        self.assertEqual(repr(stopping.MaxGenerations(1) | stopping.TargetCost(0)), "(<MaxGenerations> | <TargetCost>)")
+
+    def test_state_per_population(self):
+        first, second = Costs(10), Costs(10)
+        condition = stopping.Stagnation(2) | stopping.RelativeImprovement(threshold=0.5, window=2)
+        for generation in range(2):
+            self.assertFalse(condition(first, generation))
+        self.assertFalse(condition(second, 0))
+        second.set(4)
+        self.assertFalse(condition(second, 1))
+        self.assertTrue(condition(first, 2))  # stagnated, while second improved
+        self.assertFalse(condition(second, 2))
+
+        budget = stopping.TimeBudget(10)
+        with mock.patch.object(stopping.time, 'monotonic', return_value=100):
+            budget(first, 0)
+        with mock.patch.object(stopping.time, 'monotonic', return_value=108):
+            budget(second, 0)
+        with mock.patch.object(stopping.time, 'monotonic', return_value=111):
+            self.assertTrue(budget(first, 1))
+            self.assertFalse(budget(second, 1))
+
+    def test_population_stops(self):
+        create_school(3)
+        population = Population(popsize=4, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                context=SchedulingContext.load(),
+                                stopping_condition=stopping.Stagnation(3) | stopping.MaxGenerations(200))
+        population.start()
+        self.assertLess(population.generations, 200)
+        self.assertGreaterEqual(population.generations, 3)
+
+        population = Population(popsize=4, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                context=SchedulingContext.load(),
+                                stopping_condition=stopping.TimeBudget(0) | stopping.MaxGenerations(200))
+        population.start()
+        self.assertEqual(population.generations, 0)
+
+
+class CarryOverTests(TestCase):
+    def setUp(self):
+        create_school(3)
+        self.previous = Population(popsize=4, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                   context=SchedulingContext.load())
+        self.timetable = self.previous.new_timetable()
+        first_group = Group.objects.get(name="G0").id
+        for index, lesson in enumerate(self.previous.catalogue):
+            start = 10 * index
+            if lesson.group_id == first_group:  # finishes at the end of the day
+                start = self.previous.time_per_day - lesson.relative_duration
+            self.timetable.genome.place(index, 0, start)
+
+    def test_placements_follow_groups(self):
+        groups = {group.name: group for group in Group.objects.all()}
+        # group 0's first lesson has been scheduled, so its longer second lesson takes its place
+        Lesson.objects.filter(group=groups["G0"], fixed=False).order_by('id').first().delete()
+        Lesson.objects.filter(group=groups["G2"], fixed=False).delete()
+        new_group = Group.objects.create(name="G3")
+        Link.objects.create(user_id=User.objects.get(username="teacher0"),
+                            subject_id=Subject.objects.get(name="Subject 0"), group_id=new_group)
+        Lesson.objects.create(group=new_group, duration=datetime.timedelta(minutes=40))
+
+        population = Population(popsize=3, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                context=SchedulingContext.load(), warm_start=[self.timetable] * 5)
+        self.assertEqual(len(population.population), 3)  # only as many as fit in the population
+        previous_starts = {lesson.group_id: self.timetable.genome.starts[index]
+                           for index, lesson in enumerate(self.previous.catalogue)}
+        for timetable in population.population:
+            self.assertIsNot(timetable.catalogue, self.previous.catalogue)
+            self.assertEqual(timetable.genome, population.population[0].genome)
+            for index, lesson in enumerate(timetable.catalogue):
+                day, start = timetable.genome.days[index], timetable.genome.starts[index]
+                if lesson.group_id == groups["G0"].id:  # moved earlier to fit in the day
+                    self.assertEqual(lesson.relative_duration, 16)
+                    self.assertEqual((day, start), (0, population.time_per_day - 16))
+                    self.assertLess(start, previous_starts[lesson.group_id])
+                elif lesson.group_id == groups["G1"].id:
+                    self.assertEqual((day, start), (0, previous_starts[lesson.group_id]))
+                else:  # a group that wasn't in the previous timetable
+                    self.assertEqual(lesson.group_id, new_group.id)
+                    self.assertEqual((day, start), (UNSCHEDULED, UNSCHEDULED))
+
+    def test_rest_are_random(self):
+        population = Population(popsize=4, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                context=SchedulingContext.load(), warm_start=[self.timetable])
+        self.assertEqual(population.population[0].genome, self.timetable.genome)
+        self.assertEqual(len(population.population), 4)
+        self.assertFalse(all(timetable.genome == self.timetable.genome for timetable in population.population[1:]))
+
+    def test_fewer_days(self):
+        population = Population(popsize=2, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                context=SchedulingContext.load(days=2), days=2)
+        timetable = population.new_timetable()
+        for index in range(len(population.catalogue)):
+            timetable.genome.place(index, index % 2, 0)
+        carried = self.previous.carry_over(timetable)  # the previous population only has one day
+        for index, lesson in enumerate(self.previous.catalogue):
+            self.assertIn(carried.genome.days[index], (0, UNSCHEDULED))
+        self.assertTrue(carried.genome.scheduled(0))
+
+
+class CheckpointTests(TestCase):
+    def setUp(self):
+        create_school(3)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.date = datetime.date(2030, 1, 7)
+        self.population = Population(popsize=3, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                     context=SchedulingContext.load())
+
+    def test_round_trip(self):
+        catalogue = self.population.catalogue
+        path = checkpoints.save(self.date, catalogue, self.population.population, directory=self.directory)
+        self.assertTrue(path.startswith(self.directory))
+        self.assertEqual(os.listdir(self.directory), [os.path.basename(path)])  # no temporary file is left behind
+        self.assertEqual(checkpoints.find(self.date, catalogue.digest(), self.directory), path)
+        self.assertEqual(checkpoints.find(self.date + datetime.timedelta(days=3), 'other', self.directory), path)
+        self.assertIsNone(checkpoints.find(self.date - datetime.timedelta(days=1), 'other', self.directory))
+
+        best_first = sorted(self.population.population, key=lambda t: t.get_cost())
+        loaded = checkpoints.load(self.date, catalogue, directory=self.directory)
+        self.assertEqual(loaded, [timetable.get_placements() for timetable in best_first])
+        for timetable, placements in zip(best_first, loaded):
+            self.assertEqual(self.population.timetable_from_placements(placements).genome, timetable.genome)
+
+        self.assertEqual(checkpoints.load(self.date, catalogue, directory=os.path.join(self.directory, 'none')), [])
+        with open(path, 'wb') as file:
+            file.write(b'not gzip')
+        self.assertEqual(checkpoints.load(self.date, catalogue, directory=self.directory), [])
+
+    def test_changed_catalogue(self):
+        old = self.population.catalogue
+        timetable = self.population.new_timetable()
+        second_group = Group.objects.get(name="G1").id
+        for index, lesson in enumerate(old):
+            if lesson.group_id != second_group:  # left unscheduled
+                timetable.genome.place(index, 0, 110 - lesson.relative_duration)
+        checkpoints.save(self.date, old, [timetable], directory=self.directory)
+        old_placements = {lesson_id: (day, start) for lesson_id, day, start in timetable.get_placements()}
+
+        # group 0's lesson is replaced by its longer second lesson, and a new group is added
+        groups = {group.name: group for group in Group.objects.all()}
+        replaced = Lesson.objects.filter(group=groups["G0"], fixed=False).order_by('id').first()
+        replaced.fixed = True
+        replaced.start = datetime.datetime(2030, 1, 1, tzinfo=datetime.timezone.utc)
+        replaced.save()
+        new_group = Group.objects.create(name="G3")
+        Link.objects.create(user_id=User.objects.get(username="teacher0"),
+                            subject_id=Subject.objects.get(name="Subject 0"), group_id=new_group)
+        Lesson.objects.create(group=new_group, duration=datetime.timedelta(minutes=40))
+        catalogue = SchedulingContext.load().catalogue
+        self.assertNotEqual(catalogue.digest(), old.digest())
+
+        random.seed(1)
+        placements, = checkpoints.load(self.date, catalogue, directory=self.directory)
+        translated = {lesson_id: (day, start) for lesson_id, day, start in placements}
+        old_ids = {lesson.id for lesson in old}
+        # lessons left unscheduled in the old catalogue stay unscheduled
+        self.assertEqual(set(translated), {lesson.id for lesson in catalogue
+                                           if lesson.id in old_placements or lesson.id not in old_ids})
+        for lesson in catalogue:
+            if lesson.id in old_placements:  # kept where it was
+                self.assertEqual(translated[lesson.id], old_placements[lesson.id])
+            elif lesson.id in old_ids:
+                self.assertNotIn(lesson.id, translated)
+            elif lesson.group_id == groups["G0"].id:  # takes the place of the lesson it replaced, but ends by 114
+                self.assertEqual(translated[lesson.id], (0, 114 - lesson.relative_duration))
+            else:  # placed at random
+                day, start = translated[lesson.id]
+                self.assertEqual(day, 0)
+                self.assertLessEqual(start + lesson.relative_duration, 114)
+        self.assertNotIn(replaced.id, translated)
+
+        # lessons on days that are no longer in the timetable are dropped
+        placements = checkpoints.translate([(replaced.id, 3, 0)], {replaced.id: groups["G0"].id}, catalogue, days=1)
+        self.assertEqual(len(placements), len(catalogue))
+        self.assertEqual({day for lesson_id, day, start in placements}, {0})
+
+    def test_prune(self):
+        catalogue = self.population.catalogue
+        today = datetime.date(2030, 3, 1)
+        for days_ago in (0, 28, 29, 60):
+            checkpoints.save(today - datetime.timedelta(days=days_ago), catalogue, self.population.population,
+                             directory=self.directory)
+        open(os.path.join(self.directory, 'notes.txt'), 'w').close()
+        checkpoints.prune(directory=self.directory, today=today)
+        self.assertEqual(sorted(name.split('_')[0] for name in os.listdir(self.directory)),
+                         ['2030-02-01', '2030-03-01', 'notes.txt'])
+        checkpoints.prune(directory=os.path.join(self.directory, 'none'), today=today)  # doesn't exist
+
+
+class EngineTests(TestCase):
+    def setUp(self):
+        create_school(4)
+        self.context = SchedulingContext.load()
+
+    def solve(self, name, **kwargs):
+        engine = engines.get_engine(name)(context=self.context, seed=1, **kwargs)
+        random.seed(1)
+        return engine, engine.solve()
+
+    def test_engines(self):
+        arguments = {
+            'ga': dict(popsize=4, num_parents=2, num_offspring=2, guaranteed_parent_survival=1,
+                       stopping_condition=stopping.MaxGenerations(5)),
+            'sa': dict(max_evaluations=300),
+            'tabu': dict(max_evaluations=300),
+        }
+        for name in engines.ENGINES:
+            engine, best = self.solve(name, **arguments[name])
+            self.assertAlmostEqual(best.get_cost(), best.get_cost(force=True), places=6, msg=name)
+            self.assertEqual(engine.history[-1][1], best.get_cost(), name)
+            costs = [cost for evaluations, cost, seconds in engine.history]
+            self.assertEqual(costs, sorted(costs, reverse=True), name)
+            self.assertGreater(engine.evaluations, 0, name)
+            self.assertEqual(engine.evaluations_to_reach(best.get_cost()), engine.history[-1][0], name)
+            self.assertIsNone(engine.evaluations_to_reach(best.get_cost() - 1), name)
+            if name != 'ga':
+                self.assertLessEqual(engine.evaluations, 300, name)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            engines.get_engine('hill climbing')
+        with self.assertRaises(ValueError):
+            engines.SimulatedAnnealing(max_evaluations=0)
+        with self.assertRaises(ValueError):
+            engines.SimulatedAnnealing(generation_size=0)
+        with self.assertRaises(ValueError):
+            engines.TabuSearch(neighbourhood=0)
+        self.assertIs(engines.get_engine(engines.TabuSearch), engines.TabuSearch)
+
+    def test_stopping_condition(self):
+        calls = []
+
+        def condition(engine, generations):
+            calls.append((generations, engine.population[0].get_cost(), engine.evaluations))
+            return generations >= 3
+
+        for name, arguments in (('sa', dict(initial_temperature=1)), ('tabu', dict(neighbourhood=5))):
+            calls.clear()
+            engine, best = self.solve(name, generation_size=10, stopping_condition=condition, **arguments)
+            self.assertEqual([generations for generations, cost, evaluations in calls], [0, 1, 2, 3], name)
+            self.assertTrue(engine.stopped, name)
+            self.assertLess(engine.evaluations, 50, name)
+            self.assertEqual(calls[-1][1], best.get_cost(), name)  # the condition sees the best timetable so far
+            costs = [cost for generations, cost, evaluations in calls]
+            self.assertEqual(costs, sorted(costs, reverse=True), name)
+
+        # should_stop, the default for the genetic algorithm, stops a local search with its default generation size
+        engine, best = self.solve('sa', initial_temperature=1, max_evaluations=500,
+                                  stopping_condition=timetabling.should_stop)
+        self.assertEqual(engine.generation_size, 5)
+        self.assertEqual(engine.evaluations, 500)
+
+    def test_time_limit(self):
+        engine, best = self.solve('tabu', time_limit=0)
+        self.assertEqual(engine.evaluations, 1)
+        engine, best = self.solve('sa', initial_temperature=1, time_limit=0)
+        self.assertEqual(engine.evaluations, 1)
+
+        # the temperature falls with the time used when that is further along than the evaluations
+        engine = engines.SimulatedAnnealing(max_evaluations=1000, time_limit=10)
+        engine.evaluations = 100
+        with mock.patch.object(engines.time, 'monotonic', return_value=105):
+            self.assertAlmostEqual(engine.get_progress(started=100), 0.5)
+            engine.evaluations = 800
+            self.assertAlmostEqual(engine.get_progress(started=100), 0.8)
+        self.assertEqual(engines.SimulatedAnnealing(max_evaluations=1000).get_progress(started=0), 0)
+
+    def test_schedule_lessons_passes_stopping_condition(self):
+        solvers = []
+        solve = engines.SimulatedAnnealing.solve
+
+        def spy(engine):
+            solvers.append(engine)
+            return solve(engine)
+
+        day = datetime.date(2030, 1, 7)
+        with mock.patch.object(engines.SimulatedAnnealing, 'solve', autospec=True, side_effect=spy):
+            timetabling.schedule_lessons(engine='sa', time_budget=60, stagnation=1, start=day, end=day,
+                                         use_checkpoints=False)
+        solver, = solvers
+        self.assertEqual(repr(solver.stopping_condition), "(<TimeBudget> | <Stagnation>)")
+        self.assertTrue(solver.stopped)  # a generation without improving stopped it, long before the time limit
+        self.assertLess(solver.evaluations, solver.max_evaluations)
+        self.assertTrue(Lesson.objects.filter(fixed=True, start__date=day).exists())
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_database_day(self):
+        create_school(3)
+        lessons = Lesson.objects.count()
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('benchmark', '--day', '2030-01-07', '--engine', 'ga', 'sa', '--generations', '3',
+                     '--evaluations', '200', '--no-memory', stdout=stdout, stderr=stderr)
+        results = json.loads(stdout.getvalue())
+        dataset, = results['datasets']
+        self.assertEqual((dataset['size'], dataset['day'], dataset['groups']), (benchmark.DATABASE, '2030-01-07', 3))
+        self.assertEqual([run['engine'] for run in dataset['runs']], ['ga', 'sa'])
+        self.assertEqual(Lesson.objects.count(), lessons)  # nothing is saved
+
+        rows = benchmark.summarise(results)
+        self.assertEqual(rows[0]['evaluations_to_reach_ga'], dataset['runs'][0]['history'][-1]['evaluations'])
+        self.assertEqual(len(stderr.getvalue().splitlines()), 2)
+
+    def test_nothing_to_schedule(self):
+        create_school(1)
+        Lesson.objects.filter(fixed=False).delete()
+        with self.assertRaises(CommandError):
+            call_command('benchmark', '--day', '2030-01-07', '--engine', 'sa', stdout=io.StringIO())
+
+
+class GroupStatisticsTests(TestCase):
+    def setUp(self):
+        create_school(3)
+        self.group = Group.objects.order_by('id').first()
+        self.now = datetime.datetime.now(datetime.timezone.utc)
+
+    def test_matches_scan(self):
+        self.assertEqual(statistics.get_group_data(), statistics.scan_group_data())
+        self.assertEqual(statistics.verify(), [])
+
+    def test_signals_connected(self):
+        # the app's own config is used however the app is named in INSTALLED_APPS, and its ready() connects the signals
+        self.assertIsInstance(django_apps.get_app_config('timetable'), TimetablingAppConfig)
+        self.assertTrue(TimetablingAppConfig.default)
+        for signal, sender in ((pre_save, Lesson), (post_save, Lesson), (post_delete, Lesson), (post_save, Group)):
+            self.assertTrue(signal.has_listeners(sender))
+
+    def test_saving_and_deleting_lessons(self):
+        earlier = Lesson.objects.create(group=self.group, duration=datetime.timedelta(minutes=30),
+                                        start=self.now - datetime.timedelta(days=10))
+        latest = Lesson.objects.create(group=self.group, duration=datetime.timedelta(minutes=20),
+                                       start=self.now - datetime.timedelta(hours=1))
+        self.assertEqual(statistics.verify(), [])
+
+        latest.duration = datetime.timedelta(minutes=50)
+        latest.save()
+        self.assertEqual(statistics.verify(), [])
+
+        latest.delete()
+        self.assertEqual(statistics.verify(), [])
+
+        earlier.start = None
+        earlier.save()
+        self.assertEqual(statistics.verify(), [])
+
+    def test_future_lessons_are_not_counted(self):
+        before = statistics.get_group_data()[self.group.id]
+        Lesson.objects.create(group=self.group, duration=datetime.timedelta(hours=2),
+                              start=self.now + datetime.timedelta(days=2))
+        self.assertEqual(statistics.get_group_data()[self.group.id], before)
+        self.assertEqual(statistics.verify(), [])
+
+    def test_missing_statistics_are_rebuilt(self):
+        self.group.statistics.delete()
+        self.assertEqual(statistics.get_group_data(), statistics.scan_group_data())
+
+
+class RepairTests(TestCase):
+    def setUp(self):
+        create_school(3)
+        teacher = User.objects.get(username='teacher0')
+        for group in Group.objects.exclude(name='G0'):
+            Link.objects.create(user_id=teacher, subject_id=Subject.objects.first(), group_id=group)
+        self.context = SchedulingContext.load()
+        self.population = Population(popsize=2, num_parents=2, num_offspring=2, guaranteed_parent_survival=1,
+                                     context=self.context)
+
+    def test_nearest_free_start(self):
+        slots = TeacherSlots(20)
+        slots.book([1], 5, 5)
+        self.assertEqual(slots.nearest_free_start([1], 0, 5), 0)
+        self.assertEqual(slots.nearest_free_start([1], 6, 5), 10)
+        self.assertEqual(slots.nearest_free_start([1], 4, 4), 1)
+        self.assertEqual(slots.nearest_free_start([2], 6, 5), 6)
+        slots.book([1], 0, 5)
+        slots.book([1], 10, 10)
+        self.assertEqual(slots.nearest_free_start([1], 3, 1), UNSCHEDULED)
+
+    def test_repair_removes_teacher_clashes(self):
+        genome = Genome(len(self.context.catalogue))
+        for index in range(len(self.context.catalogue)):
+            genome.place(index, 0, 0)
+        timetable = self.population.new_timetable(genome=genome)
+        self.population.repair_timetable(timetable)
+
+        self.assertEqual(self.population.lessons_moved + self.population.lessons_removed, 2)
+        self.assertEqual(self.population.timetables_repaired, 1)
+        starts = sorted(timetable.genome.starts[i] for i in timetable.genome.scheduled(0))
+        for previous, lesson in zip(starts, starts[1:]):
+            self.assertNotEqual(previous, lesson)
+        timetable.get_cost()
+        self.assertEqual(timetable.occupancies[0].teacher_clashes, 0)
+        self.assertEqual(repair(timetable.copy()), (0, 0))
+
+
+class SyntheticSchoolTests(TestCase):
+    def test_generate_school(self):
+        counts = synthetic.generate_school(students=30, subjects_per_student=3, seed=1)
+        self.assertEqual(User.objects.filter(user_type='student').count(), 30)
+        self.assertEqual(User.objects.filter(user_type='teacher').count(), counts['teachers'])
+        self.assertEqual(Group.objects.count(), counts['groups'])
+        self.assertEqual(Link.objects.count(), counts['links'])
+        self.assertEqual(Lesson.objects.count(), counts['lessons'])
+        self.assertEqual(statistics.verify(), [])
+        for student in User.objects.filter(user_type='student'):
+            self.assertEqual(Link.objects.filter(user_id=student).count(), 3)
+
+        context = SchedulingContext.load()
+        self.assertEqual(len(context.catalogue), counts['groups'])
+        for lesson in context.catalogue:
+            self.assertEqual(lesson.teacher.user_type, 'teacher')
+
+    def test_same_seed_gives_same_school(self):
+        def describe(prefix):
+            synthetic.generate_school(students=20, seed=2, prefix=prefix)
+            return sorted((link.user_id.username[len(prefix):], link.group_id.name) for link in
+                          Link.objects.filter(user_id__username__startswith=prefix).select_related('user_id',
+                                                                                                   'group_id'))
+
+        self.assertEqual(describe('a'), describe('b'))
+        with self.assertRaises(ValueError):
+            synthetic.generate_school(students=20, prefix='a')
+
+
+class TelemetryTests(TestCase):
+    def test_records_every_generation(self):
+        create_school(4)
+        context = SchedulingContext.load(days=2)
+        records = []
+        with tempfile.TemporaryDirectory() as directory:
+            jsonl_path = os.path.join(directory, 'run.jsonl')
+            prometheus_path = os.path.join(directory, 'run.prom')
+            telemetry = Telemetry(records.append, JsonLinesWriter(jsonl_path), PrometheusWriter(prometheus_path),
+                                  label='test')
+            population = Population(popsize=10, num_parents=4, num_offspring=4, guaranteed_parent_survival=2,
+                                    stopping_condition=lambda p, g: g >= 3, days=2, context=context,
+                                    telemetry=telemetry, repair_clashes=True)
+            population.start()
+
+            with open(jsonl_path) as file:
+                self.assertEqual([json.loads(line) for line in file], records)
+            with open(prometheus_path) as file:
+                metrics = file.read()
+
+        self.assertEqual([record['generation'] for record in records], [1, 2, 3])
+        self.assertEqual(sum(record['evaluations'] for record in records), population.evaluations)
+        for record in records:
+            self.assertEqual(set(record['phase_seconds']),
+                             {'selection', 'crossover', 'mutation', 'repair', 'evaluation'})
+            self.assertLessEqual(record['best_cost'], record['mean_cost'])
+            self.assertLessEqual(record['mean_cost'], record['worst_cost'])
+            self.assertIn('clashes cost', record['best_components'])
+        self.assertIn('timetable_generation{population="test"} 3.0', metrics)
+        self.assertIn(f'timetable_cost{{population="test",statistic="best"}} {records[-1]["best_cost"]!r}', metrics)
+
+    def test_no_overhead_without_telemetry(self):
+        create_school(2)
+        population = Population(popsize=4, num_parents=2, num_offspring=2, guaranteed_parent_survival=1,
+                                stopping_condition=lambda p, g: g >= 1)
+        self.assertIs(population.stopwatch, NULL_STOPWATCH)
+
+
+@skipIf(batch_evaluation.np is None, "numpy is not installed")
+class BatchEvaluationTests(TestCase):
+    def test_matches_get_cost(self):
+        synthetic.generate_school(students=40, subjects_per_student=3, seed=3)
+        context = SchedulingContext.load(days=2)
+        population = Population(popsize=20, num_parents=4, num_offspring=4, guaranteed_parent_survival=2, days=2,
+                                context=context, seed=1)
+        timetables = population.population + [population.new_timetable(),
+                                               population.new_timetable().random(true_random_min=5,
+                                                                                 true_random_max=30)]
+        costs, day_costs = batch_evaluation.BatchEvaluator(population.new_timetable(), max_bytes=1).evaluate(
+            [timetable.genome for timetable in timetables])
+
+        for timetable, cost, parts in zip(timetables, costs, day_costs):
+            self.assertAlmostEqual(cost, timetable.get_cost(force=True), places=6)
+            for day in range(2):
+                for part, value in timetable.day_costs[day].items():
+                    self.assertAlmostEqual(parts[day][part], value, places=6, msg=part)
+
+    def test_uses_fitness_cache(self):
+        create_school(4)
+        population = Population(popsize=6, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, seed=1,
+                                context=SchedulingContext.load(), batch_evaluation=True)
+        cache = population.fitness_cache
+        self.assertIsNotNone(cache)
+        population.evaluate_all_costs(population.population)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (0, 6, 6))
+        for timetable in population.population:
+            self.assertEqual(cache.table[timetable.get_genome_key()][0], timetable.get_cost())
+
+        # repeated layouts come from the cache rather than being evaluated again, and duplicates are evaluated once
+        repeats = [population.new_timetable(genome=timetable.genome.copy()) for timetable in population.population]
+        new = population.new_timetable().random()
+        twins = [new, population.new_timetable(genome=new.genome.copy())]
+        with mock.patch.object(population.batch_evaluator, 'evaluate',
+                               wraps=population.batch_evaluator.evaluate) as evaluate:
+            population.evaluate_all_costs(repeats + twins)
+        self.assertEqual(len(evaluate.call_args.args[0]), 1)
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (6, 8, 7))
+        for timetable in repeats + twins:
+            self.assertFalse(timetable.modified)
+            self.assertAlmostEqual(timetable.get_cost(), timetable.get_cost(force=True), places=6)
+
+    def test_population_gives_same_result(self):
+        create_school(4)
+        context = SchedulingContext.load(days=2)
+        results = []
+        for batch in (False, True):
+            population = Population(popsize=10, num_parents=4, num_offspring=4, guaranteed_parent_survival=2,
+                                    stopping_condition=lambda p, g: g >= 5, days=2, context=context, seed=2,
+                                    batch_evaluation=batch)
+            best = population.start()
+            results.append((best.get_placements(), best.get_cost()))
+        self.assertEqual(results[0][0], results[1][0])
+        self.assertAlmostEqual(results[0][1], results[1][1], places=6)
+
+
+class CrossoverTests(TestCase):
+    def setUp(self):
+        create_school(6)
+        self.population = Population(popsize=2, num_parents=2, num_offspring=2, guaranteed_parent_survival=1,
+                                     days=2, seed=4, context=SchedulingContext.load(days=2))
+        self.parent1, self.parent2 = (timetable.genome for timetable in self.population.population)
+
+    def cross(self, name):
+        return get_crossover(name).cross(self.parent1, self.parent2, self.population.catalogue, 2, 114)
+
+    def test_lessons_come_from_a_parent(self):
+        for name in CROSSOVERS:
+            for x in range(10):
+                child = self.cross(name)
+                for index in range(len(child)):
+                    placement = (child.days[index], child.starts[index])
+                    self.assertIn(placement, [(self.parent1.days[index], self.parent1.starts[index]),
+                                              (self.parent2.days[index], self.parent2.starts[index]),
+                                              (UNSCHEDULED, UNSCHEDULED)], name)
+
+    def test_group_lessons_are_inherited_together(self):
+        groups = self.population.catalogue.participants.lesson_groups
+        for x in range(10):
+            child = self.cross('group')
+            parents = {}
+            for index in range(len(child)):
+                from_parent1 = (child.days[index], child.starts[index]) == (self.parent1.days[index],
+                                                                           self.parent1.starts[index])
+                from_parent2 = (child.days[index], child.starts[index]) == (self.parent2.days[index],
+                                                                           self.parent2.starts[index])
+                sources = {1} if from_parent1 and not from_parent2 else {2} if from_parent2 and not from_parent1 \
+                    else {1, 2}
+                parents[groups[index]] = parents.get(groups[index], {1, 2}) & sources
+            for group_id, sources in parents.items():
+                self.assertTrue(sources, f"Group {group_id} has lessons from both parents")
+
+    def test_unknown_crossover(self):
+        with self.assertRaises(ValueError):
+            get_crossover('nope')
+
+
+class AdaptiveMutationTests(TestCase):
+    def setUp(self):
+        create_school(6)
+
+    def test_probabilities_follow_successful_moves(self):
+        mutation = AdaptiveMutation(strength=2, min_probability=0.1)
+        population = Population(popsize=4, num_parents=2, num_offspring=4, guaranteed_parent_survival=1, days=2,
+                                seed=3, context=SchedulingContext.load(days=2), adaptive_mutation=mutation,
+                                stopping_condition=lambda population, generations: generations >= 3)
+        population.start()
+        self.assertEqual(mutation.pending, [])
+        self.assertEqual(mutation.children, 12)
+        self.assertAlmostEqual(sum(mutation.probabilities.values()), 1)
+        self.assertTrue(all(probability >= 0.1 - 1e-9 for probability in mutation.probabilities.values()))
+        self.assertTrue(1 <= mutation.strength <= 20)
+
+    def test_update(self):
+        population = Population(popsize=2, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, days=2,
+                                seed=1, context=SchedulingContext.load(days=2))
+        parent = population.population[0]
+        mutation = AdaptiveMutation(strength=4)
+        # children made only by adding lessons are better than their parent, those made by removing them are not
+        better, worse = parent.copy(), parent.copy()
+        better.set_cost(parent.get_cost() - 1, parent.day_costs)
+        worse.set_cost(parent.get_cost() + 1, parent.day_costs)
+        mutation.pending = [(better, {ADD: 2}, parent.get_cost()), (worse, {REMOVE: 1, MOVE: 1}, parent.get_cost())]
+        mutation.update()
+        self.assertGreater(mutation.probabilities[ADD], mutation.probabilities[MOVE])
+        self.assertEqual(mutation.success_rate(), 0.5)
+        self.assertEqual(mutation.success_rate(ADD), 1)
+        self.assertEqual(mutation.success_rate(REMOVE), 0)
+        self.assertGreater(mutation.strength, 4)  # half the children succeeded, which is more than a fifth
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            AdaptiveMutation(min_probability=0.5)
+        with self.assertRaises(ValueError):
+            AdaptiveMutation(step_factor=1.5)
+
+
+class WriteBackTests(TestCase):
+    def setUp(self):
+        create_school(4)
+        self.first_day = datetime.datetime(2030, 1, 7, tzinfo=datetime.timezone.utc)
+        self.population = Population(popsize=2, num_parents=2, num_offspring=2, guaranteed_parent_survival=1, days=2,
+                                     seed=2, first_day=self.first_day,
+                                     context=SchedulingContext.load(first_day=self.first_day, days=2))
+
+    def scheduled(self):
+        return sorted(Lesson.objects.filter(fixed=True, start__gte=self.first_day).values_list(
+            'group_id', 'start', 'duration'))
+
+    def test_writing_again_adds_nothing(self):
+        timetable = self.population.population[0]
+        lessons = sum(len(timetable.get_scheduled_lessons(day)) for day in range(2))
+        unscheduled = Lesson.objects.filter(fixed=False).count()
+
+        reports = timetable.add(placeholders=True)
+        self.assertEqual(sum(report['created'] for report in reports), lessons)
+        self.assertEqual(len(self.scheduled()), lessons)
+        self.assertEqual(Lesson.objects.filter(fixed=False).count(), unscheduled + lessons)
+        self.assertTrue(all(report['statements'] > 0 for report in reports if report['created']))
+        self.assertEqual(statistics.verify(self.first_day + datetime.timedelta(days=3)), [])
+
+        reports = timetable.add(placeholders=True)
+        self.assertEqual(sum(report['created'] + report['removed'] + report['placeholders'] for report in reports), 0)
+        self.assertEqual(sum(report['kept'] for report in reports), lessons)
+        self.assertEqual(len(self.scheduled()), lessons)
+        self.assertEqual(Lesson.objects.filter(fixed=False).count(), unscheduled + lessons)
+
+    def test_different_timetable_replaces_lessons(self):
+        first, second = self.population.population
+        first.add()
+        second.add()
+        expected = sorted((lesson.group_id, writeback.get_start(second, day, start), lesson.duration)
+                          for day in range(2) for start, lesson in second.get_scheduled_lessons(day))
+        self.assertEqual(self.scheduled(), expected)
+        self.assertEqual(statistics.verify(self.first_day + datetime.timedelta(days=3)), [])
+
+    def test_lessons_entered_by_hand_are_kept(self):
+        timetable = self.population.population[0]
+        group = Group.objects.get(name="G0")
+        # a fixed lesson of a group in the catalogue, at the same time as one the scheduler might save
+        by_hand = Lesson.objects.create(group=group, duration=datetime.timedelta(hours=1), fixed=True, topic="Trip",
+                                        start=self.first_day + datetime.timedelta(hours=10))
+        scheduled = sorted((lesson.group_id, writeback.get_start(timetable, day, start), lesson.duration)
+                           for day in range(2) for start, lesson in timetable.get_scheduled_lessons(day))
+
+        reports = timetable.add()
+        self.assertEqual(sum(report['removed'] for report in reports), 0)
+        self.assertTrue(Lesson.objects.filter(id=by_hand.id, timetabled=False).exists())
+        self.assertEqual(sorted(Lesson.objects.filter(timetabled=True).values_list('group_id', 'start', 'duration')),
+                         scheduled)
+
+        # writing a different timetable replaces what the first one saved, but still not the lesson entered by hand
+        self.population.population[1].add()
+        self.assertTrue(Lesson.objects.filter(id=by_hand.id).exists())
+        self.assertEqual(Lesson.objects.filter(timetabled=True).count(),
+                         sum(len(self.population.population[1].get_scheduled_lessons(day)) for day in range(2)))
+        self.assertEqual(statistics.verify(self.first_day + datetime.timedelta(days=3)), [])
+
+
+class ScheduleJobTests(TestCase):
+    def setUp(self):
+        create_school(4)
+        self.start, self.end = datetime.date(2030, 1, 7), datetime.date(2030, 1, 8)  # a Monday and Tuesday
+
+    def test_run_job(self):
+        with mock.patch.object(jobs.run_job, 'delay') as delay:
+            job_id = jobs.start_job(self.start, self.end, engine='sa', time_budget=1, use_checkpoints=False)
+        self.assertEqual(jobs.get_job(job_id)['status'], jobs.QUEUED)
+        delay.assert_called_once()
+
+        jobs.run_job(*delay.call_args.args, **delay.call_args.kwargs)
+        job = jobs.get_job(job_id)
+        self.assertEqual(job['status'], jobs.FINISHED)
+        self.assertEqual(job['days'], ['2030-01-07', '2030-01-08'])
+        self.assertEqual([result['day'] for result in job['results']], job['days'])
+        self.assertTrue(Lesson.objects.filter(fixed=True, start__date=self.start).exists())
+        self.assertFalse(jobs.cancel_job(job_id))
+
+    def test_cancel_job(self):
+        with mock.patch.object(jobs.run_job, 'delay') as delay:
+            job_id = jobs.start_job(self.start, self.end, use_checkpoints=False)
+        self.assertTrue(jobs.cancel_job(job_id))
+        self.assertTrue(jobs.get_job(job_id)['cancelling'])
+
+        jobs.run_job(*delay.call_args.args, **delay.call_args.kwargs)
+        self.assertEqual(jobs.get_job(job_id)['status'], jobs.CANCELLED)
+        self.assertFalse(Lesson.objects.filter(fixed=True, start__date__gte=self.start).exists())
+
+    def test_cancel_from_view_stops_running_search(self):
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        with mock.patch.object(jobs.run_job, 'delay') as delay:
+            job_id = jobs.start_job(self.start, self.start, engine='sa', time_budget=60, stagnation=10_000,
+                                    use_checkpoints=False)
+        start_day = jobs.JobMonitor.start_day
+        solvers = []
+        solve = engines.SimulatedAnnealing.solve
+
+        def cancel_once_started(monitor, day):  # cancelled through the API once the day has started
+            start_day(monitor, day)
+            self.assertEqual(self.client.post(f'/api/schedule/{job_id}/cancel/').status_code, 202)
+
+        def spy(engine):
+            solvers.append(engine)
+            return solve(engine)
+
+        with mock.patch.object(jobs.JobMonitor, 'start_day', autospec=True, side_effect=cancel_once_started), \
+                mock.patch.object(engines.SimulatedAnnealing, 'solve', autospec=True, side_effect=spy), \
+                mock.patch.object(jobs, 'PROGRESS_INTERVAL', 0):
+            jobs.run_job(*delay.call_args.args, **delay.call_args.kwargs)
+
+        solver, = solvers
+        self.assertTrue(solver.stopped)
+        self.assertLess(solver.elapsed, 30)
+        self.assertLess(solver.evaluations, solver.max_evaluations)
+        self.assertEqual(self.client.get(f'/api/schedule/{job_id}/').json()['status'], jobs.CANCELLED)
+        self.assertFalse(Lesson.objects.filter(fixed=True, start__date=self.start).exists())
+
+    def test_cache_is_shared(self):
+        # jobs are stored in the database, so a separate connection to the cache, as a worker process would have,
+        # sees the same jobs
+        with mock.patch.object(jobs.run_job, 'delay'):
+            job_id = jobs.start_job(self.start, self.end)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {settings.CACHES['default']['LOCATION']}")
+            self.assertEqual(cursor.fetchone()[0], 1)
+        worker_cache = caches.create_connection('default')
+        self.assertIsNot(worker_cache, jobs.cache)
+        self.assertEqual(worker_cache.get(jobs.job_key(job_id))['status'], jobs.QUEUED)
+        self.assertTrue(jobs.cancel_job(job_id))
+        self.assertTrue(worker_cache.get(jobs.cancel_key(job_id)))
+
+    def test_monitor_stops_cancelled_search(self):
+        population = Population(popsize=2, num_parents=2, num_offspring=2, guaranteed_parent_survival=1,
+                                context=SchedulingContext.load())
+        monitor = jobs.JobMonitor('test')
+        self.assertFalse(monitor(population, 0))
+        jobs.cancel_job(jobs.update_job('test', status=jobs.RUNNING)['id'])
+        monitor.last_update = 0  # as if PROGRESS_INTERVAL had passed
+        self.assertTrue(monitor(population, 1))
+        self.assertEqual(jobs.get_job('test')['best_cost'], population.select_best_solution().get_cost())
+
+    def test_monitor_keeps_best_cost_of_any_island(self):
+        jobs.update_job('test', status=jobs.RUNNING)
+        monitor = jobs.JobMonitor('test')
+        with mock.patch.object(jobs, 'PROGRESS_INTERVAL', 0):
+            for generations, cost in [(1, 50), (1, 40), (2, 45), (2, 60)]:  # two islands, reporting in turn
+                self.assertFalse(monitor.report(generations, cost))
+        job = jobs.get_job('test')
+        self.assertEqual((job['generation'], job['best_cost']), (2, 40))
+
+    def test_islands_do_not_store_progress(self):
+        with mock.patch.object(jobs.run_job, 'delay') as delay:
+            job_id = jobs.start_job(self.start, self.start, engine='ga', iterations=2, use_checkpoints=False)
+        updates = []
+        update_job = jobs.update_job
+
+        def record(job_id, **changes):
+            updates.append(multiprocessing.current_process().name)
+            return update_job(job_id, **changes)
+
+        with mock.patch.object(jobs, 'update_job', side_effect=record), \
+                mock.patch.object(jobs, 'PROGRESS_INTERVAL', 0), \
+                mock.patch.object(timetabling, 'should_stop', stopping.MaxGenerations(3)), \
+                mock.patch.object(connections, 'close_all'):
+            jobs.run_job(*delay.call_args.args, **delay.call_args.kwargs)
+        self.assertEqual(set(updates), {multiprocessing.current_process().name})
+        job = jobs.get_job(job_id)
+        self.assertEqual(job['status'], jobs.FINISHED)
+        self.assertEqual(job['best_cost'], job['results'][0]['cost'])
+
+    def test_api(self):
+        url = '/api/schedule/'
+        data = {'start': '2030-01-07', 'end': '2030-01-08', 'engine': 'tabu'}
+        self.client.force_login(User.objects.get(username='teacher0'))
+        self.assertEqual(self.client.post(url, data).status_code, 403)
+
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        self.assertEqual(self.client.post(url, dict(data, end='2030-01-01')).status_code, 400)
+        with mock.patch.object(jobs.run_job, 'delay') as delay:
+            response = self.client.post(url, data)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(delay.call_args.kwargs, {'engine': 'tabu'})
+        job_url = response.json()['url']
+        self.assertEqual(self.client.get(job_url).json()['status'], jobs.QUEUED)
+        self.assertEqual(self.client.post(job_url + 'cancel/').status_code, 202)
+        self.assertEqual(self.client.get('/api/schedule/nope/').status_code, 404)
+
+
+class IncrementalSchedulingTests(TestCase):
+    def setUp(self):
+        create_school(3)
+        self.groups = list(Group.objects.order_by('id'))
+        self.now = datetime.datetime(2030, 1, 6, 12, tzinfo=datetime.timezone.utc)  # a Sunday
+        self.day = datetime.datetime(2030, 1, 7, tzinfo=datetime.timezone.utc)
+        # a two hour day starting at 8:30, with group 1 taught from 9:00 to 10:00 and group 2 all day
+        self.scheduler = incremental.IncrementalScheduler(time_per_day=24, now=self.now)
+        self.lessons = [Lesson.objects.create(group=group, fixed=True, timetabled=True, duration=duration,
+                                              start=self.day + datetime.timedelta(hours=hours))
+                        for group, hours, duration in ((self.groups[1], 9, datetime.timedelta(hours=1)),
+                                                       (self.groups[2], 8.5, datetime.timedelta(hours=2)))]
+
+    def new_lesson(self, minutes):
+        return Lesson.objects.create(group=self.groups[0], duration=datetime.timedelta(minutes=minutes))
+
+    def teacher_clashes(self):
+        teacher = User.objects.get(username='teacher0')
+        lessons = list(Lesson.objects.filter(group__link__user_id=teacher, start__gte=self.day).order_by('start'))
+        return any(first.start + first.duration > second.start for first, second in zip(lessons, lessons[1:]))
+
+    def test_fits_without_moving_anything(self):
+        lesson = self.new_lesson(60)
+        result = self.scheduler.reschedule(lesson)
+        self.assertEqual(result['day'], '2030-01-07')
+        self.assertEqual(result['moved'], [])
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.start, self.day + datetime.timedelta(hours=8, minutes=30))
+        self.assertTrue(lesson.fixed)
+        self.assertEqual(statistics.verify(self.day + datetime.timedelta(days=1)), [])
+
+    def test_moves_lessons_of_the_same_teacher(self):
+        Link.objects.create(user_id=User.objects.get(username='teacher0'), subject_id=Subject.objects.first(),
+                            group_id=self.groups[1])
+        lesson = self.new_lesson(60)  # only fits if group 1's lesson is moved to the start or end of the day
+        result = self.scheduler.reschedule(lesson)
+        self.assertEqual([moved[0] for moved in result['moved']], [self.lessons[0].id])
+        self.assertFalse(self.teacher_clashes())
+        self.lessons[1].refresh_from_db()
+        self.assertEqual(self.lessons[1].start, self.day + datetime.timedelta(hours=8.5))  # not involved
+
+    def test_does_not_move_lessons_entered_by_hand(self):
+        Link.objects.create(user_id=User.objects.get(username='teacher0'), subject_id=Subject.objects.first(),
+                            group_id=self.groups[1])
+        Lesson.objects.filter(id=self.lessons[0].id).update(timetabled=False)  # not saved by the scheduler
+        lesson = self.new_lesson(60)  # would fit if group 1's lesson was moved
+        self.assertIsNone(self.scheduler.reschedule(lesson))
+        self.lessons[0].refresh_from_db()
+        self.assertEqual(self.lessons[0].start, self.day + datetime.timedelta(hours=9))
+
+    def test_left_for_the_nightly_solve(self):
+        Link.objects.create(user_id=User.objects.get(username='teacher0'), subject_id=Subject.objects.first(),
+                            group_id=self.groups[1])
+        lesson = self.new_lesson(80)  # can't fit alongside group 1's hour long lesson
+        self.assertIsNone(self.scheduler.reschedule(lesson))
+        lesson.refresh_from_db()
+        self.assertIsNone(lesson.start)
+        self.lessons[0].refresh_from_db()
+        self.assertEqual(self.lessons[0].start, self.day + datetime.timedelta(hours=9))
+
+
+class TeacherSchedulerViewTests(TestCase):
+    def setUp(self):
+        create_school(1)
+        self.client.force_login(User.objects.get(username='teacher0'))
+        self.data = {'group': 'G0', 'topic': "Revision", 'duration': '3600'}
+
+    def test_reschedule_queued(self):
+        with mock.patch.object(incremental.reschedule_lesson, 'apply_async') as apply_async:
+            response = self.client.post('/teacher/schedule', self.data, follow=True)
+        lesson = Lesson.objects.get(topic="Revision")
+        apply_async.assert_called_once_with((lesson.id,), retry=False)
+        self.assertEqual(list(response.context['messages']), [])
+
+    def test_broker_failure_is_reported(self):
+        with mock.patch.object(incremental.reschedule_lesson, 'apply_async', side_effect=OSError("broker down")), \
+                self.assertLogs('timetable.views', level='ERROR') as logs:
+            response = self.client.post('/teacher/schedule', self.data, follow=True)
+        lesson = Lesson.objects.get(topic="Revision")  # still saved, for the nightly solve to schedule
+        self.assertFalse(lesson.fixed)
+        self.assertIn(f"Unable to queue rescheduling of lesson {lesson.id}", logs.output[0])
+        self.assertIn("broker down", logs.output[0])  # with the traceback
+        self.assertContains(response, "could not be placed in the timetable")
+
+
+class TimetableViewTests(TestCase):
+    def setUp(self):
+        create_school(4)
+        User.objects.filter(username='teacher0').update(title='mr', last_name='smith')
+        self.day = datetime.datetime(2030, 1, 7, tzinfo=datetime.timezone.utc)  # a Monday, as weekends aren't shown
+        # the student is in every group, so has a lesson with each teacher
+        self.student = User.objects.get(username='student0-0')
+        for i, group in enumerate(Group.objects.order_by('id')):
+            Link.objects.get_or_create(user_id=self.student, group_id=group, subject_id=Subject.objects.get(
+                name=f"Subject {i}"))
+
+    def add_lessons(self, n):
+        for i, group in enumerate(Group.objects.order_by('id')[:n]):
+            Lesson.objects.create(group=group, fixed=True, duration=datetime.timedelta(hours=1), topic=f"Topic {i}",
+                                  start=self.day + datetime.timedelta(hours=9 + i))
+
+    def get_timetable(self, user, queries):
+        self.client.force_login(user)
+        with self.assertNumQueries(queries):  # the session and user, then the lessons and their groups' teachers
+            return self.client.get('/student/', {'day': int(self.day.replace(hour=12).timestamp())})
+
+    def test_query_count_does_not_depend_on_lessons(self):
+        self.add_lessons(1)
+        self.get_timetable(self.student, 4)
+        self.add_lessons(4)
+        response = self.get_timetable(self.student, 4)
+        self.assertEqual(len(response.context['lessons']), 5)
+
+    def test_lesson_details(self):
+        self.add_lessons(2)
+        entries = reads.get_day(self.student, self.day)
+        self.assertEqual([entry.subject_name for entry in entries], ["Subject 0", "Subject 1"])
+        self.assertEqual([entry.teacher_name for entry in entries], ["Mr Smith", " "])
+        self.assertEqual([entry.group_name for entry in entries], ["G0", "G1"])
+
+        response = self.get_timetable(User.objects.get(username='teacher1'), 4)
+        self.assertEqual(response.context['lessons'], [["G1", "Topic 1", "Room", "10:00 - 11:00"]])
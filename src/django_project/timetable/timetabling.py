@@ -1,48 +1,165 @@
+import concurrent.futures
 import copy
 import datetime
+import itertools
 import math
+import operator
+import pickle
 import random
-from typing import List, Optional, Tuple
+import time
+from collections import Counter
+from typing import List, Optional, Tuple, Union
 
 from celery import Celery
 from celery.schedules import crontab
 
+from . import checkpoints, evaluation, fitness_cache, processes, repair, stopping, writeback
+from .batch_evaluation import BatchEvaluator
+from .catalogue import LessonCatalogue
+from .context import SchedulingContext
+from .crossover import Crossover, get_crossover
+from .engines import GeneticAlgorithm, get_engine
+from .fitness_cache import FitnessCache
+from .genome import Genome, UNSCHEDULED
+from .islands import IslandModel
+from .selection import Selector, get_selector
+from .telemetry import NULL_STOPWATCH, Stopwatch, Telemetry
 from .models import Lesson, User, Group
+from .mutation import AdaptiveMutation
+from .occupancy import DayOccupancy
+from .participants import STUDENT
 
 app = Celery()
 
+# constants used in the cost function
+POINTS_PER_TEACHER_CLASH = 100
+POINTS_PER_STUDENT_CLASH = 10
+MAX_LOAD_CONSTANT = 23  # max load = c ln c, where c is this value
+EARLY_FINISH_CONSTANT = 10
+EARLIEST_EARLY_FINISH = 48
+EVEN_ALLOCATION_CONSTANT_A = 0.4
+EVEN_ALLOCATION_CONSTANT_B = -8
+EVEN_ALLOCATION_CONSTANT_K = 1000
+WEIGHTING_OF_DIFF = 100
+VARIETY_BASE = 2
+VARIETY_COEFFICIENT = 1
+VARIETY_CONSTANT = 1_000_000
+DESIRED_LESSONS_BASE = 1.2
+DESIRED_LESSONS_MULTIPLIER = 25
+
 
 @app.task(run_every=crontab(hour=20, minute=0))
-def schedule_lessons(iterations=10, look_ahead_period=14):
-    """Creates a timetable using the unscheduled lessons from the database"""
+def schedule_lessons(iterations=10, look_ahead_period=14, migration_interval=10, migration_size=2, topology='ring',
+                     time_budget: Optional[float] = None, stagnation: int = 30, warm_start: bool = True,
+                     use_checkpoints: bool = True, engine: str = 'ga', start: Optional[datetime.date] = None,
+                     end: Optional[datetime.date] = None, monitor=None):
+    """Creates a timetable using the unscheduled lessons from the database
+    Each day is scheduled using an island model with one island per iteration, all evolving at the same time
+    (see islands.py). Set migration_interval to 0 for independent restarts
+
+    If time_budget is given, scheduling the whole look ahead period takes roughly that many seconds. Each day gets
+    an equal share of the time that is left, and stops early if its best cost hasn't improved for `stagnation`
+    generations, so any time saved on easy days is given to the days after them. Time spent outside the search
+    (e.g. starting the islands and saving the result) is taken from the later days' shares, so the final day may
+    overrun slightly
+
+    If warm_start is True, each day after the first starts from the best timetables of the day before (see
+    Population.carry_over) rather than from random ones, and stops as soon as it has stagnated for `stagnation`
+    generations. Consecutive days have similar lessons, so this usually finds as good a timetable much sooner
+
+    If use_checkpoints is True, the best timetables for each day are saved (see checkpoints.py), and the first day
+    of the next run starts from the most recent of them in the same way
+
+    engine is the name of one of engines.ENGINES. Other than 'ga', each day is scheduled by a single local search,
+    which runs for the day's share of time_budget if one is given, and is given the same stopping condition as the
+    genetic algorithm, counting a fixed number of moves as a generation (see engines.py)
+
+    If start and end dates are given, the weekdays from start to end (inclusive) are scheduled instead of the look
+    ahead period. Either way, days that already have lessons are skipped
+
+    monitor is a jobs.JobMonitor (see jobs.py), which is told about each day and each generation (by the island model
+    in this process, or through a local search engine's stopping condition), so that it can report progress and cancel
+    the run. A day that is cancelled is not saved"""
     base_day = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, hour=0, second=0)
-    for x in range(look_ahead_period):
-        day = base_day + datetime.timedelta(days=x)
-        end_of_day = day.replace(hour=23, minute=59, second=59)
-        if day.weekday() <= 4:  # a weekday
-            if not Lesson.objects.filter(start__gte=day, start__lte=end_of_day):
-                print('-----------')
-                print(f"SCHEDULING {day}")
-                best_result: Optional[Timetable] = None
-                for x in range(iterations):
-                    print(f"Iteration: {x+1}")
-                    population = Population(year_start=base_day, first_day=base_day + datetime.timedelta(days=x))
-                    output: Timetable = population.start()
-                    if best_result is None or output.get_cost() < best_result.get_cost():
-                        best_result = output
-
-                print(f"Adding best result (cost: {best_result.get_cost()})")
-                best_result.add()
-
-                for lesson in best_result.lessons[0]:
-                    # group = Group.objects.filter(group_id__exact=lesson.group_id)[:1].get()
-                    new_lesson = Lesson()
-                    new_lesson.group_id = lesson.group_id
-                    duration = random.randint(6, 24)
-                    new_lesson.duration = datetime.timedelta(seconds=duration * 300)
-                    new_lesson.topic = f"Automatically generated while timetabling"
-                    new_lesson.fixed = False
-                    new_lesson.save()
+    first_day = base_day
+    if start is not None and end is not None:
+        first_day = datetime.datetime.combine(start, datetime.time(), tzinfo=datetime.timezone.utc)
+        look_ahead_period = (end - start).days + 1
+    last_day = first_day + datetime.timedelta(days=look_ahead_period)
+    scheduled_days = {lesson_start.astimezone(datetime.timezone.utc).date() for lesson_start in
+                      Lesson.objects.filter(start__gte=first_day, start__lt=last_day).values_list('start', flat=True)}
+    days = [first_day + datetime.timedelta(days=x) for x in range(look_ahead_period)]
+    days = [day for day in days if day.weekday() <= 4 and day.date() not in scheduled_days]  # unscheduled weekdays
+    if monitor is not None:
+        monitor.start(days)
+
+    engine_class = get_engine(engine)
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    previous_results = None  # the best timetables of the previous day, used to warm start the next one
+    for i, day in enumerate(days):
+        if monitor is not None and monitor.cancelled():
+            print("Cancelled")
+            break
+        print('-----------')
+        print(f"SCHEDULING {day}")
+        # loaded for each day, as the lessons added for the previous day change it
+        context = SchedulingContext.load(first_day=day, year_start=base_day)
+        initial_placements = None
+        if use_checkpoints and not previous_results:
+            initial_placements = checkpoints.load(day.date(), context.catalogue)
+            print(f"Starting from {len(initial_placements)} checkpointed timetables")
+
+        share = None
+        stopping_condition = should_stop
+        if deadline is not None:
+            share = max(deadline - time.monotonic(), 0) / (len(days) - i)
+            stopping_condition = stopping.TimeBudget(share) | stopping.Stagnation(stagnation)
+            print(f"Time budget: {share:.1f}s")
+        elif previous_results or initial_placements:
+            stopping_condition = should_stop | stopping.Stagnation(stagnation)
+        if monitor is not None:
+            monitor.start_day(day)
+
+        if engine_class is GeneticAlgorithm:
+            # the monitor isn't sent to the islands, so only this process stores the job's progress
+            islands = IslandModel(islands=iterations, migration_interval=migration_interval,
+                                  migration_size=migration_size, topology=topology, monitor=monitor,
+                                  first_day=day, context=context, stopping_condition=stopping_condition,
+                                  warm_start=previous_results, initial_placements=initial_placements)
+            best_result: Timetable = islands.start()
+            results = islands.results
+            for island, cache_stats in enumerate(islands.cache_stats):
+                if cache_stats is not None:
+                    print(f"Island {island} fitness cache: {fitness_cache.describe(cache_stats)}")
+        else:
+            if monitor is not None:
+                stopping_condition = stopping_condition | monitor
+            solver = engine_class(first_day=day, context=context, time_limit=share, warm_start=previous_results,
+                                  initial_placements=initial_placements, stopping_condition=stopping_condition)
+            best_result = solver.solve()
+            results = [best_result]
+            print(f"{solver.evaluations} evaluations in {solver.elapsed:.1f}s")
+        if monitor is not None and monitor.cancelled():
+            print("Cancelled")
+            break
+        if warm_start:
+            previous_results = results
+        if use_checkpoints:
+            try:
+                checkpoints.save(day.date(), context.catalogue, results)
+            except OSError as error:
+                print(f"Warning: Unable to save checkpoint ({error})")
+        print(f"Final costs: {', '.join(f'{t.get_cost():.2f}' for t in results)}")
+
+        print(f"Adding best result (cost: {best_result.get_cost()})")
+        # each scheduled lesson gets an automatically generated lesson to replace it, in the same transaction
+        for report in best_result.add(placeholders=True):
+            print(f"Saved {writeback.describe(report)}")
+        if monitor is not None:
+            monitor.end_day(best_result.get_cost())
+
+    if use_checkpoints:
+        checkpoints.prune()
 
 
 def should_stop(current_population, iterations):
@@ -70,20 +187,13 @@ def get_unscheduled_lessons(first_day, days=1, seconds_per_unit_time: float = 30
 
 
 def get_group_data():
-    group_data = {}
-    for group in Group.objects.filter():
-        previous = None
-        time_allocated = 0
-        for lesson in Lesson.objects.filter(group_id__id__exact=group.id,
-                                            start__lte=datetime.datetime.now(tz=datetime.timezone.utc)).order_by(
-            'start'):  # oldest first
-            previous = lesson
-            time_allocated += lesson.duration.total_seconds()
-            days_since_previous = (datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0)
-                                  - previous.start.replace(tzinfo=datetime.timezone.utc, hour=0, minute=0, second=0)).days
-        group_data[group.id] = [time_allocated, days_since_previous]
+    """Gets [seconds of lessons so far, days since the last lesson] for every group (see SchedulingContext)"""
+    return SchedulingContext.load_group_data()
 
-    return group_data
+
+def get_all_students(group_data):
+    """Gets every student in any of the given groups"""
+    return list(User.objects.filter(user_type='student', link__group_id__in=list(group_data)).distinct().order_by('id'))
 
 
 def get_year_start():
@@ -101,10 +211,12 @@ def get_year_start():
     return year_start
 
 
-def schedule(*args, **kwargs):
-    """A helper function to generate the best timetable using a genetic algorithm"""
-    population = Population(*args, **kwargs)
-    return population.start()
+def schedule(*args, engine: str = 'ga', **kwargs):
+    """A helper function to generate the best timetable
+    engine is the name of one of engines.ENGINES: 'ga' (a genetic algorithm), 'sa' (simulated annealing) or 'tabu'
+    (tabu search). The other arguments are passed on to the engine, and from there to Population, e.g.
+    schedule(workers=16) to evaluate the cost function on 16 cores"""
+    return get_engine(engine)(*args, **kwargs).solve()
 
 
 class Population:
@@ -117,15 +229,57 @@ class Population:
                  first_day: Optional[datetime.datetime] = None, days: int = 1,
                  time_per_day: int = 114, seconds_per_unit_time: float = 300,
                  desired_lessons: int = 44,
-                 day_start=datetime.timedelta(hours=8, minutes=30), year_start=None):
+                 day_start=datetime.timedelta(hours=8, minutes=30), year_start=None, verify_delta=False,
+                 fitness_cache_size: int = 10_000, replace_duplicates=False, workers: int = 1,
+                 seed: Optional[int] = None, unscheduled_lessons=None, group_data=None, all_students=None,
+                 parent_selection: Union[str, Selector] = 'truncation',
+                 survivor_selection: Union[str, Selector] = 'sus', context: Optional[SchedulingContext] = None,
+                 warm_start: Optional[List['Timetable']] = None, initial_placements=None,
+                 repair_clashes: bool = False, telemetry: Optional[Telemetry] = None,
+                 batch_evaluation: bool = False, crossover_operator: Union[str, Crossover] = 'merge',
+                 adaptive_mutation: Union[bool, AdaptiveMutation] = False):
         """
         :param popsize: The population size
         :param stopping_condition: A function taking in:
          - the current population (of type Population)
          - previous population (THIS WILL BE NONE ON THE FIRST ITERATION)
          - the number of iterations / generations
-         and returning True to stop and False to continue
+         and returning True to stop and False to continue. See stopping.py for conditions that stop when the search
+         stops improving or runs out of time, and for combining them
+        :param verify_delta: Debug mode. Every delta evaluation of a timetable is checked against a full evaluation
+        :param fitness_cache_size: The number of evaluated timetables to remember, so that duplicates do not need to be
+         evaluated again. Set to 0 to disable
+        :param replace_duplicates: If True, duplicate timetables are replaced with random ones after every generation
+        :param workers: The number of processes used to evaluate the cost function. If more than 1, each generation's
+         offspring are evaluated in parallel
+        :param seed: If given, the random number generator is seeded with this, so that the result is reproducible
+         (regardless of the number of workers)
+        :param context: Everything needed from the database (see SchedulingContext.load). If not given, it is loaded
+         when the population is created, and shared by every timetable in it
+        :param unscheduled_lessons, group_data, all_students: Data that has already been loaded from the database,
+         which is used instead of the context. unscheduled_lessons can be a list of PotentiallyScheduledLessons or a
+         LessonCatalogue
+        :param parent_selection: How parents are chosen. Either a Selector or the name of one in selection.SELECTORS:
+         'truncation', 'tournament', 'rank' or 'sus'
+        :param survivor_selection: How the rest of the next generation is chosen, after the guaranteed survivors
+        :param warm_start: Timetables from a previous solve (e.g. the day before), which may have different lessons.
+         The population starts with each of them carried over (see carry_over), and the rest are random
+        :param initial_placements: Placements of timetables to start with, after any from warm_start (e.g. from
+         checkpoints.load): [((lesson id, day, relative start), ...)]
+        :param repair_clashes: If True, every offspring is repaired after crossover and mutation so that no teacher is
+         teaching two lessons at once (see repair.py). The number of lessons moved and removed is counted in
+         self.lessons_moved and self.lessons_removed
+        :param telemetry: If given, every generation is measured and passed to its hooks (see telemetry.py)
+        :param batch_evaluation: If True, the timetables that need evaluating in each generation are evaluated
+         together using NumPy (see batch_evaluation.py), instead of by workers or one at a time
+        :param crossover_operator: How offspring are made from their parents. Either a Crossover or the name of one in
+         crossover.CROSSOVERS: 'merge', 'uniform', 'group', 'teacher' or 'window'
+        :param adaptive_mutation: If True (or an AdaptiveMutation), the number of mutations per day and the kind of
+         each one are adapted to how well previous offspring did (see mutation.py), starting from mutation_amount.
+         Otherwise every offspring gets mutation_amount random mutations per day
         """
+        if seed is not None:
+            random.seed(seed)
 
         if desired_allocations is None:
             self.desired_allocations = {}
@@ -153,18 +307,45 @@ class Population:
         self.mutation_amount = mutation_amount
         self.mutation_chance = mutation_chance
         self.random_lesson_skip_probability = random_lesson_skip_probability
-
-        self.unscheduled_lessons = get_unscheduled_lessons(self.first_day, self.days, self.seconds_per_unit_time)
-        self.group_data = get_group_data()
-        self.all_students = []
-        for group_id in self.group_data:
-            for student in User.objects.filter(user_type='student', link__group_id__id__exact=group_id):
-                if student not in self.all_students:
-                    self.all_students.append(student)
+        self.verify_delta = verify_delta
+        self.replace_duplicates = replace_duplicates
+        self.duplicates_replaced = 0
+        self.repair_clashes = repair_clashes
+        self.timetables_repaired = 0  # offspring that had at least one lesson moved or removed
+        self.lessons_moved = 0
+        self.lessons_removed = 0
+        self.telemetry = telemetry
+        self.stopwatch = Stopwatch() if telemetry is not None else NULL_STOPWATCH
+        self.evaluations = 0  # the number of timetables whose cost has been needed, for comparing with other engines
+        self.workers = workers
+        self.parent_selector = get_selector(parent_selection)
+        self.survivor_selector = get_selector(survivor_selection)
+        self.crossover_operator = get_crossover(crossover_operator)
+        if adaptive_mutation is True:
+            adaptive_mutation = AdaptiveMutation(strength=mutation_amount)
+        self.adaptive_mutation: Optional[AdaptiveMutation] = adaptive_mutation or None
+        self.executor: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        if fitness_cache_size:
+            self.fitness_cache = FitnessCache(fitness_cache_size)
+        else:
+            self.fitness_cache = None
+
+        if context is None and (unscheduled_lessons is None or group_data is None or all_students is None
+                                or not year_start):
+            context = SchedulingContext.load(self.first_day, self.days, self.seconds_per_unit_time, year_start)
+        if unscheduled_lessons is None:
+            unscheduled_lessons = context.catalogue
+        self.catalogue = LessonCatalogue.from_lessons(unscheduled_lessons)
+        if group_data is None:
+            group_data = context.group_data
+        self.group_data = group_data
+        if all_students is None:
+            all_students = context.all_students
+        self.all_students = all_students
         if year_start:
             self.year_start = year_start
         else:
-            self.year_start = get_year_start()
+            self.year_start = context.year_start
 
         if self.num_parents > self.popsize:
             raise ValueError("Number of parents cannot be greater than size of population")
@@ -180,24 +361,61 @@ class Population:
                 print(f"Warning: Group {group_id} had no desired allocation. Set to 1")
 
         self.population: List[Timetable] = []
-        for x in range(self.popsize):
-            self.population.append(Timetable(first_day=self.first_day, days=self.days, time_per_day=self.time_per_day,
-                                             seconds_per_unit_time=self.seconds_per_unit_time, day_start=self.day_start,
-                                             desired_allocations=self.desired_allocations, group_data=self.group_data,
-                                             random_lesson_skip_probability=self.random_lesson_skip_probability,
-                                             desired_lesson_time=self.desired_lesson_time, all_students=self.all_students,
-                                             year_start=self.year_start, **timetable_init_kwargs).random())
+        for timetable in (warm_start or [])[:self.popsize]:
+            self.population.append(self.carry_over(timetable))
+        for placements in (initial_placements or [])[:self.popsize - len(self.population)]:
+            self.population.append(self.timetable_from_placements(placements))
+        while len(self.population) < self.popsize:
+            self.population.append(self.new_timetable().random())
+
+        self.batch_evaluator = BatchEvaluator(self.new_timetable()) if batch_evaluation else None
+
+    def new_timetable(self, **kwargs) -> 'Timetable':
+        """Creates an empty timetable using the settings of this population
+        Any keyword arguments are passed on to Timetable"""
+        settings = dict(first_day=self.first_day, days=self.days, time_per_day=self.time_per_day,
+                        seconds_per_unit_time=self.seconds_per_unit_time, day_start=self.day_start,
+                        desired_allocations=self.desired_allocations, group_data=self.group_data,
+                        random_lesson_skip_probability=self.random_lesson_skip_probability,
+                        desired_lesson_time=self.desired_lesson_time, all_students=self.all_students,
+                        year_start=self.year_start, verify_delta=self.verify_delta,
+                        fitness_cache=self.fitness_cache, catalogue=self.catalogue)
+        settings.update(self.timetable_init_kwargs)
+        settings.update(kwargs)
+        return Timetable(**settings)
+
+    def get_evaluator_payload(self) -> bytes:
+        """Returns everything a worker process needs to evaluate timetables from this population (see evaluation.py)"""
+        evaluator = self.new_timetable(fitness_cache=None, verify_delta=False)
+        return pickle.dumps(evaluator)
+
+    def start_workers(self):
+        """Starts the pool of worker processes used to evaluate the cost function, if there is more than one worker"""
+        if self.workers <= 1 or self.executor is not None:
+            return
+        # started with billiard inside a celery prefork worker (see processes.py)
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers,
+                                                               mp_context=processes.get_context(),
+                                                               initializer=evaluation.init_worker,
+                                                               initargs=(self.get_evaluator_payload(),))
+
+    def stop_workers(self):
+        """Shuts down the pool of worker processes, if there is one"""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
 
     def start(self):
         """Iterate over the solution until self.stopping_condition returns True
          self.stopping_condition should have a fallback condition on the number of iterations to prevent an infinite loop"""
 
         # print(f"Timetabling...")
-        self.population = self.evaluate_all_costs(self.population)
-        while not self.stopping_condition(self, self.generations):
-            # print(f"Iteration: {self.generations}")
-            self.iterate()
-            self.generations += 1
+        self.start_workers()
+        try:
+            for generation in self.evolve():
+                pass
+        finally:
+            self.stop_workers()
 
         # print('Selecting best solution')
         best = self.select_best_solution()
@@ -206,13 +424,36 @@ class Population:
 
         return best
 
+    def evolve(self):
+        """Iterates over the solution until self.stopping_condition returns True, yielding the number of generations
+        after each one. This allows the caller to do something between generations (e.g. migration, see islands.py)"""
+        self.population = self.evaluate_all_costs(self.population)
+        while not self.stopping_condition(self, self.generations):
+            # print(f"Iteration: {self.generations}")
+            self.iterate()
+            self.generations += 1
+            if self.telemetry is not None:
+                self.telemetry.record(self)
+            yield self.generations
+
     def iterate(self):
         """Performs one iteration of the genetic algorithm on the current population"""
 
+        self.stopwatch.start()
         parents = self.choose_parents()
+        self.stopwatch.lap('selection')
         offspring = self.generate_offspring(list(parents))
+        offspring = self.evaluate_all_costs(offspring)
+        self.stopwatch.lap('evaluation')
+        if self.adaptive_mutation is not None:
+            self.adaptive_mutation.update()
+            self.stopwatch.lap('mutation')
         candidates = list(self.population + offspring)
         self.population = self.choose_new_population(candidates)
+        self.stopwatch.lap('selection')
+        if self.replace_duplicates:
+            self.population = self.remove_duplicates(self.population)
+            self.stopwatch.lap('duplicates')
         # print(f"Best Cost: {self.select_best_solution(evaluate_costs=False).get_cost():.2f}")
 
     def select_best_solution(self, evaluate_costs=True):
@@ -230,102 +471,163 @@ class Population:
         return best
 
     def choose_new_population(self, candidates):
-        """Chooses the new population from the list of candidates
-        The value of the cost function should be either the correct value or infinity if not evaluated"""
-        new_population = []
-        previous_highest_cost = max(candidates, key=lambda t: t.get_cost()).get_cost()
+        """Chooses the new population from the list of candidates, using self.survivor_selector
+        The best self.guaranteed_surviving_parents candidates always survive"""
+        ranked = sorted(candidates, key=lambda t: t.get_cost())
+        if len(ranked) <= self.popsize:
+            return ranked
 
         # carry forward the best solutions from the previous iteration
-        for x in range(self.guaranteed_surviving_parents):
-            best_individual = min(candidates, key=lambda t: t.get_cost())
-            new_population.append(best_individual)
-            candidates.remove(best_individual)
-
-        # print(f"{len(candidates)} to choose from")
+        new_population = ranked[:self.guaranteed_surviving_parents]
+        remaining = ranked[self.guaranteed_surviving_parents:]
 
-        if len(candidates)+self.guaranteed_surviving_parents <= self.popsize:
-            return new_population + candidates
+        # choose the remaining solutions randomly, with better solutions being more likely to be chosen
+        new_population += self.survivor_selector.select(remaining, self.popsize - len(new_population), unique=True)
 
-        # choose the remaining solutions randomly, with a probability proportional to the cost function
-        # sorting the list based on cost would be ideal however is too expensive
-        while len(new_population) < self.popsize:
-            i = random.randint(0, len(candidates) - 1)
-            candidate = candidates[i]
-
-            # choose with probability (roughly) proportional to the value of the cost function
-            #   - this will be incorrect if an uncalculated cost is greater than that of the previous iteration
-            p = candidate.get_cost() / previous_highest_cost
-            # higher cost is worse, so this gives the probability that it will fail
-            if p < random.uniform(0, 1):
-                new_population.append(candidates.pop(i))
+        return new_population
 
-        # print([p.get_cost() for p in new_population])
+    def timetable_from_placements(self, placements) -> 'Timetable':
+        """Creates a timetable with the given placements: ((lesson id, day, relative start), ...)"""
+        genome = Genome(len(self.catalogue))
+        for lesson_id, day, relative_start in placements:
+            genome.place(self.catalogue.index(lesson_id), day, relative_start)
+
+        return self.new_timetable(genome=genome)
+
+    def carry_over(self, timetable: 'Timetable') -> 'Timetable':
+        """Creates a timetable with each group's lessons scheduled at the same times as in the given timetable, which
+        can be from a different catalogue (e.g. the previous day's). Start times are moved earlier if a lesson would
+        otherwise finish after the end of the day"""
+        placements = {}  # {group id: [(day, relative start)]}
+        for day in range(min(timetable.days, self.days)):
+            for relative_start, lesson in timetable.get_scheduled_lessons(day):
+                placements.setdefault(lesson.group_id, []).append((day, relative_start))
+
+        genome = Genome(len(self.catalogue))
+        for index, lesson in enumerate(self.catalogue):
+            if placements.get(lesson.group_id):
+                day, relative_start = placements[lesson.group_id].pop(0)
+                genome.place(index, day, min(relative_start, self.time_per_day - lesson.relative_duration))
+
+        return self.new_timetable(genome=genome)
+
+    def get_emigrants(self, n):
+        """Returns copies of the n best timetables, in a form that can be sent to another process:
+        [(genome, cost, day costs)]
+        Every island loads its lessons from the same data, so the genomes mean the same thing to all of them"""
+        best = sorted(self.population, key=lambda t: t.get_cost())[:n]
+        for timetable in best:
+            timetable.genome_shared = True  # the migrants may be received by an island in this process
+        return [(timetable.genome, timetable.cost, timetable.day_costs) for timetable in best]
+
+    def immigrate(self, migrants):
+        """Replaces the worst timetables with the given migrants (from get_emigrants on another population)"""
+        self.population.sort(key=lambda t: t.get_cost())
+        for i, (genome, cost, day_costs) in enumerate(migrants[:len(self.population)]):
+            timetable = self.new_timetable(genome=genome)
+            timetable.genome_shared = True
+            timetable.set_cost(cost, day_costs)
+            self.population[len(self.population) - 1 - i] = timetable
+
+    def remove_duplicates(self, population):
+        """Replaces any timetables with the same lesson layout as an earlier one with a new random timetable, to keep
+        the population diverse"""
+        seen = set()
+        for i, timetable in enumerate(population):
+            genome_key = timetable.get_genome_key()
+            if genome_key in seen:
+                population[i] = self.new_timetable().random()
+                self.duplicates_replaced += 1
+            else:
+                seen.add(genome_key)
 
-        return new_population
+        return population
 
     def evaluate_all_costs(self, population):
-        """Evaluates the cost function for every timetable in the given population"""
-        return population
+        """Evaluates the cost function for every timetable in the given population that needs it
+        If there is a pool of worker processes, the timetables are split between them"""
+        pending = [timetable for timetable in population if timetable.modified]
+        self.evaluations += len(pending)
+        if self.batch_evaluator is not None and len(pending) >= 2:
+            self.batch_evaluator.evaluate_timetables(pending, self.fitness_cache)
+            return population
+        if self.executor is None or len(pending) < 2:
+            for timetable in pending:
+                timetable.get_cost()
+            return population
+
+        to_send = {}  # {genome key: [timetables]}
+        for timetable in pending:
+            if timetable.dirty_users:
+                timetable.get_cost()  # delta evaluation is quicker than sending it to another process
+                continue
+            genome_key = timetable.get_genome_key()
+            if self.fitness_cache is not None:
+                cached = self.fitness_cache.get(genome_key)
+                if cached is not None:
+                    timetable.set_cost(*cached)
+                    continue
+            to_send.setdefault(genome_key, []).append(timetable)  # duplicates only need evaluating once
+
+        genome_keys = list(to_send)
+        genomes = [to_send[genome_key][0].genome for genome_key in genome_keys]
+        chunksize = max(1, len(genomes) // (self.workers * 4))
+        results = self.executor.map(evaluation.evaluate_genome, genomes, chunksize=chunksize)
+        for genome_key, (cost, day_costs) in zip(genome_keys, results):
+            for timetable in to_send[genome_key]:
+                timetable.set_cost(cost, day_costs)
+            if self.fitness_cache is not None:
+                self.fitness_cache.put(genome_key, cost, day_costs)
 
-        # for i, timetable in enumerate(population):
-        #     timetable: Timetable
-        #     population[i].cost = timetable.get_cost()
-        #
-        # return population
+        return population
 
     def choose_parents(self):
-        """Chooses the best parents from the population to mate"""
-
-        candidates = list(self.population)
-        parents = []
-
-        # choose the best parents
-        for x in range(self.num_parents):
-            best_parent = min(candidates, key=lambda t: t.get_cost())
-            parents.append(best_parent)
-            candidates.remove(best_parent)
-
-        return parents
+        """Chooses the parents from the population to mate, using self.parent_selector (by default the best ones)"""
+        ranked = sorted(self.population, key=lambda t: t.get_cost())
+        return self.parent_selector.select(ranked, self.num_parents, unique=True)
 
     def generate_offspring(self, parents):
         """Generates all the offspring"""
 
         offspring = []
+        stopwatch = self.stopwatch
         for x in range(self.num_offspring):
             parent1 = random.choice(parents)
             parent2 = random.choice(parents)
+            stopwatch.lap('selection')
             child = self.crossover(parent1, parent2)
-            child = child.mutate(mutate_lessons_per_day=self.mutation_amount)
+            stopwatch.lap('crossover')
+            if self.adaptive_mutation is not None:
+                child = self.adaptive_mutation.mutate(child, parent1, parent2)
+            else:
+                child = child.mutate(mutate_lessons_per_day=self.mutation_amount)
+            stopwatch.lap('mutation')
+            if self.repair_clashes:
+                self.repair_timetable(child)
+                stopwatch.lap('repair')
             offspring.append(child)
 
         #offspring = self.mutate(offspring)
 
         return offspring
 
+    def repair_timetable(self, timetable: 'Timetable') -> 'Timetable':
+        """Moves or removes lessons so that no teacher is teaching two at once, counting the changes made"""
+        moved, removed = repair.repair(timetable)
+        if moved or removed:
+            self.timetables_repaired += 1
+        self.lessons_moved += moved
+        self.lessons_removed += removed
+        return timetable
+
     def crossover(self, parent1, parent2):
-        """Returns one offspring containing half information from each parent"""
+        """Returns one offspring containing information from each parent, using self.crossover_operator"""
 
-        new_lessons = {}
-        for day in range(self.days):
-            new_lessons[day] = []
-            added_ids = []
-            potential_new_lessons = (parent1.lessons[day] + parent2.lessons[day]).copy()
-            random.shuffle(potential_new_lessons)
-
-            for x in range(len(potential_new_lessons) // 2):
-                if potential_new_lessons:
-                    lesson: PotentiallyScheduledLesson = potential_new_lessons.pop(0)
-                    if lesson.id not in added_ids:
-                        new_lessons[day].append(lesson.copy())
-                        added_ids.append(lesson.id)
-
-        timetable = Timetable(lessons=new_lessons, first_day=self.first_day, days=self.days,
-                              time_per_day=self.time_per_day, seconds_per_unit_time=self.seconds_per_unit_time,
-                              desired_allocations=self.desired_allocations, group_data=self.group_data,
-                              day_start=self.day_start, desired_lesson_time=self.desired_lesson_time,
-                              random_lesson_skip_probability=self.random_lesson_skip_probability,
-                              all_students=self.all_students, unscheduled_lessons=self.unscheduled_lessons,
-                              year_start=self.year_start, **self.timetable_init_kwargs)
+        genome = self.crossover_operator.cross(parent1.genome, parent2.genome, self.catalogue, self.days,
+                                               self.time_per_day)
+        timetable = self.new_timetable(genome=genome)
+        if self.batch_evaluator is None:  # batches are always evaluated in full, so there is no need
+            timetable.inherit_evaluation(parent1, parent2)
 
         return timetable  # the cost function may not be needed, so it does not need to be executed here
 
@@ -344,8 +646,17 @@ class Timetable:
 
     def __init__(self, first_day: Optional[datetime.datetime] = None, days: int = 1, time_per_day: int = 114,
                  seconds_per_unit_time: float = 300, day_start=datetime.timedelta(hours=8, minutes=30), year_start=None,
-                 unscheduled_lessons=None, group_data=None, desired_allocations=None, lessons=None,
-                 desired_lesson_time=44, random_lesson_skip_probability: float = 0.2, all_students=None):
+                 unscheduled_lessons=None, group_data=None, desired_allocations=None, genome: Optional[Genome] = None,
+                 desired_lesson_time=44, random_lesson_skip_probability: float = 0.2, all_students=None,
+                 verify_delta=False, fitness_cache: Optional[FitnessCache] = None,
+                 catalogue: Optional[LessonCatalogue] = None, context: Optional[SchedulingContext] = None):
+        """
+        :param catalogue: The lessons that could be scheduled, shared with the rest of the population. If not given,
+         one is created from unscheduled_lessons (or the context, if that isn't given either)
+        :param context: Everything needed from the database. If not given, but something else is missing, it is loaded
+         from the database
+        :param genome: When each lesson in the catalogue is scheduled. If not given, no lessons are scheduled
+        """
         if first_day:
             self.first_day = first_day
         else:
@@ -362,72 +673,132 @@ class Timetable:
             self.desired_allocations = {}
         self.cost = float('inf')
         self.modified = True
+        self.verify_delta = verify_delta
+        self.fitness_cache = fitness_cache
+
+        # stored parts of the last evaluation, so that small changes can be evaluated quickly (see move_lesson)
+        self.static_costs = None
+        self.occupancies = {}  # {day: DayOccupancy}
+        self.user_costs = {}  # {day: {user_id: (time units busy, daily workload cost, early finish cost)}}
+        self.day_costs = {}  # {day: {cost part: value}}
+        self.dirty_users = {}  # {day: {user_id}} for users who need re-evaluating, or {day: None} for the whole day
+
+        if context is None and ((catalogue is None and unscheduled_lessons is None) or group_data is None
+                                or not year_start):
+            context = SchedulingContext.load(self.first_day, self.days, self.seconds_per_unit_time, year_start)
 
         if year_start:
             self.year_start = year_start
         else:
-            self.year_start = get_year_start()
+            self.year_start = context.year_start
 
-        if unscheduled_lessons:
-            self.unscheduled_lessons = []
-            for lesson in unscheduled_lessons:
-                self.unscheduled_lessons.append(lesson.copy())
-        else:
-            self.unscheduled_lessons = get_unscheduled_lessons(self.first_day, self.days, self.seconds_per_unit_time)
-        random.shuffle(self.unscheduled_lessons)
+        if catalogue is None:
+            if unscheduled_lessons is None:
+                unscheduled_lessons = context.catalogue
+            catalogue = LessonCatalogue.from_lessons(unscheduled_lessons)
+        self.catalogue = catalogue
 
-        if group_data:
+        if group_data is not None:
             self.group_data = group_data
         else:
-            self.group_data = get_group_data()
+            self.group_data = context.group_data
 
+        if all_students is None and context is not None:
+            all_students = context.all_students
         self.all_students = all_students
 
-        if not lessons:
-            self.lessons = {}  # format {day: lesson} of type {int: PotentiallyScheduledLesson}
-            for d in range(self.days):
-                self.lessons[d] = []
+        # the only state that belongs to this timetable alone. If it is shared with another timetable (see copy), it
+        # is copied before it is first changed
+        if genome is None:
+            self.genome = Genome(len(self.catalogue))
         else:
-            self.lessons = lessons
+            self.genome = genome
+        self.genome_shared = False
 
     def __eq__(self, other):
         if isinstance(other, Timetable):
-            return self.lessons == other.lessons
+            return self.genome == other.genome
         else:
             return self == other
 
+    def copy(self) -> 'Timetable':
+        """Returns a timetable with the same layout and cost
+        The genome is shared between the two until either of them changes it"""
+        other = copy.copy(self)
+        other.day_costs = {day: dict(parts) for day, parts in self.day_costs.items()}
+        other.occupancies = {}  # so the first change to the copy is evaluated in full
+        other.user_costs = {}
+        other.dirty_users = {}
+        other.modified = self.modified or bool(self.dirty_users)
+        self.genome_shared = other.genome_shared = True
+        return other
+
+    def get_writable_genome(self) -> Genome:
+        """Returns self.genome, copying it first if it is shared with another timetable"""
+        if self.genome_shared:
+            self.genome = self.genome.copy()
+            self.genome_shared = False
+        return self.genome
+
+    @property
+    def unscheduled_lessons(self) -> List['PotentiallyScheduledLesson']:
+        """The lessons that have not been scheduled on any day"""
+        return [self.catalogue[i] for i in self.genome.unscheduled()]
+
+    def get_scheduled_lessons(self, day: int) -> List[Tuple[int, 'PotentiallyScheduledLesson']]:
+        """Returns every lesson scheduled on the given day, earliest first: [(relative start, lesson)]"""
+        starts = self.genome.starts
+        return sorted(((starts[i], self.catalogue[i]) for i in self.genome.scheduled(day)), key=lambda x: x[0])
+
+    def get_genome(self) -> Tuple[Tuple[int, int, int], ...]:
+        """Returns the layout of the lessons in a canonical form, which is the same for any two timetables with
+        the same lessons scheduled at the same times: ((lesson id, day, relative start), ...)"""
+        return tuple(sorted(self.get_placements()))
+
+    def get_placements(self) -> Tuple[Tuple[int, int, int], ...]:
+        """Returns a copy of the layout of the lessons that does not depend on the order of the catalogue:
+        ((lesson id, day, relative start), ...)"""
+        days, starts = self.genome.days, self.genome.starts
+        return tuple((self.catalogue[i].id, days[i], starts[i]) for i in self.genome.scheduled())
+
+    def get_genome_key(self) -> bytes:
+        """Returns the layout of the lessons as bytes, which are equal for two timetables sharing a catalogue if and
+        only if they have the same lessons scheduled at the same times (see Genome.tobytes)"""
+        return self.genome.tobytes()
+
     def random(self, threshold=10, true_random_min=None, true_random_max=None):
         """Generates a random solution
         This algorithm makes some attempt to minimise teacher clashes while being quick to execute"""
 
+        genome = self.get_writable_genome()
         if true_random_min and true_random_max:
             for x in range(random.randint(true_random_min, true_random_max)):
-                lesson = random.choice(self.unscheduled_lessons)
-                lesson = PotentiallyScheduledLesson(lesson)
-                latest_end = self.time_per_day - lesson.relative_duration
-                lesson.relative_start = random.randint(0, latest_end)
-                self.lessons[0].append(lesson)
+                index = random.randrange(len(self.catalogue))
+                latest_end = self.time_per_day - self.catalogue[index].relative_duration
+                genome.place(index, 0, random.randint(0, latest_end))
 
         else:
+            order = list(range(len(self.catalogue)))
+            random.shuffle(order)
             counter = 0
-            for lesson in self.unscheduled_lessons:
-                lesson: PotentiallyScheduledLesson
-                teacher = self.get_teacher(lesson)
+            for index in order:
+                lesson = self.catalogue[index]
+                teacher_id = self.catalogue.participants.get_teacher(index)
                 day = random.randint(0, self.days - 1)
-                gaps = self.get_gaps(user_id=teacher.id, days=[day], random_order=True, boundaries=True)
+                gaps = self.get_gaps(user_id=teacher_id, days=[day], random_order=True, boundaries=True)
 
                 for gap_start, gap in gaps:  # for each (random) gap...
                     if random.uniform(0, 1) < self.random_lesson_skip_probability:
                         continue
                     if gap > lesson.relative_duration + 1:  # if there's enough space for a lesson (need at least 1 unit either side)...
                         if gap < lesson.relative_duration * 1.5:  # if there's not much space...
-                            lesson.relative_start = gap_start + 1  # schedule for start of gap (plus 1 unit break)
+                            relative_start = gap_start + 1  # schedule for start of gap (plus 1 unit break)
                             # TODO: Randomly choose between start and end
                         else:
                             latest_end = gap_start + gap - 2
-                            lesson.relative_start = random.randint(gap_start,
-                                                                   latest_end - lesson.relative_duration)  # allocate to random position
-                        self.lessons[day].append(lesson)
+                            relative_start = random.randint(gap_start,
+                                                            latest_end - lesson.relative_duration)  # allocate to random position
+                        genome.place(index, day, relative_start)
                         break
                     else:
                         continue
@@ -443,7 +814,7 @@ class Timetable:
     def get_teacher(self, lesson: 'PotentiallyScheduledLesson'):
         """Gets a teacher who teaches the given lesson
         Teachers are cached, so the cached version will be returned upon any future calls"""
-        if not hasattr(lesson, 'teacher'):
+        if lesson.teacher is None:
             lesson.teacher = User.objects.filter(link__group_id__lesson__id__exact=lesson.id,
                                                  user_type__exact='teacher')[:1].get()
         return lesson.teacher
@@ -462,13 +833,12 @@ class Timetable:
         previous = None
         gaps = []
         for day in days:
-            sorted(self.lessons[day])
             if boundaries:
                 previous = 0
-            for lesson in self.lessons[day]:
+            for relative_start, lesson in self.get_scheduled_lessons(day):
                 if previous:
-                    gaps.append((previous, lesson.relative_start - previous))
-                previous = lesson.relative_start
+                    gaps.append((previous, relative_start - previous))
+                previous = relative_start
             if boundaries:
                 gaps.append((previous, self.time_per_day - previous))
 
@@ -492,52 +862,11 @@ class Timetable:
         else:
             return 0
 
-    def get_cost(self, debug=False, force=False):
-        """Evaluates the cost function for the current solution"""
-        POINTS_PER_TEACHER_CLASH = 100
-        POINTS_PER_STUDENT_CLASH = 10
-        MAX_LOAD_CONSTANT = 23  # max load = c ln c, where c is this value
-        EARLY_FINISH_CONSTANT = 10
-        EARLIEST_EARLY_FINISH = 48
-        EVEN_ALLOCATION_CONSTANT_A = 0.4
-        EVEN_ALLOCATION_CONSTANT_B = -8
-        EVEN_ALLOCATION_CONSTANT_K = 1000
-        WEIGHTING_OF_DIFF = 100
-        VARIETY_BASE = 2
-        VARIETY_COEFFICIENT = 1
-        VARIETY_CONSTANT = 1_000_000
-        DESIRED_LESSONS_BASE = 1.2
-        DESIRED_LESSONS_MULTIPLIER = 25
-
-        if not self.modified and not force and not debug:
-            return self.cost
-
-        total_cost = 0
-        debug_info = {}
-        for day in range(self.days):
-            # constraints 1 & 2: clashes
-            teacher_clashes = 0
-            student_clashes = 0
-            schedules = {}  # {user_id: [time_slot]}
-            user_types = {}  # {user_id: user_type}
-            for lesson in self.lessons[day]:
-                for user in lesson.get_users():
-                    clashes = 0
-                    if user.id not in schedules:
-                        schedules[user.id] = []
-                    for x in range(lesson.relative_duration):
-                        time_slot = lesson.relative_start + x
-                        if time_slot in schedules[user.id]:
-                            clashes += 1
-                        else:
-                            schedules[user.id].append(time_slot)
-                    if user.user_type == 'teacher':
-                        teacher_clashes += clashes
-                    else:
-                        student_clashes += clashes
-                    user_types[user.id] = user.user_type
-            clashes_cost = POINTS_PER_STUDENT_CLASH * student_clashes + POINTS_PER_TEACHER_CLASH * teacher_clashes
-
+    def get_static_costs(self):
+        """Returns the parts of the cost function that do not depend on when lessons are scheduled:
+        (total diffs, even allocation cost, variety cost)
+        These are the same for every day, so they are only calculated once"""
+        if self.static_costs is None:
             # constraint 3: even allocation of lesson times
             def sigmoid(a):
                 return 1 / (1 + math.exp(-a))
@@ -551,81 +880,176 @@ class Timetable:
                 diffs += diff
             even_allocation_cost = WEIGHTING_OF_DIFF * weighting * diffs / EVEN_ALLOCATION_CONSTANT_K
 
-            # constraint 3a: how many lessons
-            total_lesson_time = 0
-            n_students = 0
-            if not self.all_students:
-                for user_id in schedules:
-                    if user_types[user_id] == 'student':
-                        total_lesson_time += len(schedules[user_id])
-                        n_students += 1
-            else:
-                for student in self.all_students:
-                    if student.id in schedules:
-                        total_lesson_time += len(schedules[student.id])
-                    n_students += 1
-            try:
-                average_lesson_time = total_lesson_time / n_students
-            except ZeroDivisionError:
-                average_lesson_time = 0
-            lessons_scheduled_cost = DESIRED_LESSONS_MULTIPLIER * DESIRED_LESSONS_BASE ** (self.desired_lesson_time - average_lesson_time)
-
-            # NOTE: constraint 4 is being computed with constraint 7
-
             # constraint 5: variety of subjects
             variety_cost = 0
             for group_id in self.group_data:
                 variety_cost += VARIETY_COEFFICIENT * (VARIETY_BASE ** self.group_data[group_id][1])
             variety_cost /= VARIETY_CONSTANT * len(self.group_data)
 
-            # constraint 6: max daily workload
-            daily_workload_cost = 0
-            for user_id in schedules:
-                # NOTE: It is assumed that if any clashes occur, the user will miss out on
-                # all but one of the concurrent events, so it does not contribute to their overall workload
-                daily_workload_cost += max(math.exp(len(schedules[user_id]) / MAX_LOAD_CONSTANT) - MAX_LOAD_CONSTANT, 0)
-
-            # constraint 7: gaps
-            gaps_cost = 0
-            for user_id in schedules:  # NOTE: schedules is only used for a list of user ids
-                gaps = self.get_gaps(user_id)
-                for gap in gaps:
-                    gaps_cost += self.get_gap_cost(gap)
-
-            # constraint 8: early finish time
-            early_finish_cost = 0
-            for user_id in schedules:
-                finish_time = max(schedules[user_id]) - EARLIEST_EARLY_FINISH
-                if finish_time > 0:
-                    early_finish_cost += finish_time / EARLY_FINISH_CONSTANT
-
-            total_cost += clashes_cost + even_allocation_cost + lessons_scheduled_cost + variety_cost \
-                          + daily_workload_cost + gaps_cost + early_finish_cost
-
-            debug_info = {
-                'teacher clashes': teacher_clashes,
-                'student clashes': student_clashes,
-                'clashes cost': clashes_cost,
-                'total diffs': diffs,
-                'even allocation cost': even_allocation_cost,
-                'average lesson time': average_lesson_time,
-                'lessons scheduled cost': lessons_scheduled_cost,
-                'variety cost': variety_cost,
-                'daily workload cost': daily_workload_cost,
-                'gaps cost': gaps_cost,
-                'early finish cost': early_finish_cost
-            }
-
-            # print(debug_info)
+            self.static_costs = (diffs, even_allocation_cost, variety_cost)
+
+        return self.static_costs
+
+    def get_user_cost(self, occupancy: DayOccupancy, user_id) -> Tuple[int, float, float]:
+        """Returns the parts of the cost function that only depend on one user's day:
+        (time units busy, daily workload cost, early finish cost)"""
+        load = occupancy.load(user_id)
+
+        # constraint 6: max daily workload
+        # NOTE: It is assumed that if any clashes occur, the user will miss out on
+        # all but one of the concurrent events, so it does not contribute to their overall workload
+        daily_workload_cost = max(math.exp(load / MAX_LOAD_CONSTANT) - MAX_LOAD_CONSTANT, 0)
+
+        # constraint 8: early finish time
+        early_finish_cost = 0
+        finish_time = occupancy.last_slot(user_id) - EARLIEST_EARLY_FINISH
+        if finish_time > 0:
+            early_finish_cost = finish_time / EARLY_FINISH_CONSTANT
+
+        return load, daily_workload_cost, early_finish_cost
+
+    def evaluate_day(self, day, user_ids=None):
+        """Evaluates the cost function for a single day, storing the result in self.day_costs
+        If user_ids is given, only those users are re-evaluated and the stored values are used for everyone else.
+        The gaps cost is filled in by get_cost, as it depends on every day"""
+        if user_ids is None:
+            # constraints 1 & 2: clashes
+            occupancy = DayOccupancy()  # keeps track of when each user is busy
+            starts = self.genome.starts
+            participants = self.catalogue.participants
+            for index in self.genome.scheduled(day):
+                occupancy.add_lesson(index, participants.get_users(index), participants.get_user_types(index),
+                                     starts[index], self.catalogue[index].relative_duration)
+            user_costs = {user_id: self.get_user_cost(occupancy, user_id) for user_id in occupancy.masks}
+            self.occupancies[day] = occupancy
+            self.user_costs[day] = user_costs
+        else:
+            occupancy = self.occupancies[day]  # this has already been updated by move_lesson
+            user_costs = self.user_costs[day]
+            for user_id in user_ids:
+                if user_id in occupancy.masks:
+                    user_costs[user_id] = self.get_user_cost(occupancy, user_id)
+                else:  # the user no longer has any lessons on this day
+                    user_costs.pop(user_id, None)
+
+        teacher_clashes = occupancy.teacher_clashes
+        student_clashes = occupancy.student_clashes
+        clashes_cost = POINTS_PER_STUDENT_CLASH * student_clashes + POINTS_PER_TEACHER_CLASH * teacher_clashes
+
+        # constraints 3 & 5: even allocation and variety
+        diffs, even_allocation_cost, variety_cost = self.get_static_costs()
+
+        # constraint 3a: how many lessons
+        total_lesson_time = 0
+        n_students = 0
+        if not self.all_students:
+            for user_id in user_costs:
+                if occupancy.user_types[user_id] == STUDENT:
+                    total_lesson_time += user_costs[user_id][0]
+                    n_students += 1
+        else:
+            for student in self.all_students:
+                if student.id in user_costs:
+                    total_lesson_time += user_costs[student.id][0]
+                n_students += 1
+        try:
+            average_lesson_time = total_lesson_time / n_students
+        except ZeroDivisionError:
+            average_lesson_time = 0
+        lessons_scheduled_cost = DESIRED_LESSONS_MULTIPLIER * DESIRED_LESSONS_BASE ** (self.desired_lesson_time - average_lesson_time)
+
+        # NOTE: constraint 4 is being computed with constraint 7
+
+        # constraints 6 & 8: max daily workload and early finish time
+        daily_workload_cost = 0
+        early_finish_cost = 0
+        for load, user_workload_cost, user_early_finish_cost in user_costs.values():
+            daily_workload_cost += user_workload_cost
+            early_finish_cost += user_early_finish_cost
+
+        self.day_costs[day] = {
+            'teacher clashes': teacher_clashes,
+            'student clashes': student_clashes,
+            'clashes cost': clashes_cost,
+            'total diffs': diffs,
+            'even allocation cost': even_allocation_cost,
+            'average lesson time': average_lesson_time,
+            'lessons scheduled cost': lessons_scheduled_cost,
+            'variety cost': variety_cost,
+            'daily workload cost': daily_workload_cost,
+            'gaps cost': 0,
+            'early finish cost': early_finish_cost
+        }
+
+    def get_cost(self, debug=False, force=False):
+        """Evaluates the cost function for the current solution
+        If the only changes since the last evaluation were made with move_lesson (e.g. by mutate), or since the
+        evaluation inherited from a parent (see inherit_evaluation), only the users in the changed lessons are
+        re-evaluated"""
+        if not self.modified and not force and not debug:
+            return self.cost
+
+        delta = self.dirty_users and not force and not debug
+
+        genome_key = None
+        if not delta and not force and not debug and self.fitness_cache is not None:
+            # an identical timetable may have been evaluated already
+            genome_key = self.get_genome_key()
+            cached = self.fitness_cache.get(genome_key)
+            if cached is not None:
+                self.set_cost(*cached)
+                return max(self.cost, 0)
+
+        if delta:
+            for day, user_ids in self.dirty_users.items():
+                self.evaluate_day(day, user_ids)
+        else:
+            for day in range(self.days):
+                self.evaluate_day(day)
+        self.dirty_users = {}
+
+        # constraint 7: gaps
+        # NOTE: get_gaps does not currently filter by user, so every user contributes the same amount
+        gap_cost_per_user = 0
+        for gap in self.get_gaps(user_id=None):
+            gap_cost_per_user += self.get_gap_cost(gap)
+
+        total_cost = 0
+        for day in range(self.days):
+            day_cost = self.day_costs[day]
+            day_cost['gaps cost'] = gap_cost_per_user * len(self.occupancies[day].masks)
+            total_cost += day_cost['clashes cost'] + day_cost['even allocation cost'] \
+                + day_cost['lessons scheduled cost'] + day_cost['variety cost'] + day_cost['daily workload cost'] \
+                + day_cost['gaps cost'] + day_cost['early finish cost']
+
+        if delta and self.verify_delta:
+            # check the delta evaluation against evaluating everything from scratch
+            full_cost = self.get_cost(force=True)
+            if not math.isclose(total_cost, full_cost, rel_tol=1e-9, abs_tol=1e-9):
+                raise AssertionError(f"Delta evaluation gave a cost of {total_cost} instead of {full_cost}")
 
         self.cost = total_cost
         self.modified = False
+        if delta and self.fitness_cache is not None:
+            genome_key = self.get_genome_key()  # so that a duplicate evaluated in full later doesn't need to be
+        if genome_key is not None:
+            self.fitness_cache.put(genome_key, total_cost, self.day_costs)
 
         if debug:
-            return debug_info
+            return dict(self.day_costs.get(self.days - 1, {}))
         else:
             return max(total_cost, 0)
 
+    def set_cost(self, cost, day_costs):
+        """Stores the result of an evaluation carried out elsewhere, e.g. by the fitness cache or a worker process"""
+        self.cost = cost
+        self.day_costs = {day: dict(parts) for day, parts in day_costs.items()}
+        # the rest of the evaluation is not available, so the next change must be evaluated in full
+        self.occupancies = {}
+        self.user_costs = {}
+        self.dirty_users = {}
+        self.modified = False
+
     def get_fitness(self):
         """Returns the fitness value for a solution
         This is simply the negative of the cost value"""
@@ -637,49 +1061,124 @@ class Timetable:
 
         for day in range(self.days):
             for x in range(mutate_lessons_per_day):
-                n = random.randint(1, 3)
-                if n == 1:
-                    # mutate start time of random lesson
-                    if self.lessons[day]:
-                        i = random.randint(0, len(self.lessons[day]) - 1)
-                        lesson = self.lessons[day][i]
-                        latest_time = self.time_per_day - lesson.relative_duration
-                        lesson.relative_start = random.randint(0, latest_time)
-                elif n == 2:
-                    # delete a random lesson
-                    if self.lessons[day]:
-                        lesson = self.lessons[day].pop(random.randint(0, len(self.lessons[day]) - 1))
-                        # add to random position in unscheduled lessons
-                        self.unscheduled_lessons.insert(random.randint(0, len(self.unscheduled_lessons)), lesson)
-                elif n == 3:
-                    # add a random lesson
-                    if self.unscheduled_lessons:
-                        lesson = self.unscheduled_lessons.pop(random.randint(0, len(self.unscheduled_lessons) - 1))
-                        latest_time = self.time_per_day - lesson.relative_duration
-                        lesson.relative_start = random.randint(0, latest_time)
-                        self.lessons[day].append(lesson)
+                move = self.propose_move(day)
+                if move is not None:
+                    self.move_lesson(*move)
 
+        return self
+
+    def propose_move(self, day: int, kind: Optional[int] = None) -> Optional[Tuple[int, int, int]]:
+        """Chooses a random change to the lessons on the given day, without making it:
+        (catalogue index, new day, new relative start), to be passed to move_lesson
+        The kind of change is 1 (new start time), 2 (remove) or 3 (add), as in mutation.py, or chosen at random if None
+        Returns None if the chosen kind of change isn't possible (e.g. removing a lesson when there are none)"""
+        n = random.randint(1, 3) if kind is None else kind
+        if n == 1:
+            # mutate start time of random lesson
+            scheduled = self.genome.scheduled(day)
+            if scheduled:
+                index = random.choice(scheduled)
+                latest_time = self.time_per_day - self.catalogue[index].relative_duration
+                return index, day, random.randint(0, latest_time)
+        elif n == 2:
+            # delete a random lesson
+            scheduled = self.genome.scheduled(day)
+            if scheduled:
+                return random.choice(scheduled), UNSCHEDULED, UNSCHEDULED
+        elif n == 3:
+            # add a random lesson
+            unscheduled = self.genome.unscheduled()
+            if unscheduled:
+                index = random.choice(unscheduled)
+                latest_time = self.time_per_day - self.catalogue[index].relative_duration
+                return index, day, random.randint(0, latest_time)
+        return None
+
+    def move_lesson(self, index: int, day: int, relative_start: int = UNSCHEDULED):
+        """Schedules the lesson at the given position in the catalogue on the given day and start time, or unschedules
+        it if day is UNSCHEDULED. Only the users in that lesson need re-evaluating by get_cost
+        Anything that changes self.genome without calling this must set self.modified = True instead, which causes
+        the whole timetable to be re-evaluated"""
+        genome = self.get_writable_genome()
+        old_day = genome.days[index]
+        genome.place(index, day, relative_start)
+
+        # the stored evaluation can only be updated if it was correct before this change
+        if self.occupancies and (not self.modified or self.dirty_users):
+            self.track_change(index, old_day, day, relative_start)
         self.modified = True
 
-        return self
+    def track_change(self, index: int, old_day: int, day: int, relative_start: int):
+        """Updates the stored evaluation for a lesson that has moved from old_day to the given day and start time
+        (either of which can be UNSCHEDULED), marking its users as needing re-evaluation on both days
+        Days that are already going to be evaluated in full (see inherit_evaluation) are left alone"""
+        participants = self.catalogue.participants
+        user_ids = participants.get_users(index)
+        if old_day != UNSCHEDULED and self.dirty_users.get(old_day, ()) is not None:
+            self.occupancies[old_day].remove_lesson(index, user_ids)
+            self.dirty_users.setdefault(old_day, set()).update(user_ids)
+        if day != UNSCHEDULED and self.dirty_users.get(day, ()) is not None:
+            self.occupancies[day].add_lesson(index, user_ids, participants.get_user_types(index), relative_start,
+                                             self.catalogue[index].relative_duration)
+            self.dirty_users.setdefault(day, set()).update(user_ids)
+
+    def inherit_evaluation(self, *parents: 'Timetable') -> bool:
+        """Starts from the stored evaluation of whichever parent has the fewest lessons placed differently to this
+        timetable, updating it for each of those lessons, so that get_cost only needs to re-evaluate their users (e.g.
+        for the offspring of a crossover). Days where more than half the lessons have changed are evaluated in full
+        instead, as that is quicker. Parents evaluated elsewhere (e.g. by a worker process or the fitness cache) have
+        no stored evaluation, so can't be used
+        Returns False if none of the parents could be used, in which case the whole timetable is evaluated as usual"""
+        days, starts = self.genome.days, self.genome.starts
+        best_parent, best_changed = None, None
+        for parent in parents:
+            if parent.modified or len(parent.occupancies) != self.days or parent.catalogue is not self.catalogue:
+                continue
+            if parent.genome == self.genome:
+                changed = []
+            else:
+                moved = map(operator.or_, map(operator.ne, days, parent.genome.days),
+                            map(operator.ne, starts, parent.genome.starts))
+                changed = list(itertools.compress(range(len(days)), moved))
+            if best_parent is None or len(changed) < len(best_changed):
+                best_parent, best_changed = parent, changed
+        if best_parent is None:
+            return False
+
+        parent_days = best_parent.genome.days
+        changes = Counter()  # {day: lessons added to or removed from it}
+        for index in best_changed:
+            changes[parent_days[index]] += 1
+            changes[days[index]] += 1
+        full_days = {day for day in range(self.days) if changes[day] * 2 > days.count(day)}
+        if len(full_days) == self.days:
+            return False
+
+        self.occupancies = {day: occupancy.copy() for day, occupancy in best_parent.occupancies.items()
+                            if day not in full_days}
+        self.user_costs = {day: dict(user_costs) for day, user_costs in best_parent.user_costs.items()
+                           if day not in full_days}
+        self.day_costs = {day: dict(parts) for day, parts in best_parent.day_costs.items()}
+        self.static_costs = best_parent.static_costs
+        self.cost = best_parent.cost
+        self.dirty_users = dict.fromkeys(full_days)  # None, so the whole day is re-evaluated
+        for index in best_changed:
+            self.track_change(index, parent_days[index], days[index], starts[index])
+        self.modified = bool(best_changed)
+        return True
 
-    def add(self):
-        """Update the database to include the start times for all lessons currently stored within this object"""
-        for day in self.lessons:
-            for lesson in self.lessons[day]:
-                new_lesson = Lesson()
-                new_lesson.group_id = lesson.group_id
-                new_lesson.duration = lesson.duration  # relative_duration not required because duration is never modified
-                new_lesson.topic = lesson.topic
-                new_lesson.fixed = True
-                start_time = self.first_day + datetime.timedelta(days=day) + self.day_start + datetime.timedelta(seconds=lesson.relative_start * self.seconds_per_unit_time)
-                new_lesson.start = start_time
-                new_lesson.save()
+    def add(self, placeholders=False) -> List[dict]:
+        """Update the database to include the start times for all lessons currently stored within this object
+        Each day is saved in one transaction, and lessons that are already stored are not added again (see
+        writeback.py). If placeholders is True, an unscheduled lesson is also added for each group with a lesson added
+        Returns a report of what was saved on each day, including the number of statements and seconds taken"""
+        return writeback.write_timetable(self, placeholders=placeholders)
 
 
 class PotentiallyScheduledLesson:
     """A Lesson used as part of a Timetable
-    Notably, this abstracts the start time to make computation easier"""
+    This only holds what is needed to schedule the lesson. When it is scheduled is stored in each Timetable's genome,
+    so the same object is shared by every timetable in a population"""
 
     DESIRED_FIELDS = [
         'id',
@@ -688,24 +1187,20 @@ class PotentiallyScheduledLesson:
         'topic'
     ]
 
+    __slots__ = DESIRED_FIELDS + ['relative_duration', 'users', 'teacher']
+
     def __init__(self, lesson, seconds_per_time_unit: float = 300):
         for field in self.DESIRED_FIELDS:
-            self.__dict__[field] = lesson.__dict__[field]
-        self.relative_start = None  # contains start time in time units relative to start of day
+            setattr(self, field, getattr(lesson, field))
         self.relative_duration = math.floor(lesson.duration.total_seconds() / seconds_per_time_unit)
         self.users = None
-
-    def __gt__(self, other):
-        return self.relative_start > other
-
-    def __lt__(self, other):
-        return self.relative_start < other
+        self.teacher = None
 
     def __str__(self):
-        if hasattr(self, 'teacher'):
-            return f"<Lesson teacher='{self.teacher.username}' start={self.relative_start}>"
+        if self.teacher is not None:
+            return f"<Lesson teacher='{self.teacher.username}' duration={self.relative_duration}>"
         else:
-            return f"<Lesson start={self.relative_start}>"
+            return f"<Lesson duration={self.relative_duration}>"
 
     def copy(self):
         return copy.copy(self)
@@ -715,7 +1210,7 @@ class PotentiallyScheduledLesson:
 
     def get_users(self):
         """Retrieves all users in this lesson, caching the result for subsequent queries"""
-        if not self.users:
+        if self.users is None:
             self.users = User.objects.filter(link__group_id__lesson__id__exact=self.id)
         return self.users
 
@@ -15,4 +15,8 @@ urlpatterns = [
     path('teacher/timetable', views.timetable, name='timetable-teacher'),
     path('teacher/scheduled', views.teacher_scheduled, name='timetable-teacher-scheduled'),
     path('teacher/schedule', views.teacher_scheduler, name='timetable-teacher-schedule'),
+
+    path('api/schedule/', views.start_schedule_job, name='timetable-start-schedule-job'),
+    path('api/schedule/<str:job_id>/', views.schedule_job, name='timetable-schedule-job'),
+    path('api/schedule/<str:job_id>/cancel/', views.cancel_schedule_job, name='timetable-cancel-schedule-job'),
 ]
@@ -1,15 +1,24 @@
 import datetime
+import functools
+import logging
 import math
 
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
+from django.urls import reverse
+from django.views.decorators.http import require_GET, require_POST
 
-from .forms import ScheduleForm
-from .models import Lesson, Subject, User, Group
+from . import incremental, jobs, reads
+from .forms import ScheduleForm, ScheduleJobForm
+from .models import Lesson
 
 MIN_UNSCHEDULED_LESSONS = 3
 
+logger = logging.getLogger(__name__)
+
 def login_redirect(request):
     # redirect appropriately depending on user type
     user = request.user
@@ -63,25 +72,19 @@ def timetable(request):
 
     lessons = []
 
-    for lesson in Lesson.objects.filter(group_id__link__user_id__username__exact=user.username, start__gte=after, start__lte=before).order_by('start'):
+    for entry in reads.get_lessons(user, after, before):  # the same number of queries however many lessons there are
         lesson_data = []
         if user.user_type == 'student':
-            lesson_data.append(Subject.objects.filter(link__group_id__lesson__id__exact=lesson.id)[:1].get().name)
-            teacher = User.objects.filter(link__group_id__lesson__id__exact=lesson.id, user_type='teacher')[:1].get()
-            if teacher.title:
-                lesson_data.append(teacher.title.title() + ' ' + teacher.last_name.title())
-            else:
-                lesson_data.append(teacher.first_name.title() + ' ' + teacher.last_name.title())
+            lesson_data.append(entry.subject_name)
+            lesson_data.append(entry.teacher_name)
         else:
-            lesson_data.append(Group.objects.filter(lesson__id__exact=lesson.id)[:1].get().name)
-            topic = lesson.topic
+            lesson_data.append(entry.group_name)
+            topic = entry.topic
             if len(topic) > 44:
                 topic = topic[:42]+'...'
             lesson_data.append(topic)
         lesson_data.append('Room')  # Room allocation will be completed later
-        start = lesson.start
-        end = lesson.start + lesson.duration
-        lesson_data.append(start.strftime('%H:%M') + ' - ' + end.strftime('%H:%M'))
+        lesson_data.append(entry.start.strftime('%H:%M') + ' - ' + entry.end.strftime('%H:%M'))
         lessons.append(lesson_data)
 
     return render(request, 'timetable/timetable.html', context={'lessons': lessons, 'weekday_format': weekday_format, 'weekdays_links': weekdays_links})
@@ -97,8 +100,15 @@ def teacher_scheduler(request):
     if request.method == 'POST':
         form = ScheduleForm(request.POST, request=request)
         if form.is_valid():
-            Lesson.objects.create(duration=form.cleaned_data['duration'], topic=form.cleaned_data['topic'],
-                                  group=form.cleaned_data['group'])
+            lesson = Lesson.objects.create(duration=form.cleaned_data['duration'], topic=form.cleaned_data['topic'],
+                                           group=form.cleaned_data['group'])
+            try:
+                # fitted into the days already scheduled by a worker, rather than waiting for the nightly solve
+                incremental.reschedule_lesson.apply_async((lesson.id,), retry=False)
+            except Exception:  # e.g. the broker is down, in which case the nightly solve will schedule it
+                logger.exception("Unable to queue rescheduling of lesson %s", lesson.id)
+                messages.warning(request, "Your lesson has been saved, but it could not be placed in the timetable "
+                                          "yet. It will be scheduled overnight instead.")
             return redirect('/teacher/scheduled')
 
     else:
@@ -129,3 +139,47 @@ def teacher_scheduled(request):
         lessons.append({'topic': topic, 'duration': str(hours)+'h '+str(minutes)+'m', 'fixed': lesson.fixed})
 
     return render(request, 'timetable/scheduling/scheduled_list.html', {'lessons': lessons, 'enough': unscheduled >= MIN_UNSCHEDULED_LESSONS})
+
+
+def staff_required(view):
+    """Like login_required, but for the JSON API: anyone who isn't logged in as staff gets a 403 response"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated or not request.user.is_staff:
+            return JsonResponse({'error': "Only staff can do this"}, status=403)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+@require_POST
+@staff_required
+def start_schedule_job(request):
+    """Queues a job to schedule the given date range, returning its id straight away (see jobs.py)
+    The scheduling itself is done by a Celery worker, never in the request"""
+    form = ScheduleJobForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    try:
+        job_id = jobs.start_job(form.cleaned_data['start'], form.cleaned_data['end'], **form.get_options())
+    except Exception as error:  # e.g. the broker is down
+        return JsonResponse({'error': f"Unable to start scheduling ({error})"}, status=503)
+    return JsonResponse({'id': job_id, 'url': reverse('timetable-schedule-job', args=[job_id])}, status=202)
+
+
+@require_GET
+@staff_required
+def schedule_job(request, job_id):
+    """Returns the progress of a scheduling job, e.g. its status, current day, generation, best cost and ETA"""
+    job = jobs.get_job(job_id)
+    if job is None:
+        return JsonResponse({'error': "No such job"}, status=404)
+    return JsonResponse(job)
+
+
+@require_POST
+@staff_required
+def cancel_schedule_job(request, job_id):
+    """Asks a scheduling job to stop. The days it has already scheduled are kept"""
+    if not jobs.cancel_job(job_id):
+        return JsonResponse({'error': "The job is not running"}, status=409)
+    return JsonResponse(jobs.get_job(job_id), status=202)
@@ -0,0 +1,108 @@
+"""Saves a timetable's lessons to the database, one transaction per day
+
+Each day is compared with the lessons already stored for it, so writing the same timetable twice (e.g. after a
+worker is restarted) doesn't add anything, and writing a different one for the same day replaces the lessons the
+first one added. Lessons saved here are marked as timetabled, and only those are compared, so fixed lessons that
+were entered by hand (or placed by incremental.py) are never removed.
+
+Lessons are added with bulk_create, which doesn't send the signals that keep GroupStatistics up to date, so the
+statistics of the groups that changed are rebuilt before the day's transaction is committed (see statistics.py)"""
+
+import datetime
+import random
+import time
+from collections import Counter
+from typing import List
+
+from django.db import connection, transaction
+
+from . import statistics
+from .models import Lesson
+
+PLACEHOLDER_TOPIC = "Automatically generated while timetabling"
+
+
+class StatementCounter:
+    """Counts the statements sent to the database while it is installed with connection.execute_wrapper"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def get_start(timetable, day: int, relative_start: int) -> datetime.datetime:
+    """Returns when a lesson scheduled by the timetable at the given day and relative start time starts"""
+    return timetable.first_day + datetime.timedelta(days=day) + timetable.day_start \
+        + datetime.timedelta(seconds=relative_start * timetable.seconds_per_unit_time)
+
+
+def write_timetable(timetable, placeholders: bool = False) -> List[dict]:
+    """Saves every day of the timetable (see write_day), returning what happened on each day"""
+    return [write_day(timetable, day, placeholders=placeholders) for day in range(timetable.days)]
+
+
+def write_day(timetable, day: int, placeholders: bool = False) -> dict:
+    """Saves the lessons the timetable schedules on the given day in a single transaction, adding the ones that are
+    missing and removing any other lessons saved by the scheduler for the same groups on that day
+    If placeholders is True, an unscheduled lesson is also added for each group with a lesson added, so that the group
+    has another lesson to schedule on a later day
+    Returns {'day', 'created', 'kept', 'removed', 'placeholders', 'statements', 'seconds'}"""
+    started = time.monotonic()
+    counter = StatementCounter()
+    with connection.execute_wrapper(counter), transaction.atomic():
+        scheduled = timetable.get_scheduled_lessons(day)
+        wanted: Counter = Counter()  # {(group id, start, duration, topic): lessons}
+        for relative_start, lesson in scheduled:
+            # relative_duration is not required because duration is never modified
+            wanted[lesson.group_id, get_start(timetable, day, relative_start), lesson.duration, lesson.topic] += 1
+
+        day_start = timetable.first_day + datetime.timedelta(days=day)
+        group_ids = {lesson.group_id for lesson in timetable.catalogue}
+        stale = []
+        for lesson_id, *key in Lesson.objects.filter(
+                fixed=True, timetabled=True, group_id__in=group_ids, start__gte=day_start,
+                start__lt=day_start + datetime.timedelta(days=1)).values_list(
+                'id', 'group_id', 'start', 'duration', 'topic').order_by('id'):
+            key = tuple(key)
+            if wanted[key]:
+                wanted[key] -= 1  # already stored
+            else:
+                stale.append(lesson_id)
+        kept = len(scheduled) - sum(wanted.values())
+
+        new_lessons = [Lesson(group_id=group_id, start=start, duration=duration, topic=topic, fixed=True,
+                              timetabled=True)
+                       for (group_id, start, duration, topic), count in wanted.items() for i in range(count)]
+        if stale:
+            Lesson.objects.filter(id__in=stale).delete()  # sends post_delete, which updates the statistics
+        Lesson.objects.bulk_create(new_lessons)
+
+        new_placeholders = []
+        if placeholders:
+            new_placeholders = [Lesson(group_id=lesson.group_id, fixed=False, topic=PLACEHOLDER_TOPIC,
+                                       duration=datetime.timedelta(seconds=random.randint(6, 24) * 300))
+                                for lesson in new_lessons]
+            Lesson.objects.bulk_create(new_placeholders)  # placeholders have no start, so aren't in the statistics
+
+        if new_lessons:
+            statistics.rebuild({lesson.group_id for lesson in new_lessons})
+
+    return {
+        'day': day_start.date().isoformat(),
+        'created': len(new_lessons),
+        'kept': kept,
+        'removed': len(stale),
+        'placeholders': len(new_placeholders),
+        'statements': counter.count,
+        'seconds': time.monotonic() - started,
+    }
+
+
+def describe(report: dict) -> str:
+    """Returns a one line summary of the report of a day written by write_day"""
+    return f"{report['day']}: {report['created']} lessons added, {report['kept']} already stored, " \
+           f"{report['removed']} removed, {report['placeholders']} placeholders added " \
+           f"({report['statements']} statements, {report['seconds']:.3f}s)"